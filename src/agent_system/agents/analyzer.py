@@ -1,4 +1,5 @@
 import json
+from functools import partial
 from dotenv import load_dotenv
 import os
 
@@ -6,9 +7,17 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 from langgraph.types import Command
 from langchain.prompts import PromptTemplate
 from langgraph.prebuilt import create_react_agent
+from langgraph.errors import GraphRecursionError
+from langgraph.config import get_stream_writer
 
-from agent_system.utils.tools import analysis_tools
+from agent_system.utils.tools import analysis_tools, to_frame
+from agent_system.utils.sql_tools import CUBE_DIMENSIONS, cube_summary_sql, get_client
+from agent_system.utils.sql_templates import TABLE
+from agent_system.utils.data_context import build_data_context, pack_passages
 from agent_system.state.state import State
+from agent_system.state.datasets import datasets
+from agent_system.utils.tracing import tracer, record_usage
+from agent_system.utils.print import print_detail
 
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -16,8 +25,30 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 class Analyzer():
     llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", api_key=GEMINI_API_KEY)
     agent = create_react_agent(llm, analysis_tools)
+    # upper bound (estimated tokens) on how much of the retrieved data goes into the prompt
+    data_token_budget = 6000
+    # same, for the knowledge base passages
+    kb_token_budget = 1500
+    # "prompt": one LLM call with the (reduced) data in the prompt
+    # "agent": the react agent calls the analysis tools on a server-side dataset handle
+    analysis_mode = os.getenv("ANALYSIS_MODE", "prompt")
+    # maximum model -> tools round trips in "agent" mode before falling back to "prompt"
+    max_agent_steps = 6
+    # how much of the data the agent sees directly, so it knows what the dataset holds
+    agent_preview_token_budget = 800
     
-    def summarize(self, query, df_json, score, doc):
+    @classmethod
+    def set_llm(cls, llm):
+        """Swap the LLM (e.g. for a local stand-in) and rebuild the tool-calling agent around it."""
+        cls.llm = llm
+        cls.agent = create_react_agent(llm, analysis_tools)
+    
+    def build_prompt(self, query, df_json, score, doc, summary=None):
+        # the retrieved rows stay columnar until here, where the LLM needs them as text;
+        # large results are reduced to summaries/top rows so the prompt stays within budget
+        if not isinstance(df_json, str):
+            df_json = build_data_context(to_frame(df_json), token_budget=self.data_token_budget, summary=summary)
+        
         template = """
         For each assignment you receive, follow these steps carefully:
 
@@ -39,60 +70,230 @@ class Analyzer():
         
         This is the data you were given as a JSON file: {df_json}
         
-        The most relevant document found had a score of {score}: {doc}
+        The most relevant knowledge base guidance found (best score {score}): {doc}
         """
         
         prompt = PromptTemplate(input_variables=["query", "score", "doc", "df_json"], template=template)
-        prompt_text = prompt.format(query=query, df_json=df_json, score=score, doc=doc)
-        analysis = self.llm.invoke(prompt_text).content
+        return prompt.format(query=query, df_json=df_json, score=score, doc=doc)
+    
+    @staticmethod
+    def _text(content) -> str:
+        """Text of a message (or message chunk) content, which may be a list of parts."""
+        if isinstance(content, list):
+            return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+        return content
+    
+    @staticmethod
+    def _stream_writer():
+        """
+        Writer for the graph's "custom" stream; a no-op when not running
+        inside the graph (or when nobody streams that mode).
+        """
+        try:
+            return get_stream_writer()
+        except RuntimeError:
+            return lambda _: None
+    
+    def summarize(self, query, df_json, score, doc, summary=None):
+        prompt_text = self.build_prompt(query, df_json, score, doc, summary)
         
-        return analysis
+        # stream the answer so callers streaming the graph see it as it's generated
+        write = self._stream_writer()
+        parts = []
+        with tracer.span("llm.analysis") as span:
+            for chunk in self.llm.stream(prompt_text):
+                record_usage(span, chunk)
+                text = self._text(chunk.content)
+                if text:
+                    write({"token": text})
+                    parts.append(text)
         
-    def process(self, state):
+        return "".join(parts)
+    
+    async def asummarize(self, query, df_json, score, doc, summary=None):
+        prompt_text = self.build_prompt(query, df_json, score, doc, summary)
+        
+        write = self._stream_writer()
+        parts = []
+        with tracer.span("llm.analysis") as span:
+            async for chunk in self.llm.astream(prompt_text):
+                record_usage(span, chunk)
+                text = self._text(chunk.content)
+                if text:
+                    write({"token": text})
+                    parts.append(text)
+        
+        return "".join(parts)
+    
+    def build_agent_prompt(self, query, handle, df, score, doc, summary=None):
+        template = """
+        Answer the assignment below by calling the available tools on the retrieved data.
+
+        - The retrieved data is stored server-side as the dataset "{handle}" ({rows} rows).
+          Pass "{handle}" as the `data` argument of every tool; never copy rows into a tool call.
+        - Tool calls that don't depend on each other's results can be made in the same step;
+          they run in parallel.
+        - Once you have what you need, write the final analysis: key insights, commentary and
+          data-driven recommendations. Be concise, and use simple tables or bullet points when helpful.
+
+        Assignment: {query}
+
+        Preview of the dataset: {preview}
+
+        The most relevant knowledge base guidance found (best score {score}): {doc}
+        """
+        
+        prompt = PromptTemplate(input_variables=["query", "handle", "rows", "preview", "score", "doc"], template=template)
+        preview = build_data_context(df, token_budget=self.agent_preview_token_budget, summary=summary)
+        return prompt.format(query=query, handle=handle, rows=len(df), preview=preview, score=score, doc=doc)
+    
+    def _agent_config(self):
+        # each step is a model call plus a tool round; one more for the final answer
+        return {"recursion_limit": 2 * self.max_agent_steps + 1}
+    
+    def _final_answer(self, result, span) -> str:
+        messages = result["messages"]
+        for message in messages:
+            record_usage(span, message)
+        span.set(tool_calls=sum(len(getattr(message, "tool_calls", None) or []) for message in messages))
+        answer = self._text(messages[-1].content)
+        # the agent's answer only exists once it is done; stream it as one piece
+        self._stream_writer()({"token": answer})
+        return answer
+    
+    def run_agent(self, query, df, score, doc, summary=None):
+        """
+        Analyze with the tool-calling agent. The rows are registered as a
+        dataset and only the handle goes to the model; the tools resolve it
+        server-side. Independent tool calls from one model step are executed
+        in parallel by the agent's tool node. Falls back to summarize() if the
+        agent runs out of steps.
+        """
+        handle = datasets.register(df)
+        try:
+            prompt_text = self.build_agent_prompt(query, handle, df, score, doc, summary)
+            try:
+                # datasets the tools derive during the run are released with `handle`
+                with tracer.span("llm.agent") as span, datasets.scope(handle):
+                    result = self.agent.invoke({"messages": [("user", prompt_text)]}, config=self._agent_config())
+                    return self._final_answer(result, span)
+            except GraphRecursionError:
+                return self.summarize(query, df, score, doc, summary)
+        finally:
+            datasets.release(handle)
+    
+    async def arun_agent(self, query, df, score, doc, summary=None):
+        """Async version of run_agent."""
+        handle = datasets.register(df)
+        try:
+            prompt_text = self.build_agent_prompt(query, handle, df, score, doc, summary)
+            try:
+                with tracer.span("llm.agent") as span, datasets.scope(handle):
+                    result = await self.agent.ainvoke({"messages": [("user", prompt_text)]}, config=self._agent_config())
+                    return self._final_answer(result, span)
+            except GraphRecursionError:
+                return await self.asummarize(query, df, score, doc, summary)
+        finally:
+            datasets.release(handle)
+    
+    def analyze(self, query, df, score, doc, summary=None):
+        """Produce the analysis using the configured analysis_mode."""
+        if self.analysis_mode == "agent":
+            return self.run_agent(query, df, score, doc, summary)
+        return self.summarize(query, df, score, doc, summary)
+    
+    async def aanalyze(self, query, df, score, doc, summary=None):
+        """Async version of analyze."""
+        if self.analysis_mode == "agent":
+            return await self.arun_agent(query, df, score, doc, summary)
+        return await self.asummarize(query, df, score, doc, summary)
+        
+    def _prepare(self, state):
+        """Pull the analyzer's inputs out of the state."""
+        from agent_system.utils.print import print_agent_step
+        
+        data = state.get("extracted_df")
+        query = state.get("query", "")
+        best_score = state.get("best_score", "")
+        doc = state.get("doc", "")
+        passages = state.get("passages")
+
+        print_agent_step("ANALYZER", "Extracting data from state")
+        print_agent_step("ANALYZER", f"Processing query: '{query}'")
+        print_agent_step("ANALYZER", f"Using knowledge base document with score: {best_score}")
+
+        if passages:
+            # the highest-scoring passages that fit the budget, instead of one whole document
+            doc = pack_passages(passages, token_budget=self.kb_token_budget)
+            print_agent_step("ANALYZER", f"Packing up to {len(passages)} knowledge base passages into the prompt")
+
+        if isinstance(data, str):
+            data = json.loads(data)
+        df = to_frame(data if data is not None else [])
+
+        print_agent_step("ANALYZER", f"Analyzing {len(df)} data records")
+        print_agent_step("ANALYZER", "Generating comprehensive analysis using AI tools")
+        
+        # for template results, group statistics can be read from the DuckDB cube;
+        # build_data_context only calls this when the rows don't fit the prompt as they are
+        filters = state.get("segment_filters")
+        summary = partial(self.segment_stats, filters) if filters else None
+
+        return query, df, best_score, doc, summary
+    
+    @staticmethod
+    def segment_stats(filters):
+        """
+        Per brand area, quarter and tactic statistics of the rows a template
+        with these filters returns, read from the DuckDB cube instead of
+        aggregating the rows. None if the client keeps no cube.
+        """
+        return cube_summary_sql(get_client(), list(CUBE_DIMENSIONS), source=TABLE, **filters)
+
+    def _finish(self, state, analysis):
+        """Package the finished analysis as a state update."""
         from agent_system.utils.print import (
-            print_agent_arrival, 
             print_agent_step, 
             print_state_update, 
-            print_final_state,
-            print_agent_error
+            print_final_state
+        )
+        
+        print_agent_step("ANALYZER", "Analysis completed")
+        print_detail("   Analysis preview: %s%s", analysis[:150], "..." if len(analysis) > 150 else "")
+
+        updates = {"analysis": analysis}
+        print_state_update("ANALYZER", updates)
+        
+        print_final_state("ANALYZER", state, updates)
+
+        return Command(
+            update=updates,
         )
         
+    def process(self, state):
+        from agent_system.utils.print import print_agent_arrival, print_agent_error
+        
+        print_agent_arrival("ANALYZER")
+        
+        try:
+            query, df, best_score, doc, summary = self._prepare(state)
+            analysis = self.analyze(query, df, best_score, doc, summary)
+            return self._finish(state, analysis)
+
+        except Exception as e:
+            print_agent_error("ANALYZER", str(e))
+            return Command(update={"error": str(e)})
+    
+    async def aprocess(self, state):
+        from agent_system.utils.print import print_agent_arrival, print_agent_error
+        
         print_agent_arrival("ANALYZER")
         
         try:
-            df_json = state.get("extracted_df", "[]")
-            query = state.get("query", "")
-            best_score = state.get("best_score", "")
-            doc = state.get("doc", "")
-
-            print_agent_step("ANALYZER", "Extracting data from state")
-            print_agent_step("ANALYZER", f"Processing query: '{query}'")
-            print_agent_step("ANALYZER", f"Using knowledge base document with score: {best_score}")
-
-            if isinstance(df_json, str):
-                data_list = json.loads(df_json)
-            else:
-                data_list = df_json
-
-            print_agent_step("ANALYZER", f"Analyzing {len(data_list)} data records")
-            print_agent_step("ANALYZER", "Generating comprehensive analysis using AI tools")
-
-            analysis = self.summarize(query, data_list, best_score, doc)
-            
-            print_agent_step("ANALYZER", "Analysis completed")
-            print(f"   Analysis preview: {analysis[:150]}{'...' if len(analysis) > 150 else ''}")
-
-            updates = {"analysis": analysis}
-            print_state_update("ANALYZER", updates)
-            
-            updated_state = dict(state)
-            updated_state.update(updates)
-            print_final_state("ANALYZER", updated_state)
-
-            return Command(
-                update=updates,
-            )
+            query, df, best_score, doc, summary = self._prepare(state)
+            analysis = await self.aanalyze(query, df, best_score, doc, summary)
+            return self._finish(state, analysis)
 
         except Exception as e:
             print_agent_error("ANALYZER", str(e))
-            return Command(update={"error": str(e)})
\ No newline at end of file
+            return Command(update={"error": str(e)})
@@ -1,16 +1,47 @@
+import asyncio
 from langgraph.types import Command
 from dotenv import load_dotenv
 import os
 
-from agent_system.clients.naive_kb import KBClient
+from agent_system.clients.retrieval import create_backend
 from agent_system.state.state import State
+from agent_system.utils.print import print_detail
 
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 class kbRetriever():
     # kbRetriever is the only model that needs access to the data, so keep it this way for safety
-    kb_client = KBClient()
+    # "tfidf" (lexical), "dense" (LSA embeddings) or "hybrid"; see clients/retrieval.py
+    # documents are indexed as passages of KB_CHUNK_SENTENCES sentences (0 indexes whole documents)
+    kb_client = create_backend(
+        os.getenv("KB_BACKEND", "tfidf"),
+        chunk_sentences=int(os.getenv("KB_CHUNK_SENTENCES", "3")) or None
+    )
+    # passages handed to the analyzer, at most one per document
+    max_passages = 5
+    
+    def _updates(self, passages):
+        """State update for a query's retrieved passages."""
+        # with no match at all, fall back to the first document like find_nearest
+        best_score, doc = passages[0] if passages else (0.0, self.kb_client.docs[0])
+        return {
+            "best_score": best_score,
+            "doc": doc,
+            "passages": [{**passage, "score": score} for score, passage in passages]
+        }
+    
+    def prefetch(self, queries):
+        """
+        Resolve the knowledge base lookups of many queries in one batched
+        search. The batch runner merges each result into that query's initial
+        state; process() then finds "passages" already set and skips its own
+        lookup.
+
+        Returns:
+            One state update per query, in the order given.
+        """
+        return [self._updates(passages) for passages in self.kb_client.search_passages_batch(queries, k=self.max_passages)]
     
     def process(self, state):
         """
@@ -28,24 +59,23 @@ class kbRetriever():
         
         try:
             query = state.get("query", "")
+            
+            if state.get("passages") is not None:
+                print_agent_step("KB RETRIEVER", f"Using prefetched knowledge base results for: '{query}'")
+                return Command(goto="analyzer")
+            
             print_agent_step("KB RETRIEVER", f"Searching knowledge base for: '{query}'")
             
             print_agent_step("KB RETRIEVER", "Computing semantic similarity scores")
-            best_score, doc = self.kb_client.find_nearest(query)
+            updates = self._updates(self.kb_client.search_passages(query, k=self.max_passages))
+            doc = updates["doc"]
             
-            print_agent_step("KB RETRIEVER", f"Found best match with score: {best_score:.4f}")
-            text_preview = doc["text"][:100]
-            print(f"   Document preview: {text_preview}{'...' if len(doc['text']) > 100 else ''}")
-
-            updates = {
-                "best_score": best_score,
-                "doc": doc
-            }
+            print_agent_step("KB RETRIEVER", f"Found {len(updates['passages'])} passages, best match with score: {updates['best_score']:.4f}")
+            print_detail("   Document preview: %s%s", doc["text"][:100], "..." if len(doc["text"]) > 100 else "")
+
             print_state_update("KB RETRIEVER", updates)
             
-            updated_state = dict(state)
-            updated_state.update(updates)
-            print_final_state("KB RETRIEVER", updated_state)
+            print_final_state("KB RETRIEVER", state, updates)
 
             return Command(
                 update=updates,
@@ -58,3 +88,10 @@ class kbRetriever():
                 update={"error": str(e)},
                 goto=[]
             )
+
+    async def aprocess(self, state):
+        """
+        Async retriever: the similarity search is CPU-bound, so run it in a
+        worker thread instead of blocking the event loop.
+        """
+        return await asyncio.to_thread(self.process, state)
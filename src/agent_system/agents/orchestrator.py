@@ -23,9 +23,7 @@ class Orchestrator:
             updates = {"task_type": task_type}
             print_state_update("ORCHESTRATOR", updates)
             
-            updated_state = dict(state)
-            updated_state.update(updates)
-            print_final_state("ORCHESTRATOR", updated_state)
+            print_final_state("ORCHESTRATOR", state, updates)
             
             return Command(
                 update=updates,
@@ -38,4 +36,9 @@ class Orchestrator:
                 update={"error": str(e)},
                 goto=[]
             )
-        
\ No newline at end of file
+
+    async def aprocess(self, state):
+        """
+        Async orchestrator: routing does no I/O, so this just runs process.
+        """
+        return self.process(state)
@@ -1,4 +1,5 @@
 import re
+import asyncio
 from dotenv import load_dotenv
 import os
 
@@ -8,7 +9,11 @@ from langchain.prompts import PromptTemplate
 from langchain.output_parsers import RegexParser
 
 from agent_system.clients.duckdb_client import DuckDBClient
+from agent_system.clients.sql_cache import SQLCache
 from agent_system.state.state import State
+from agent_system.utils.sql_templates import FILTER_COLUMNS, TABLE, match_template
+from agent_system.utils.tracing import tracer, record_usage
+from agent_system.utils.print import print_detail, lazy
 
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -16,13 +21,20 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 class sqlRetriever():
     # sqlRetriever is the only model that needs access to the data, so keep it this way for safety
     duckdb_client = DuckDBClient(db_path=":memory:")
+    llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", api_key=GEMINI_API_KEY)
+    # translations persist across runs; keyed on the question + table schema/data version.
+    # SQL_CACHE_NEAR_DUP (e.g. 0.9) also serves the SQL of a cached question at least that
+    # similar (TF-IDF cosine) that names the same filter values and numbers
+    sql_cache = SQLCache(near_duplicate_threshold=float(os.getenv("SQL_CACHE_NEAR_DUP") or 0) or None)
+    # latency mode (opt-in, SQL_TEMPLATES=1): answer with a matching SQL template when it is
+    # confident, and only ask the LLM otherwise (the async path asks it concurrently; see
+    # utils/sql_templates.py)
+    use_templates = os.getenv("SQL_TEMPLATES", "0") == "1"
 
-    def nl_to_sql(self, nl_query: str) -> str:
+    def build_prompt(self, nl_query: str) -> str:
         """
-        Convert NL query to SQL using LangChain LLM.
+        Build the NL-to-SQL prompt for a query.
         """
-        llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", api_key=GEMINI_API_KEY)
-        
         template = """
         You are an expert SQL generator. For the following assignment, you need to determine what information you
         need to retrieve and write a SQL query that can extract that information.
@@ -49,73 +61,240 @@ class sqlRetriever():
         prompt = PromptTemplate(input_variables=["nl_query"], template=template)
 
         # 2. Format it to a string with actual query
-        prompt_text = prompt.format(nl_query=nl_query)
+        return prompt.format(nl_query=nl_query)
 
-        # 3a. For plain LLM invoke
-        sql_query = llm.invoke(prompt_text).content
-        
-        # cleaning
+    def clean_sql(self, sql_query: str) -> str:
+        """
+        Strip markdown fences and wrapping quotes from raw LLM output.
+        """
         sql_query = sql_query.strip()
         sql_query = re.sub(r"^```(sql)?\s*|\s*```$", "", sql_query, flags=re.IGNORECASE)
         if (sql_query.startswith('"') and sql_query.endswith('"')) or (sql_query.startswith("'") and sql_query.endswith("'")):
             sql_query = sql_query[1:-1]
-        
-        print(f"SQL_QUERY: {sql_query}")
         return sql_query
 
+    def cached_sql(self, nl_query: str):
+        """
+        Return a previously generated SQL query for this question, or None.
+        """
+        fingerprint = self.duckdb_client.schema_fingerprint()
+        terms = self.filter_terms() if self.sql_cache.near_duplicate_threshold is not None else None
+        sql_query = self.sql_cache.get(nl_query, fingerprint, vocabulary=terms)
+        if sql_query is not None:
+            print_detail("SQL_QUERY (cached): %s", sql_query)
+        return sql_query
+
+    def remember_sql(self, nl_query: str, sql_query: str):
+        """
+        Cache a generated SQL query once it has executed successfully.
+        """
+        self.sql_cache.put(nl_query, self.duckdb_client.schema_fingerprint(), sql_query)
+
+    def nl_to_sql(self, nl_query: str, check_cache: bool = True) -> str:
+        """
+        Convert NL query to SQL using LangChain LLM.
+        check_cache=False skips the translation cache (the caller looked already).
+        """
+        with tracer.span("llm.nl_to_sql") as span:
+            sql_query = self.cached_sql(nl_query) if check_cache else None
+            span.set(cache_hit=sql_query is not None)
+            if sql_query is not None:
+                return sql_query
+
+            prompt_text = self.build_prompt(nl_query)
+
+            # 3a. For plain LLM invoke
+            response = self.llm.invoke(prompt_text)
+            record_usage(span, response)
+            sql_query = self.clean_sql(response.content)
+
+        print_detail("SQL_QUERY: %s", sql_query)
+        return sql_query
+
+    async def anl_to_sql(self, nl_query: str, check_cache: bool = True) -> str:
+        """
+        Async version of nl_to_sql; awaits the LLM instead of blocking on it.
+        """
+        with tracer.span("llm.nl_to_sql") as span:
+            sql_query = self.cached_sql(nl_query) if check_cache else None
+            span.set(cache_hit=sql_query is not None)
+            if sql_query is not None:
+                return sql_query
+
+            prompt_text = self.build_prompt(nl_query)
+
+            response = await self.llm.ainvoke(prompt_text)
+            record_usage(span, response)
+            sql_query = self.clean_sql(response.content)
+
+        print_detail("SQL_QUERY: %s", sql_query)
+        return sql_query
+
+    def filter_vocabulary(self):
+        """Known values of the template filter columns (served from the result cache after the first call)."""
+        return {
+            column: self.duckdb_client.query(f"SELECT DISTINCT {column} FROM {TABLE} ORDER BY 1")[column].tolist()
+            for column in FILTER_COLUMNS
+        }
+
+    def filter_terms(self):
+        """Brand areas and tactics; a near-duplicate cached question must name the same ones."""
+        vocabulary = self.filter_vocabulary()
+        return vocabulary["brand_area"] + vocabulary["tactic"]
+
+    def match_template(self, nl_query: str):
+        """
+        The SQL template for this question, or None when templates are off or
+        it matches no template. Callers check the translation cache first.
+        """
+        if not self.use_templates:
+            return None
+        return match_template(nl_query, self.filter_vocabulary())
+
+    def template_result(self, template):
+        """Run a template; returns its rows if they can answer the question, otherwise None."""
+        if template is None:
+            return None
+        df = self.duckdb_client.query(template["sql"])
+        if template["confident"] and len(df) > 0:
+            print_detail("SQL_QUERY (template): %s", template["sql"])
+            return df
+        return None
+
     def tweak_query_on_error(self, query: str, error: Exception) -> str:
         return "SELECT * FROM sample_data LIMIT 10"
 
+    def _finish(self, state, sql_query, df, filters=None):
+        """
+        Validate the executed SQL and package the retrieved rows (and, for
+        template results, the template's filters) as a state update.
+        Shared by process and aprocess.
+        """
+        from agent_system.utils.print import (
+            print_agent_step,
+            print_state_update,
+            print_final_state
+        )
+
+        print_agent_step("SQL RETRIEVER", "Parsing and validating SQL query")
+        parser = RegexParser(
+            regex=r"(?i)(SELECT|INSERT|UPDATE|DELETE).*",  # matches SQL statement
+            output_keys=["sql_query"]
+        )
+
+        parsed = parser.parse(sql_query)
+        sql_query = parsed["sql_query"]
+
+        print_agent_step("SQL RETRIEVER", f"Retrieved {len(df)} rows of data")
+        print_detail("   Data preview: %s", lazy(lambda: df.head(3).to_string() if len(df) > 0 else "No data found"))
+
+        # hand the DataFrame on as-is; it is only serialized at the LLM boundary in Analyzer
+        updates = {
+            "extracted_df": df
+        }
+        if filters is not None:
+            updates["segment_filters"] = filters
+        print_state_update("SQL RETRIEVER", updates)
+
+        print_final_state("SQL RETRIEVER", state, updates)
+
+        return Command(
+            update=updates,
+            goto="analyzer"
+        )
+
     def process(self, state):
         """
         Retriever: Fetches relevant documents based on the search query.
         """
         from agent_system.utils.print import (
-            print_agent_arrival, 
-            print_agent_step, 
-            print_state_update, 
-            print_final_state,
+            print_agent_arrival,
+            print_agent_step,
             print_agent_error
         )
-        
+
         print_agent_arrival("SQL RETRIEVER")
-        
+
         try:
             nl_query = state.get("query", "")
             print_agent_step("SQL RETRIEVER", f"Processing natural language query: '{nl_query}'")
-            
-            print_agent_step("SQL RETRIEVER", "Converting natural language to SQL")
-            sql_query = self.nl_to_sql(nl_query)
-            
+
+            sql_query = self.cached_sql(nl_query)
+            template = self.match_template(nl_query) if sql_query is None else None
+            if template is not None:
+                # a confident template answers without the LLM; a thread running the LLM
+                # call can't be cancelled, so it is only asked when the template can't answer
+                print_agent_step("SQL RETRIEVER", "Running SQL template")
+                df = self.template_result(template)
+                if df is not None:
+                    # not cached: the translation cache only holds SQL the LLM wrote
+                    return self._finish(state, template["sql"], df, template["filters"])
+            if sql_query is None:
+                print_agent_step("SQL RETRIEVER", "Converting natural language to SQL")
+                sql_query = self.nl_to_sql(nl_query, check_cache=False)
+
             print_agent_step("SQL RETRIEVER", "Executing SQL query against database")
             df = self.duckdb_client.query(sql_query)
+            self.remember_sql(nl_query, sql_query)
 
-            print_agent_step("SQL RETRIEVER", "Parsing and validating SQL query")
-            parser = RegexParser(
-                regex=r"(?i)(SELECT|INSERT|UPDATE|DELETE).*",  # matches SQL statement
-                output_keys=["sql_query"]
-            )
-            
-            parsed = parser.parse(sql_query)
-            sql_query = parsed["sql_query"]
-            
-            print_agent_step("SQL RETRIEVER", f"Retrieved {len(df)} rows of data")
-            print(f"   Data preview: {df.head(3).to_string() if len(df) > 0 else 'No data found'}")
-
-            updates = {
-                "extracted_df": df.to_dict(orient="records")
-            }
-            print_state_update("SQL RETRIEVER", updates)
-            
-            updated_state = dict(state)
-            updated_state.update(updates)
-            print_final_state("SQL RETRIEVER", updated_state)
+            return self._finish(state, sql_query, df)
 
+        except Exception as e:
+            print_agent_error("SQL RETRIEVER", str(e))
             return Command(
-                update=updates,
-                goto="analyzer"
+                update={"error": str(e)},
+                goto=[]
             )
 
+    async def aprocess(self, state):
+        """
+        Async retriever: awaits the LLM and runs the DuckDB query in a worker
+        thread so the event loop stays free for other in-flight queries.
+        """
+        from agent_system.utils.print import (
+            print_agent_arrival,
+            print_agent_step,
+            print_agent_error
+        )
+
+        print_agent_arrival("SQL RETRIEVER")
+
+        try:
+            nl_query = state.get("query", "")
+            print_agent_step("SQL RETRIEVER", f"Processing natural language query: '{nl_query}'")
+
+            sql_query = await asyncio.to_thread(self.cached_sql, nl_query)
+            template = None
+            if sql_query is None:
+                template = await asyncio.to_thread(self.match_template, nl_query)
+            if template is not None:
+                # speculative: the LLM writes its SQL concurrently while the template runs;
+                # cancelling the task aborts the request if the template answers
+                print_agent_step("SQL RETRIEVER", "Running SQL template while the LLM writes its query")
+                llm_sql = asyncio.create_task(self.anl_to_sql(nl_query, check_cache=False))
+                try:
+                    df = await asyncio.to_thread(self.template_result, template)
+                    if df is None:
+                        sql_query = await llm_sql
+                finally:
+                    # the template answered or raised; don't leave the LLM request dangling
+                    if not llm_sql.done():
+                        llm_sql.cancel()
+                    elif not llm_sql.cancelled():
+                        llm_sql.exception()  # mark a failure as retrieved
+                if df is not None:
+                    # not cached: the translation cache only holds SQL the LLM wrote
+                    return self._finish(state, template["sql"], df, template["filters"])
+            elif sql_query is None:
+                print_agent_step("SQL RETRIEVER", "Converting natural language to SQL")
+                sql_query = await self.anl_to_sql(nl_query, check_cache=False)
+
+            print_agent_step("SQL RETRIEVER", "Executing SQL query against database")
+            df = await asyncio.to_thread(self.duckdb_client.query, sql_query)
+            self.remember_sql(nl_query, sql_query)
+
+            return self._finish(state, sql_query, df)
+
         except Exception as e:
             print_agent_error("SQL RETRIEVER", str(e))
             return Command(
@@ -0,0 +1,33 @@
+import re
+from typing import Dict, List
+
+# sentence boundary: whitespace after ., ! or ?
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into sentences on terminal punctuation."""
+    return [sentence for sentence in _SENTENCE_END.split(text.strip()) if sentence]
+
+
+def chunk_document(doc: Dict, window: int = 3, overlap: int = 1) -> List[Dict]:
+    """
+    Split a document into passages of `window` consecutive sentences, with
+    consecutive passages sharing `overlap` sentences. Each passage keeps the
+    document's fields (doc_id, title, ...) with its own text and its position
+    in "chunk"; documents of at most `window` sentences give one passage.
+    """
+    sentences = split_sentences(doc.get("text", ""))
+    if len(sentences) <= window:
+        return [{**doc, "chunk": 0}]
+
+    step = max(1, window - overlap)
+    starts = list(range(0, len(sentences) - window + 1, step))
+    if starts[-1] + window < len(sentences):
+        # make sure the last sentences are covered
+        starts.append(len(sentences) - window)
+
+    return [
+        {**doc, "text": " ".join(sentences[start:start + window]), "chunk": i}
+        for i, start in enumerate(starts)
+    ]
@@ -0,0 +1,185 @@
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.decomposition import TruncatedSVD
+
+from agent_system.clients.retrieval import RetrievalBackend, top_k
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """Rows scaled to unit length (all-zero rows stay zero), as float32."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest neighbour index over unit vectors.
+
+    Vectors are clustered with spherical k-means into `n_lists` lists; a
+    query is only compared with the vectors of the `n_probe` lists whose
+    centroids are closest to it, so a search touches roughly
+    n_probe / n_lists of the corpus. With n_probe >= n_lists it is exact.
+    """
+
+    def __init__(self, vectors: np.ndarray, ids: Optional[np.ndarray] = None, n_lists: Optional[int] = None,
+                 n_probe: int = 8, n_iter: int = 10, sample_size: int = 50_000, seed: int = 0):
+        """
+        Args:
+            vectors: (n, dim) unit vectors.
+            ids: Identifier returned for each vector; defaults to its row number.
+            n_lists (int): Number of clusters; defaults to sqrt(n).
+            n_probe (int): Clusters searched per query.
+            n_iter (int): k-means iterations.
+            sample_size (int): k-means is trained on at most this many vectors.
+            seed (int): Seed for sampling and centroid initialization.
+        """
+        n = len(vectors)
+        self.ids = np.arange(n) if ids is None else np.asarray(ids)
+        self.n_probe = n_probe
+        if n == 0:
+            self.centroids = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+            self.offsets = np.zeros(1, dtype=np.int64)
+            self.vectors, self.list_ids = vectors, self.ids
+            return
+
+        n_lists = min(n_lists or max(1, int(np.sqrt(n))), n)
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(n, min(n, sample_size), replace=False)]
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+        for _ in range(n_iter):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            # per-cluster sums as one sparse (clusters x samples) product
+            members = sp.csr_matrix(
+                (np.ones(len(sample), dtype=np.float32), (assignment, np.arange(len(sample)))),
+                shape=(n_lists, len(sample))
+            )
+            sums = np.asarray(members @ sample)
+            # a cluster that lost all its members keeps its old centroid
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = _normalize(sums)
+
+        assignment = np.concatenate([
+            np.argmax(vectors[start:start + 65536] @ centroids.T, axis=1)
+            for start in range(0, n, 65536)
+        ])
+        # store each list's vectors contiguously
+        order = np.argsort(assignment, kind="stable")
+        self.centroids = centroids
+        self.offsets = np.searchsorted(assignment[order], np.arange(n_lists + 1))
+        self.vectors = vectors[order]
+        self.list_ids = self.ids[order]
+
+    def search(self, queries: np.ndarray, k: int, min_score: float = -np.inf,
+               live: Optional[np.ndarray] = None) -> List[List[Tuple[float, int]]]:
+        """
+        Approximate top-k (score, id) pairs per query.
+
+        Args:
+            queries: (m, dim) unit vectors.
+            live: Optional boolean array indexed by id; ids marked False are skipped.
+        """
+        n_lists = len(self.centroids)
+        if n_lists == 0:
+            return [[] for _ in range(len(queries))]
+        n_probe = min(self.n_probe, n_lists)
+        centroid_scores = queries @ self.centroids.T
+
+        results = []
+        for query, scores in zip(queries, centroid_scores):
+            probe = np.argpartition(-scores, n_probe - 1)[:n_probe] if n_probe < n_lists else np.arange(n_lists)
+            rows = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in probe])
+            ids = self.list_ids[rows]
+            if live is not None:
+                keep = live[ids]
+                rows, ids = rows[keep], ids[keep]
+            results.append(top_k(self.vectors[rows] @ query, ids, k, min_score))
+        return results
+
+
+class DenseKB(RetrievalBackend):
+    """
+    Dense retrieval over a KBClient's documents: LSA embeddings (TruncatedSVD
+    of the TF-IDF matrix, fitted locally) searched through an IVF index.
+    LSA maps related terms to nearby directions, so documents can match a
+    query without sharing its exact words.
+
+    The embeddings follow the lexical index: they are refitted when it is
+    reloaded or compacted. Documents added since then are scored (by
+    score()) but only retrieved after the next rebuild; deleted ones are
+    skipped immediately.
+    """
+
+    def __init__(self, lexical, n_components: int = 256, n_lists: Optional[int] = None,
+                 n_probe: int = 8, seed: int = 0):
+        """
+        Args:
+            lexical (KBClient): TF-IDF index whose documents and vectors are embedded.
+            n_components (int): Embedding size (capped by the corpus size).
+            n_lists (int): IVF lists; defaults to sqrt(number of documents).
+            n_probe (int): IVF lists searched per query.
+            seed (int): Seed for the SVD and the IVF clustering.
+        """
+        self.lexical = lexical
+        self.n_components = n_components
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.seed = seed
+        self._lock = threading.Lock()
+        self.build()
+
+    @property
+    def docs(self):
+        return self.lexical.docs
+
+    def build(self):
+        """Fit the embedding on the lexical index's current documents and rebuild the ANN index."""
+        generation = self.lexical.generation
+        doc_vectors = self.lexical.doc_vectors
+        live = self.lexical.live_mask()
+
+        n_docs, n_terms = doc_vectors.shape
+        n_components = max(1, min(self.n_components, n_docs - 1, n_terms - 1))
+        svd = TruncatedSVD(n_components=n_components, random_state=self.seed)
+        embeddings = _normalize(svd.fit_transform(doc_vectors))
+        index = IVFIndex(embeddings[live], ids=np.flatnonzero(live), n_lists=self.n_lists,
+                         n_probe=self.n_probe, seed=self.seed)
+
+        with self._lock:
+            self.svd, self.embeddings, self.index, self._generation = svd, embeddings, index, generation
+
+    def _current(self):
+        # positions in lexical.docs change when it is compacted or reloaded
+        if self._generation != self.lexical.generation:
+            self.build()
+        with self._lock:
+            return self.svd, self.embeddings, self.index
+
+    def embed(self, texts: List[str], svd: Optional[TruncatedSVD] = None) -> np.ndarray:
+        """Unit-length embeddings of the given texts."""
+        svd = svd or self._current()[0]
+        return _normalize(svd.transform(self.lexical.vectorizer.transform(texts)))
+
+    def search_indices_batch(self, queries: List[str], k: int = 5,
+                             min_score: float = 0.0) -> List[List[Tuple[float, int]]]:
+        svd, _, index = self._current()
+        live = self.lexical.live_mask()
+        return index.search(self.embed(queries, svd), k, min_score=min_score, live=live)
+
+    def score(self, query: str, doc_indices: np.ndarray) -> np.ndarray:
+        svd, embeddings, _ = self._current()
+        query_vector = self.embed([query], svd)[0]
+        doc_indices = np.asarray(doc_indices)
+
+        scores = np.zeros(len(doc_indices), dtype=np.float32)
+        embedded = doc_indices < len(embeddings)
+        scores[embedded] = embeddings[doc_indices[embedded]] @ query_vector
+        if not embedded.all():
+            # added since the last build: embed their TF-IDF rows on the fly
+            rows = self.lexical.doc_vectors[doc_indices[~embedded]]
+            scores[~embedded] = _normalize(svd.transform(rows)) @ query_vector
+        return scores
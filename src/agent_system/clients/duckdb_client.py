@@ -1,49 +1,515 @@
+import re
 import sys
+import queue
+import hashlib
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
 import duckdb
 import pandas as pd
 from pathlib import Path
 
+from agent_system.utils.tracing import tracer
+from agent_system.utils.sql_tools import cube_build_sql, cube_merge_sql, cube_supported
+
 DATA_PATH = Path(__file__).parent.parent.parent / "data/campaign_performance.csv"
 
+# explicit column types for campaign_performance.csv, so ingest doesn't depend on type sniffing
+CAMPAIGN_SCHEMA = {
+    "campaign_id": "BIGINT",
+    "brand_area": "VARCHAR",
+    "quarter": "VARCHAR",
+    "tactic": "VARCHAR",
+    "spend": "DOUBLE",
+    "impressions": "BIGINT",
+    "clicks": "BIGINT",
+    "conversions": "BIGINT",
+    "revenue": "DOUBLE",
+}
+
+# "view" re-reads the CSV on every query, "table" ingests it into a native table,
+# "parquet" converts it to a Parquet file once and queries that
+LOAD_MODES = ("view", "table", "parquet")
+
+# statements whose results can be cached
+_READ_ONLY_SQL = re.compile(r"^\s*\(?\s*(SELECT|WITH|FROM)\b", re.IGNORECASE)
+# statements that never change data or catalog; anything else invalidates cached results
+_NON_MUTATING_SQL = re.compile(r"^\s*\(?\s*(SELECT|WITH|FROM|DESCRIBE|SHOW|EXPLAIN|SUMMARIZE)\b", re.IGNORECASE)
+# single-quoted literals (with '' escapes), left untouched when canonicalizing SQL
+_SQL_LITERAL = re.compile(r"('(?:[^']|'')*')")
+
 class DuckDBClient:
     """
     Lightweight SQL interface using DuckDB.
     Automatically loads the campaign_performance.csv dataset at initialization.
     """
 
-    def __init__(self, db_path=":memory:"):
+    def __init__(self, db_path=":memory:", result_cache_bytes: int = 64 * 1024 * 1024,
+                 load_mode: str = "table", csv_path=DATA_PATH, schema=None,
+                 parquet_path=None, auto_refresh: bool = True, pool_size: int = 4,
+                 threads: int = None, memory_limit: str = None, query_timeout: float = None,
+                 pool_timeout: float = 30.0, cube: bool = True):
         """
         Initialize the DuckDB connection and load the campaign performance data.
 
         Args:
             db_path (str): Path to the DuckDB database file.
-                           Use ':memory:' for an in-memory instance.
+                           Use ':memory:' for an in-memory instance. With a file,
+                           an ingested table survives restarts and is only
+                           re-ingested when the CSV changes.
+            result_cache_bytes (int): Memory budget for cached query results.
+                           Use 0 to disable result caching.
+            load_mode (str): One of LOAD_MODES.
+            csv_path (Path): CSV file to load; the table is named after its stem.
+            schema (dict): Column name -> DuckDB type used when ingesting.
+                           Defaults to CAMPAIGN_SCHEMA for the default CSV and
+                           to type sniffing for any other file.
+            parquet_path (Path): Where load_mode="parquet" writes its Parquet
+                           file. Defaults to the CSV path with a .parquet suffix.
+            auto_refresh (bool): Check the CSV before each query and re-ingest
+                           it if it changed (a single stat call when it didn't).
+            pool_size (int): Number of cursors over the shared database, i.e.
+                           how many queries can execute at the same time.
+            threads (int): DuckDB worker threads (DuckDB's default if None).
+            memory_limit (str): DuckDB memory limit, e.g. "4GB" (DuckDB's
+                           default if None).
+            query_timeout (float): Seconds after which a query is interrupted
+                           and TimeoutError raised. None means no limit.
+            pool_timeout (float): Seconds to wait for a free cursor before
+                           raising TimeoutError.
+            cube (bool): Maintain <table>_cube, counts, sums and sums of
+                           squares per brand_area x quarter x tactic grouping
+                           set (see sql_tools.CUBE_DIMENSIONS), rebuilt on
+                           reload and merged with just the new rows on append.
+                           Not available in "view" mode.
         """
-        self.conn = duckdb.connect(database=db_path)
+        if load_mode not in LOAD_MODES:
+            raise ValueError(f"load_mode must be one of {LOAD_MODES}, got {load_mode!r}")
+        self.load_mode = load_mode
+        self.csv_path = Path(csv_path)
+        self.table_name = self.csv_path.stem
+        if schema is None and self.csv_path == DATA_PATH:
+            schema = CAMPAIGN_SCHEMA
+        self.schema = schema
+        self.parquet_path = Path(parquet_path) if parquet_path else self.csv_path.with_suffix(".parquet")
+        self.auto_refresh = auto_refresh
+        # (mtime_ns, size) of the CSV as of the last ingest
+        self._ingested_stat = None
+        # None if there is no cube; dropped at ingest if the table lacks its columns
+        self.cube_table = f"{self.table_name}_cube" if cube and load_mode != "view" else None
+        # set by statements that may have changed the table; the cube is rebuilt on next use
+        self._cube_stale = False
+        self.query_timeout = query_timeout
+        self.pool_timeout = pool_timeout
+        config = {}
+        if threads:
+            config["threads"] = threads
+        if memory_limit:
+            config["memory_limit"] = memory_limit
+        self.conn = duckdb.connect(database=db_path, config=config)
+        # ingest goes through the root connection; this keeps it to one thread at a time
+        self._lock = threading.Lock()
         self._registered_tables = set()
+        self._fingerprints = {}
+        # canonical SQL + params + data version -> DataFrame, least recently used first
+        self._result_cache = OrderedDict()
+        self._result_cache_bytes = 0
+        self._cache_lock = threading.Lock()
+        self.result_cache_limit = result_cache_bytes
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # bumped by any statement that isn't read-only, invalidating cached results
+        self._generation = 0
         self._load_default_csv()
+        # queries run on cursors (duplicate connections to the same database), one per
+        # in-flight query, so concurrent workflow runs don't share a connection
+        self._pool = queue.Queue()
+        for _ in range(max(1, pool_size)):
+            self._pool.put(self.conn.cursor())
+        self._active_cursors = set()
+        self._active_lock = threading.Lock()
 
     def _load_default_csv(self):
         """Register the default campaign_performance.csv file."""
-        if not DATA_PATH.exists():
-            print(f"Error: CSV file not found: {DATA_PATH}")
+        if not self.csv_path.exists():
+            print(f"Error: CSV file not found: {self.csv_path}")
             sys.exit(1)
-        table_name = DATA_PATH.stem
+        if self.load_mode == "view":
+            self.conn.execute(
+                f"CREATE OR REPLACE VIEW {self.table_name} AS SELECT * FROM read_csv_auto('{self.csv_path}')"
+            )
+        else:
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS _ingest_state (
+                    table_name VARCHAR PRIMARY KEY,
+                    source VARCHAR,
+                    mode VARCHAR,
+                    mtime_ns BIGINT,
+                    size BIGINT,
+                    sha256 VARCHAR,
+                    row_count BIGINT
+                )
+                """
+            )
+            self._ingest()
+        self._registered_tables.add(self.table_name)
+
+    def _read_csv_sql(self, skip_rows: int = 0) -> str:
+        """
+        read_csv(...) table function for the source file, with the explicit
+        schema if there is one. skip_rows > 0 reads only the rows after the
+        first `skip_rows` records (used for incremental appends).
+        """
+        options = [f"'{self.csv_path}'"]
+        if self.schema:
+            columns = ", ".join(f"'{name}': '{dtype}'" for name, dtype in self.schema.items())
+            options.append(f"columns = {{{columns}}}")
+        if skip_rows:
+            options += ["header = false", f"skip = {skip_rows + 1}"]
+        else:
+            options.append("header = true")
+        return f"read_csv({', '.join(options)})"
+
+    def _hash_file(self, prefix_size: int = None):
+        """
+        SHA-256 of the whole CSV, and of its first `prefix_size` bytes if given,
+        in a single pass.
+        """
+        digest = hashlib.sha256()
+        prefix_digest = None
+        remaining = prefix_size
+        with open(self.csv_path, "rb") as f:
+            while True:
+                chunk = f.read(1 << 20)
+                if not chunk:
+                    break
+                if remaining is not None and remaining <= len(chunk):
+                    digest.update(chunk[:remaining])
+                    prefix_digest = digest.hexdigest()
+                    digest.update(chunk[remaining:])
+                    remaining = None
+                    continue
+                digest.update(chunk)
+                if remaining is not None:
+                    remaining -= len(chunk)
+        return digest.hexdigest(), prefix_digest
+
+    def _target_exists(self, table_name: str = None) -> bool:
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?", [table_name or self.table_name]
+        ).fetchone()[0] > 0
+
+    def _build_cube(self):
+        """(Re)build the cube from the whole table; drops the cube if the table lacks its columns."""
+        if self.cube_table is None or not self._target_exists():
+            return
+        columns = [row[0] for row in self.conn.execute(f"DESCRIBE {self.table_name}").fetchall()]
+        if not cube_supported(columns):
+            self.cube_table = None
+            return
+        self.conn.execute(f"CREATE OR REPLACE TABLE {self.cube_table} AS {cube_build_sql(self.table_name, columns)}")
+        self._cube_stale = False
+
+    def _ensure_cube(self):
+        if self.cube_table is not None and (self._cube_stale or not self._target_exists(self.cube_table)):
+            self._build_cube()
+
+    def _append(self, skip_rows: int):
+        """Insert the CSV rows after the first `skip_rows` and merge just them into the cube."""
+        if self.cube_table is None or self._cube_stale or not self._target_exists(self.cube_table):
+            self.conn.execute(f"INSERT INTO {self.table_name} SELECT * FROM {self._read_csv_sql(skip_rows=skip_rows)}")
+            self._build_cube()
+            return
+        # the table's columns: without a schema, read_csv names headerless columns column0, column1, ...
+        self.conn.execute(f"CREATE OR REPLACE TEMP TABLE _ingest_delta AS SELECT * FROM {self.table_name} LIMIT 0")
+        try:
+            self.conn.execute(f"INSERT INTO _ingest_delta SELECT * FROM {self._read_csv_sql(skip_rows=skip_rows)}")
+            self.conn.execute(f"INSERT INTO {self.table_name} SELECT * FROM _ingest_delta")
+            columns = [row[0] for row in self.conn.execute("DESCRIBE _ingest_delta").fetchall()]
+            self.conn.execute(
+                f"CREATE OR REPLACE TABLE {self.cube_table} AS "
+                f"{cube_merge_sql(self.cube_table, cube_build_sql('_ingest_delta', columns))}"
+            )
+        finally:
+            self.conn.execute("DROP TABLE IF EXISTS _ingest_delta")
+
+    def _ingest(self) -> bool:
+        """
+        Load the CSV into the target table/Parquet file if it changed since the
+        last ingest. A file that only grew (same leading bytes) has just its
+        new rows appended in "table" mode; any other change reloads it.
+
+        Returns:
+            True if data was (re)loaded.
+        """
+        stat = self.csv_path.stat()
+        source = str(self.csv_path.resolve())
+        previous = self.conn.execute(
+            "SELECT source, mode, mtime_ns, size, sha256, row_count FROM _ingest_state WHERE table_name = ?",
+            [self.table_name]
+        ).fetchone()
+        same_source = previous is not None and previous[0] == source and previous[1] == self.load_mode
+
+        if same_source and (previous[2], previous[3]) == (stat.st_mtime_ns, stat.st_size) and self._target_exists():
+            self._ensure_cube()
+            self._ingested_stat = (stat.st_mtime_ns, stat.st_size)
+            return False
+
+        grew = same_source and stat.st_size > previous[3] and self._target_exists()
+        sha256, prefix_sha256 = self._hash_file(previous[3] if grew else None)
+
+        if same_source and sha256 == previous[4] and self._target_exists():
+            # touched but not modified
+            self._ensure_cube()
+            loaded = False
+        elif self.load_mode == "table" and grew and prefix_sha256 == previous[4]:
+            self._append(skip_rows=previous[5])
+            loaded = True
+        elif self.load_mode == "table":
+            self.conn.execute(f"CREATE OR REPLACE TABLE {self.table_name} AS SELECT * FROM {self._read_csv_sql()}")
+            self._build_cube()
+            loaded = True
+        else:
+            self.conn.execute(f"COPY (SELECT * FROM {self._read_csv_sql()}) TO '{self.parquet_path}' (FORMAT PARQUET)")
+            self.conn.execute(
+                f"CREATE OR REPLACE VIEW {self.table_name} AS SELECT * FROM read_parquet('{self.parquet_path}')"
+            )
+            self._build_cube()
+            loaded = True
+
+        row_count = self.conn.execute(f"SELECT COUNT(*) FROM {self.table_name}").fetchone()[0]
         self.conn.execute(
-            f"CREATE OR REPLACE VIEW {table_name} AS SELECT * FROM read_csv_auto('{DATA_PATH}')"
+            "INSERT OR REPLACE INTO _ingest_state VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [self.table_name, source, self.load_mode, stat.st_mtime_ns, stat.st_size, sha256, row_count]
         )
-        self._registered_tables.add(table_name)
+        self._ingested_stat = (stat.st_mtime_ns, stat.st_size)
+        return loaded
+
+    def refresh(self) -> bool:
+        """
+        Re-ingest the CSV if it changed on disk. No-op in "view" mode, where
+        every query reads the file anyway.
+
+        Returns:
+            True if data was (re)loaded.
+        """
+        if self.load_mode == "view":
+            return False
+        stat = self.csv_path.stat()
+        if (stat.st_mtime_ns, stat.st_size) == self._ingested_stat:
+            return False
+        with self._lock:
+            loaded = self._ingest()
+        if loaded:
+            self.clear_result_cache()
+        return loaded
+
+    def query(self, sql: str, params=None, timeout: float = None) -> pd.DataFrame:
+        """
+        Run a SQL query and return a pandas DataFrame.
+
+        Results of read-only queries are cached until the underlying data
+        changes. The cache keeps its own copy of each result and every hit
+        returns a fresh copy, so a caller modifying its DataFrame doesn't
+        affect later cache hits.
+
+        Args:
+            sql (str): The query.
+            params: Optional positional or named parameters.
+            timeout (float): Overrides query_timeout for this query.
+        """
+        with tracer.span("duckdb.query", sql=sql[:200]) as span:
+            result, cache_hit = self._query(sql, params, timeout)
+            span.set(rows=len(result), cache_hit=cache_hit)
+        return result
+
+    def _query(self, sql: str, params=None, timeout: float = None):
+        """query(), also reporting whether the result came from the result cache."""
+        if self.auto_refresh:
+            self.refresh()
+
+        if not self.result_cache_limit or not _READ_ONLY_SQL.match(sql):
+            result = self._execute(sql, params, timeout)
+            if not _NON_MUTATING_SQL.match(sql):
+                # under the cache lock, so no read can store a result under the old generation afterwards
+                with self._cache_lock:
+                    self._generation += 1
+                    self._result_cache.clear()
+                    self._result_cache_bytes = 0
+                self._cube_stale = self.cube_table is not None
+            return result, False
+
+        key = (self.canonicalize_sql(sql), self._params_key(params), self.data_version(), self._generation)
+
+        with self._cache_lock:
+            cached = self._result_cache.get(key)
+            if cached is not None:
+                self._result_cache.move_to_end(key)
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+        if cached is not None:
+            # copied outside the lock; the cached frame itself is never modified
+            return cached[0].copy(), True
+
+        result = self._execute(sql, params, timeout)
+
+        self._store_result(key, result)
+        return result, False
+
+    def cube(self, source: str = None):
+        """
+        Name of the pre-aggregated cube over `source` (default: the loaded
+        table), or None if it has none. Picks up appended CSV rows first and
+        rebuilds the cube if a statement run through query() may have
+        modified the table since.
+        """
+        if self.cube_table is None or (source or self.table_name) != self.table_name:
+            return None
+        if self.auto_refresh:
+            self.refresh()
+        if self._cube_stale:
+            with self._lock:
+                if self._cube_stale:
+                    self._build_cube()
+        # still stale if the table itself is gone
+        return None if self._cube_stale else self.cube_table
+
+    @contextmanager
+    def _cursor(self):
+        """Borrow a cursor from the pool for the duration of one query."""
+        try:
+            cursor = self._pool.get(timeout=self.pool_timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No free DuckDB cursor after {self.pool_timeout}s")
+        with self._active_lock:
+            self._active_cursors.add(cursor)
+        try:
+            yield cursor
+        finally:
+            with self._active_lock:
+                self._active_cursors.discard(cursor)
+            self._pool.put(cursor)
+
+    def _execute(self, sql: str, params=None, timeout: float = None) -> pd.DataFrame:
+        timeout = timeout if timeout is not None else self.query_timeout
+        with self._cursor() as cursor:
+            timer = None
+            timed_out = threading.Event()
+            if timeout:
+                def expire():
+                    # set before interrupting, so the query thread sees it once the interrupt lands
+                    timed_out.set()
+                    cursor.interrupt()
+
+                timer = threading.Timer(timeout, expire)
+                timer.daemon = True
+                timer.start()
+            try:
+                if params:
+                    return cursor.execute(sql, params).fetchdf()
+                return cursor.execute(sql).fetchdf()
+            except duckdb.InterruptException as e:
+                if timed_out.is_set():
+                    raise TimeoutError(f"Query exceeded {timeout}s timeout: {sql[:200]}") from e
+                raise
+            finally:
+                if timer is not None:
+                    timer.cancel()
+
+    def cancel_all(self):
+        """Interrupt every query currently executing on this client."""
+        with self._active_lock:
+            for cursor in self._active_cursors:
+                cursor.interrupt()
+
+    def _store_result(self, key, result: pd.DataFrame):
+        """Add a result to the cache, evicting least recently used entries past the budget."""
+        size = int(result.memory_usage(deep=True).sum())
+        if size > self.result_cache_limit:
+            return
+        # the caller keeps `result`; the cache holds a copy it alone owns
+        result = result.copy()
+
+        with self._cache_lock:
+            # the data was modified while this query ran; the result may predate it
+            if key in self._result_cache or key[3] != self._generation:
+                return
+            self._result_cache[key] = (result, size)
+            self._result_cache_bytes += size
+            while self._result_cache_bytes > self.result_cache_limit:
+                _, (_, evicted_size) = self._result_cache.popitem(last=False)
+                self._result_cache_bytes -= evicted_size
+
+    @staticmethod
+    def canonicalize_sql(sql: str) -> str:
+        """
+        Normalize insignificant differences in a SQL string (whitespace,
+        trailing semicolons) without touching string literals.
+        """
+        parts = _SQL_LITERAL.split(sql.strip().rstrip(";").strip())
+        return "".join(part if i % 2 else re.sub(r"\s+", " ", part) for i, part in enumerate(parts))
+
+    @staticmethod
+    def _params_key(params):
+        if not params:
+            return ()
+        if isinstance(params, dict):
+            return tuple(sorted((k, repr(v)) for k, v in params.items()))
+        return tuple(repr(p) for p in params)
+
+    def cache_info(self) -> dict:
+        """Hit/miss counters and current size of the result cache."""
+        with self._cache_lock:
+            return {
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+                "entries": len(self._result_cache),
+                "bytes": self._result_cache_bytes,
+                "limit_bytes": self.result_cache_limit,
+            }
+
+    def clear_result_cache(self):
+        """Drop every cached query result."""
+        with self._cache_lock:
+            self._result_cache.clear()
+            self._result_cache_bytes = 0
+
+    def data_version(self) -> str:
+        """
+        Token that changes whenever campaign_performance.csv changes on disk
+        (modification time and size of the file).
+        """
+        stat = self.csv_path.stat()
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+    def schema_fingerprint(self, table_name: str = None) -> str:
+        """
+        Hash of a table's column names/types plus the current data version.
+        Anything derived from the table (e.g. generated SQL) can be keyed on it.
+        """
+        table_name = table_name or self.table_name
+        version = self.data_version()
+        cached = self._fingerprints.get(table_name)
+        if cached and cached[0] == version:
+            return cached[1]
 
-    def query(self, sql: str, params=None) -> pd.DataFrame:
-        """Run a SQL query and return a pandas DataFrame."""
-        if params:
-            return self.conn.execute(sql, params).fetchdf()
-        return self.conn.execute(sql).fetchdf()
+        columns = self.query(f"DESCRIBE {table_name}")
+        schema = ",".join(f"{row.column_name}:{row.column_type}" for row in columns.itertuples())
+        fingerprint = hashlib.sha256(f"{schema}|{version}".encode("utf-8")).hexdigest()[:16]
+        self._fingerprints[table_name] = (version, fingerprint)
+        return fingerprint
 
     def list_tables(self):
         """List all tables currently registered in the DuckDB connection."""
         return self.query("SHOW TABLES;")
 
     def close(self):
-        """Close the DuckDB connection."""
+        """Close the pooled cursors and the DuckDB connection."""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
         self.conn.close()
\ No newline at end of file
@@ -1,49 +1,554 @@
+import hashlib
 import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
 from pathlib import Path
+from typing import Dict, List, Tuple
 
+import numpy as np
+import scipy.sparse as sp
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 
+from agent_system.clients.retrieval import RetrievalBackend, top_k
+from agent_system.clients.chunking import chunk_document
 
+logger = logging.getLogger(__name__)
+
+# location of "kb_documents.jsonl"
+DATA_PATH = Path(__file__).resolve().parents[2] / "data" / "kb_documents.jsonl"
+# persisted indexes, one subdirectory per source file
+INDEX_DIR = Path(__file__).resolve().parents[2] / "data" / "cache" / "kb_index"
+# bump when the on-disk layout changes; older indexes are rebuilt
+INDEX_FORMAT = 2
+
+
+class DocFile:
+    """
+    Read-only sequence of the documents in a JSONL file, parsed on access
+    from their byte offsets, so a loaded index doesn't hold every document
+    in memory.
+    """
+
+    def __init__(self, path: Path, offsets: np.ndarray):
+        self.path = path
+        self.offsets = offsets
+        self._file = open(path, "rb")
+        self._lock = threading.Lock()
+        # documents added at runtime, after the ones in the file
+        self._appended = []
+
+    def append(self, doc: Dict):
+        self._appended.append(doc)
+
+    def __len__(self) -> int:
+        return len(self.offsets) + len(self._appended)
+
+    def __getitem__(self, idx: int) -> Dict:
+        if idx >= len(self.offsets):
+            return self._appended[idx - len(self.offsets)]
+        with self._lock:
+            if self._file is None:
+                # closed, but a search that started before the swap may still read
+                with open(self.path, "rb") as f:
+                    f.seek(int(self.offsets[idx]))
+                    line = f.readline()
+            else:
+                self._file.seek(int(self.offsets[idx]))
+                line = self._file.readline()
+        return json.loads(line)
+
+    def close(self):
+        """Close the file handle; later reads open the file per access."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class KBClient(RetrievalBackend):
+    def __init__(self, file_path=DATA_PATH, index_dir=INDEX_DIR, persist: bool = True,
+                 chunk_sentences: int = None, chunk_overlap: int = 1):
+        """
+        Load the knowledge base, reusing the persisted index for `file_path`
+        if it was built from the file's current contents and rebuilding (and
+        re-saving) it otherwise.
+
+        Args:
+            file_path: JSONL file of documents (doc_id, title, text).
+            index_dir: Directory holding persisted indexes.
+            persist (bool): Load and save the index on disk; False always fits in memory.
+            chunk_sentences (int): If set, index passages of this many sentences
+                                   (see chunking.chunk_document) instead of whole
+                                   documents; every passage keeps its doc_id.
+            chunk_overlap (int): Sentences shared by consecutive passages.
+        """
+        self.file_path = Path(file_path)
+        self.persist = persist
+        self.chunking = (chunk_sentences, chunk_overlap) if chunk_sentences else None
+        # one index per source file and chunking, so different clients don't overwrite each other
+        path_key = hashlib.sha1(f"{self.file_path.resolve()}|{self.chunking}".encode()).hexdigest()[:8]
+        self.index_path = Path(index_dir) / f"{self.file_path.stem}-{path_key}"
+
+        # guards swapping the index during runtime updates and compaction
+        self._lock = threading.RLock()
+        # one poll_source() at a time (the watcher thread and direct calls)
+        self._poll_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        # bumped whenever document positions may change (reload, compaction)
+        self.generation = 0
+        self.reload()
+
+    def reload(self):
+        """(Re)load the whole knowledge base from the source file, dropping runtime changes."""
+        with self._lock:
+            previous = getattr(self, "docs", None)
+            self.vectorizer = TfidfVectorizer()
+            stat = self.file_path.stat()
+            source_digest, source_size = self._hash_source()
+            source_sha256 = source_digest.hexdigest()
+            if not (self.persist and self.load_index(source_sha256)):
+                self.docs = self.load_docs_from_csv()
+                if self.chunking:
+                    self.docs = self._chunk(self.docs)
+                # unwrap textfield because sklearn compares about being passed dicts
+                self.build_index(self.vectorizer.fit_transform([d['text'] for d in self.docs]))
+                if self.persist:
+                    self.save_index(source_sha256)
+            self._reset_changes()
+            # how far into the source file has been indexed, the hash of those bytes and
+            # the file's (mtime, size) when last looked at, for poll_source()
+            self._source_offset = source_size
+            self._source_digest = source_digest
+            self._source_stat = (stat.st_mtime_ns, stat.st_size)
+            self._close_docs(previous)
+
+    def _close_docs(self, docs):
+        """Release the file handle of a replaced document store."""
+        if isinstance(docs, DocFile) and docs is not self.docs:
+            docs.close()
+
+    def _chunk(self, docs: List[Dict]) -> List[Dict]:
+        """The entries to index for `docs`: the documents themselves, or their passages."""
+        if not self.chunking:
+            return docs
+        window, overlap = self.chunking
+        return [passage for doc in docs for passage in chunk_document(doc, window, overlap)]
+
+    def _hash_source(self):
+        """SHA-256 (a hashlib object, to continue over appended bytes) and size in bytes of the source file."""
+        digest = hashlib.sha256()
+        size = 0
+        with open(self.file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+                size += len(chunk)
+        return digest, size
 
-class KBClient:
-    # location of "kb_documents.jsonl"
-    def __init__(self):
-        self.vectorizer = TfidfVectorizer()
-        self.file_path = Path(__file__).resolve().parents[2] / "data" / "kb_documents.jsonl"
-        self.docs = self.load_docs_from_csv()
-        # unwrap textfield because sklearn compares about being passed dicts
-        self.doc_vectors = self.vectorizer.fit_transform([d['text'] for d in self.docs])
-        
     def load_docs_from_csv(self):
         """
         Loads JSON-formatted rows from a .csv or .txt file in the same directory.
         Each line should be a JSON object with keys: doc_id, title, text.
-        Returns a list of dicts.
+        Returns a list of dicts; the byte offset of each one's line is kept in
+        self.doc_offsets for the persisted index.
         """
-        
+
         docs = []
+        offsets = []
+
+        with open(self.file_path, "rb") as f:
+            offset = 0
+            for raw in f:
+                line = raw.strip()
+                if line:
+                    try:
+                        obj = json.loads(line)
+                        docs.append(obj)
+                        offsets.append(offset)
+                    except json.JSONDecodeError as e:
+                        logger.warning("Skipping line due to JSON error: %s", e)
+                offset += len(raw)
+
+        self.doc_offsets = np.asarray(offsets, dtype=np.int64)
+        return docs
+
+    def save_index(self, source_sha256: str):
+        """
+        Write the fitted vocabulary, IDF weights, postings matrix and document
+        offsets to self.index_path. Files are written to a temporary directory
+        that is then moved into place, so readers never see a partial index.
+        """
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(dir=self.index_path.parent, prefix=".building-"))
+        try:
+            vocabulary = {term: int(idx) for term, idx in self.vectorizer.vocabulary_.items()}
+            (tmp / "vocabulary.json").write_text(json.dumps(vocabulary), encoding="utf-8")
+            np.save(tmp / "idf.npy", self.vectorizer.idf_)
+            np.save(tmp / "postings_data.npy", self.postings.data)
+            np.save(tmp / "postings_indices.npy", self.postings.indices)
+            np.save(tmp / "postings_indptr.npy", self.postings.indptr)
+            if self.chunking:
+                # passages aren't lines of the source file, so they get a JSONL file of their own
+                np.save(tmp / "doc_offsets.npy", self._write_passages(tmp / "passages.jsonl"))
+            else:
+                np.save(tmp / "doc_offsets.npy", self.doc_offsets)
+            # the manifest goes last: an index without one is never loaded
+            manifest = {
+                "format": INDEX_FORMAT,
+                "source": str(self.file_path.resolve()),
+                "source_sha256": source_sha256,
+                "n_docs": len(self.docs),
+                "n_terms": len(vocabulary),
+                "chunking": self.chunking,
+            }
+            (tmp / "manifest.json").write_text(json.dumps(manifest), encoding="utf-8")
+
+            shutil.rmtree(self.index_path, ignore_errors=True)
+            os.replace(tmp, self.index_path)
+        except OSError as e:
+            # e.g. another process moved its copy into place first
+            logger.warning("Could not save KB index: %s", e)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def _write_passages(self, path: Path) -> np.ndarray:
+        """Write self.docs to a JSONL file and return the byte offset of each line."""
+        offsets = np.empty(len(self.docs), dtype=np.int64)
+        with open(path, "wb") as f:
+            for idx, doc in enumerate(self.docs):
+                offsets[idx] = f.tell()
+                f.write(json.dumps(doc).encode("utf-8") + b"\n")
+        return offsets
+
+    def load_index(self, source_sha256: str) -> bool:
+        """
+        Load the persisted index if it exists and was built from a source file
+        with the given hash. Array files are memory-mapped, so processes
+        loading the same index share its pages.
+
+        Returns:
+            True if the index was loaded, False if it needs to be rebuilt.
+        """
+        try:
+            manifest = json.loads((self.index_path / "manifest.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        if manifest.get("format") != INDEX_FORMAT or manifest.get("source_sha256") != source_sha256:
+            return False
+        if manifest.get("chunking") != (list(self.chunking) if self.chunking else None):
+            return False
+
+        try:
+            load = lambda name: np.load(self.index_path / name, mmap_mode="r")
+            vocabulary = json.loads((self.index_path / "vocabulary.json").read_text(encoding="utf-8"))
+            idf = np.load(self.index_path / "idf.npy")
+            postings = sp.csr_matrix(
+                (load("postings_data.npy"), load("postings_indices.npy"), load("postings_indptr.npy")),
+                shape=(manifest["n_terms"], manifest["n_docs"]),
+                copy=False
+            )
+            doc_offsets = load("doc_offsets.npy")
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Rebuilding KB index, could not load it: %s", e)
+            return False
+
+        self.vectorizer.vocabulary_ = vocabulary
+        self.vectorizer.idf_ = idf
+        self.postings = postings
+        self.doc_offsets = doc_offsets
+        self.docs = DocFile(self.index_path / "passages.jsonl" if self.chunking else self.file_path, doc_offsets)
+        return True
+
+    @property
+    def doc_vectors(self):
+        """
+        Document-term TF-IDF matrix, one row per entry of self.docs (a
+        transposed view of the postings, plus any rows added since the last
+        compaction). Rows of deleted documents are still present.
+        """
+        if self._added_vectors is None:
+            return self.postings.T
+        return sp.vstack([self.postings.T, self._added_vectors]).tocsr()
+
+    def build_index(self, doc_vectors):
+        """
+        Build the inverted index: one postings row per vocabulary term, listing
+        the documents containing it and their TF-IDF weights.
+
+        TfidfVectorizer L2-normalizes its rows, so the dot product of a query
+        vector with a document vector is their cosine similarity. Multiplying
+        a (sparse) query by the postings matrix only walks the postings of the
+        query's own terms, so documents sharing no term are never scored.
+        """
+        self.postings = doc_vectors.T.tocsr()
+
+    def _snapshot(self):
+        with self._lock:
+            return (self.vectorizer, self.postings, self._added_postings,
+                    self._deleted, self._n_deleted, self.docs)
+
+    @staticmethod
+    def _similarities(query_vectors, postings, added):
+        """Sparse (queries x documents) cosine similarities."""
+        scores = query_vectors @ postings
+        if added is not None:
+            # documents added since the last compaction follow the indexed ones
+            scores = sp.hstack([scores, query_vectors @ added])
+        return scores.tocsr()
+
+    def _search(self, queries: List[str], k: int, min_score: float):
+        """Top-k (score, doc index) pairs per query, and the documents the indices refer to."""
+        vectorizer, postings, added, deleted, n_deleted, docs = self._snapshot()
+        # all queries are scored in one sparse matrix multiply against the inverted index
+        scores = self._similarities(vectorizer.transform(queries), postings, added)
 
-        with open(self.file_path, "r", encoding="utf-8") as f:
-            for line in f:
+        results = []
+        for row in range(scores.shape[0]):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            doc_ids = scores.indices[start:end]
+            row_scores = scores.data[start:end]
+            if n_deleted:
+                live = ~deleted[doc_ids]
+                doc_ids, row_scores = doc_ids[live], row_scores[live]
+            results.append(top_k(row_scores, doc_ids, k, min_score))
+        return results, docs
+
+    def search_indices_batch(self, queries: List[str], k: int = 5,
+                             min_score: float = 0.0) -> List[List[Tuple[float, int]]]:
+        """
+        Top-k (score, doc index) pairs per query by cosine similarity. Documents
+        sharing no term with a query are never returned.
+        """
+        return self._search(queries, k, min_score)[0]
+
+    def _search_docs(self, queries: List[str], k: int, min_score: float) -> List[List[Tuple[float, Dict]]]:
+        """
+        search_batch(): all queries are scored in a single sparse matrix
+        multiply against the inverted index.
+        """
+        # map indices with the same snapshot they were computed from, in case a compaction swaps the index
+        results, docs = self._search(queries, k, min_score)
+        return [[(score, docs[idx]) for score, idx in hits] for hits in results]
+
+    def score(self, query: str, doc_indices: np.ndarray) -> np.ndarray:
+        vectorizer, postings, added, _, _, _ = self._snapshot()
+        scores = self._similarities(vectorizer.transform([query]), postings, added)
+        return scores[0, doc_indices].toarray().ravel()
+
+    def live_mask(self) -> np.ndarray:
+        """Boolean array over self.docs, False for deleted (or replaced) documents."""
+        with self._lock:
+            return ~self._deleted
+
+    # ----------------------------
+    # runtime updates
+    # ----------------------------
+
+    def _reset_changes(self):
+        """Forget pending runtime changes (after a full load or a compaction)."""
+        self.generation += 1
+        self._added_vectors = None       # doc-term rows of documents added since the last compaction
+        self._added_postings = None      # the same, transposed for scoring
+        self._deleted = np.zeros(len(self.docs), dtype=bool)
+        self._n_deleted = 0
+        self._doc_ids = None             # doc_id -> indices into self.docs (one per passage), built on first update
+        self._op_log = None              # changes made while a compaction is running
+
+    @property
+    def pending_changes(self) -> int:
+        """Entries (documents or passages) added or deleted since the index was last fitted."""
+        added = 0 if self._added_vectors is None else self._added_vectors.shape[0]
+        return added + self._n_deleted
+
+    def _id_map(self) -> Dict[str, List[int]]:
+        if self._doc_ids is None:
+            self._doc_ids = {}
+            for idx, doc in enumerate(self.docs):
+                if not self._deleted[idx]:
+                    self._doc_ids.setdefault(doc["doc_id"], []).append(idx)
+        return self._doc_ids
+
+    def _tombstone(self, indices: List[int]):
+        self._deleted[indices] = True
+        self._n_deleted += len(indices)
+
+    def add_documents(self, docs: List[Dict]):
+        """
+        Add documents, replacing any existing ones with the same doc_id.
+
+        New documents are vectorized with the current vocabulary and IDF
+        weights and scored alongside the index right away; terms the
+        vocabulary doesn't know yet only count after the next compact().
+        """
+        if not docs:
+            return
+        with self._lock:
+            entries = [self._chunk([doc]) for doc in docs]
+            vectors = self.vectorizer.transform([e['text'] for passages in entries for e in passages])
+            ids = self._id_map()
+            self._deleted = np.concatenate([self._deleted, np.zeros(vectors.shape[0], dtype=bool)])
+            for doc, passages in zip(docs, entries):
+                replaced = ids.get(doc["doc_id"])
+                if replaced:
+                    self._tombstone(replaced)
+                ids[doc["doc_id"]] = list(range(len(self.docs), len(self.docs) + len(passages)))
+                for passage in passages:
+                    self.docs.append(passage)
+
+            self._added_vectors = vectors if self._added_vectors is None else sp.vstack([self._added_vectors, vectors]).tocsr()
+            self._added_postings = self._added_vectors.T.tocsr()
+            if self._op_log is not None:
+                self._op_log.append(("add", docs))
+
+    def add_document(self, doc: Dict):
+        """Add one document (or replace the one with the same doc_id)."""
+        self.add_documents([doc])
+
+    def update_document(self, doc: Dict):
+        """Replace the document with doc["doc_id"]; KeyError if there is none."""
+        with self._lock:
+            if doc["doc_id"] not in self._id_map():
+                raise KeyError(doc["doc_id"])
+            self.add_documents([doc])
+
+    def delete_document(self, doc_id):
+        """Remove a document from search results; KeyError if there is none."""
+        with self._lock:
+            self._tombstone(self._id_map().pop(doc_id))
+            if self._op_log is not None:
+                self._op_log.append(("delete", doc_id))
+
+    def compact(self):
+        """
+        Refit the vocabulary and IDF weights on the live documents and rebuild
+        the index, folding in added documents and dropping deleted ones.
+
+        The refit runs without holding the lock, so searches and updates carry
+        on against the current index meanwhile; updates made during the refit
+        are replayed onto the new index before it is swapped in. The result
+        is kept in memory only; the persisted index always mirrors the
+        source file and is rebuilt from it on the next start if it changed.
+        """
+        with self._lock:
+            if self._op_log is not None:
+                return  # already compacting
+            self._op_log = []
+            docs, deleted = self.docs, self._deleted.copy()
+
+        try:
+            live = [docs[idx] for idx in np.flatnonzero(~deleted)]
+            vectorizer = TfidfVectorizer()
+            postings = vectorizer.fit_transform([d['text'] for d in live]).T.tocsr()
+        except Exception:
+            with self._lock:
+                self._op_log = None
+            raise
+
+        with self._lock:
+            ops = self._op_log
+            self.vectorizer, self.postings, self.docs = vectorizer, postings, live
+            self._close_docs(docs)
+            self._reset_changes()
+            for op, arg in ops:
+                if op == "add":
+                    self.add_documents(arg)
+                elif arg in self._id_map():
+                    self.delete_document(arg)
+
+    def poll_source(self) -> int:
+        """
+        Index complete lines appended to the source file since it was last
+        read (documents whose doc_id already exists replace the old version).
+        If the bytes already indexed changed (the file was rewritten, at any
+        size), it is reloaded in full, as DuckDBClient._ingest does.
+
+        Returns:
+            Number of documents picked up.
+        """
+        with self._poll_lock:
+            stat = self.file_path.stat()
+            with self._lock:
+                offset, indexed_digest, seen = self._source_offset, self._source_digest, self._source_stat
+            if (stat.st_mtime_ns, stat.st_size) == seen:
+                return 0
+
+            reload = stat.st_size < offset
+            if not reload:
+                # one pass: hash of the indexed prefix, then whatever follows it
+                digest = hashlib.sha256()
+                with open(self.file_path, "rb") as f:
+                    remaining = offset
+                    while remaining:
+                        block = f.read(min(remaining, 1 << 20))
+                        if not block:
+                            break
+                        digest.update(block)
+                        remaining -= len(block)
+                    chunk = f.read()
+                reload = remaining > 0 or digest.hexdigest() != indexed_digest.hexdigest()
+            if reload:
+                self.reload()
+                return len(self.docs)
+
+            # leave a partially written last line for the next poll
+            end = chunk.rfind(b"\n") + 1
+            docs = []
+            for line in chunk[:end].splitlines():
                 line = line.strip()
                 if not line:
                     continue
                 try:
-                    obj = json.loads(line)
-                    docs.append(obj)
+                    docs.append(json.loads(line))
                 except json.JSONDecodeError as e:
-                    print(f"Skipping line due to JSON error: {e}")
-                    
-        return docs    
-
-    def find_nearest(self, query):
-        query_vec = self.vectorizer.transform([query])
-        
-        sims = cosine_similarity(query_vec, self.doc_vectors).flatten()
-        best_idx = sims.argmax()
-        best_score = sims[best_idx]
-        
-        print(f"Most relevant with score of {best_score}: {self.docs[best_idx]}")
-        
-        return best_score, self.docs[best_idx]
\ No newline at end of file
+                    logger.warning("Skipping line due to JSON error: %s", e)
+
+            with self._lock:
+                if self._source_offset != offset:
+                    return 0  # reloaded meanwhile
+                self.add_documents(docs)
+                digest.update(chunk[:end])
+                self._source_offset = offset + end
+                self._source_digest = digest
+                self._source_stat = (stat.st_mtime_ns, stat.st_size)
+            return len(docs)
+
+    def _run_periodically(self, interval: float, fn, name: str):
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    fn()
+                except Exception as e:
+                    logger.error("KB %s failed: %s", name, e)
+
+        thread = threading.Thread(target=loop, name=f"kb-{name}", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def watch(self, interval: float = 1.0):
+        """Poll the source file for appended documents every `interval` seconds in a background thread."""
+        self._run_periodically(interval, self.poll_source, "watcher")
+
+    def start_compaction(self, interval: float = 300.0, min_pending: int = 1):
+        """
+        Compact in a background thread every `interval` seconds, whenever at
+        least `min_pending` documents were added or deleted since the last fit.
+        """
+        def maybe_compact():
+            if self.pending_changes >= min_pending:
+                self.compact()
+
+        self._run_periodically(interval, maybe_compact, "compaction")
+
+    def stop(self):
+        """Stop the watcher and compaction threads."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._stop.clear()
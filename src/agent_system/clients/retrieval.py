@@ -0,0 +1,224 @@
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from agent_system.utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Retrieval backends for the knowledge base. Every backend indexes the same
+# document sequence (`docs`) and reports results as positions in it, so
+# backends can be combined: HybridKB fuses the lexical TF-IDF index
+# (naive_kb.KBClient) with the dense LSA index (dense_kb.DenseKB).
+
+BACKENDS = ("tfidf", "dense", "hybrid")
+
+
+class RetrievalBackend(ABC):
+    """Interface shared by the knowledge base retrieval backends."""
+
+    docs = ()
+
+    @abstractmethod
+    def search_indices_batch(self, queries: List[str], k: int = 5,
+                             min_score: float = 0.0) -> List[List[Tuple[float, int]]]:
+        """
+        Top-k (score, doc index) pairs for each query, best first, dropping
+        scores below min_score.
+        """
+
+    @abstractmethod
+    def score(self, query: str, doc_indices: np.ndarray) -> np.ndarray:
+        """Exact similarity of the query to each of the given documents."""
+
+    def search_batch(self, queries: List[str], k: int = 5, min_score: float = 0.0) -> List[List[Tuple[float, Dict]]]:
+        """
+        Top-k documents for each of several queries.
+
+        Returns:
+            One list of (score, doc) tuples per query, best first.
+        """
+        with tracer.span("kb.search", backend=type(self).__name__, queries=len(queries), k=k) as span:
+            results = self._search_docs(queries, k, min_score)
+            span.set(hits=sum(len(hits) for hits in results))
+        return results
+
+    def _search_docs(self, queries: List[str], k: int, min_score: float) -> List[List[Tuple[float, Dict]]]:
+        """search_batch() without the tracing; backends override this rather than search_batch."""
+        docs = self.docs
+        return [
+            [(score, docs[idx]) for score, idx in hits]
+            for hits in self.search_indices_batch(queries, k=k, min_score=min_score)
+        ]
+
+    def search(self, query: str, k: int = 5, min_score: float = 0.0) -> List[Tuple[float, Dict]]:
+        """
+        Top-k documents for a query.
+
+        Args:
+            query (str): Query text.
+            k (int): Maximum number of documents to return.
+            min_score (float): Documents scoring below this are dropped.
+
+        Returns:
+            List of (score, doc) tuples, best first.
+        """
+        return self.search_batch([query], k=k, min_score=min_score)[0]
+
+    @staticmethod
+    def _dedupe(hits: List[Tuple[float, Dict]], k: int, max_per_doc: int) -> List[Tuple[float, Dict]]:
+        picked, per_doc = [], {}
+        for score, doc in hits:
+            doc_id = doc.get("doc_id")
+            if per_doc.get(doc_id, 0) >= max_per_doc:
+                continue
+            per_doc[doc_id] = per_doc.get(doc_id, 0) + 1
+            picked.append((score, doc))
+            if len(picked) == k:
+                break
+        return picked
+
+    def search_passages_batch(self, queries: List[str], k: int = 5, max_per_doc: int = 1,
+                              min_score: float = 0.0) -> List[List[Tuple[float, Dict]]]:
+        """
+        search_passages() for many queries, searched together with search_batch().
+
+        Returns:
+            One list of (score, passage) tuples per query, in the order given.
+        """
+        results = [None] * len(queries)
+        pending = list(range(len(queries)))
+        n_candidates = k * 4
+        while pending:
+            hits_batch = self.search_batch([queries[i] for i in pending], k=n_candidates, min_score=min_score)
+            still_short = []
+            for i, hits in zip(pending, hits_batch):
+                picked = self._dedupe(hits, k, max_per_doc)
+                # done once k are picked or there are no more candidates to draw from
+                if len(picked) == k or len(hits) < n_candidates:
+                    results[i] = picked
+                else:
+                    still_short.append(i)
+            pending = still_short
+            n_candidates *= 4
+        return results
+
+    def search_passages(self, query: str, k: int = 5, max_per_doc: int = 1,
+                        min_score: float = 0.0) -> List[Tuple[float, Dict]]:
+        """
+        Top-k entries for a query with at most `max_per_doc` from any one
+        doc_id, so a long document split into passages can't fill every slot.
+
+        Returns:
+            List of (score, passage) tuples, best first.
+        """
+        return self.search_passages_batch([query], k=k, max_per_doc=max_per_doc, min_score=min_score)[0]
+
+    def find_nearest_batch(self, queries: List[str], k: int = 1) -> List[List[Tuple[float, Dict]]]:
+        """
+        find_nearest() for many queries at once, returning the top k per query.
+        All queries go through one search_batch() call (for TF-IDF: a single
+        transform and one sparse matrix product).
+
+        Returns:
+            One list of (score, doc) tuples per query, best first; a query with
+            no match gets the first document with a score of 0, as in find_nearest.
+        """
+        return [
+            hits or [(0.0, self.docs[0])]
+            for hits in self.search_batch(queries, k=k)
+        ]
+
+    def find_nearest(self, query):
+        results = self.search(query, k=1)
+        # like argmax over all-zero similarities, fall back to the first document
+        best_score, best_doc = results[0] if results else (0.0, self.docs[0])
+
+        logger.debug("Most relevant with score of %s: %s", best_score, best_doc)
+
+        return best_score, best_doc
+
+
+def top_k(scores: np.ndarray, doc_ids: np.ndarray, k: int, min_score: float) -> List[Tuple[float, int]]:
+    """The (at most) k best (score, doc index) pairs scoring at least min_score, best first."""
+    keep = scores >= min_score
+    scores, doc_ids = scores[keep], doc_ids[keep]
+    if len(scores) > k:
+        # partial selection: O(n) instead of sorting every candidate
+        best = np.argpartition(-scores, k - 1)[:k]
+        scores, doc_ids = scores[best], doc_ids[best]
+    # highest score first, ties to the earlier document
+    order = np.lexsort((doc_ids, -scores))
+    return [(float(scores[i]), int(doc_ids[i])) for i in order]
+
+
+class HybridKB(RetrievalBackend):
+    """
+    Lexical + dense retrieval. Candidates from both backends are rescored
+    exactly by both, and ranked by a weighted sum of the two similarities.
+    """
+
+    def __init__(self, lexical: RetrievalBackend, dense: RetrievalBackend, dense_weight: float = 0.5,
+                 candidates_per_backend: int = 4):
+        """
+        Args:
+            lexical: TF-IDF backend.
+            dense: Dense backend built over the same documents.
+            dense_weight (float): Weight of the dense similarity; the lexical one gets 1 - dense_weight.
+            candidates_per_backend (int): Each backend contributes k * this many candidates.
+        """
+        self.lexical = lexical
+        self.dense = dense
+        self.dense_weight = dense_weight
+        self.candidates_per_backend = candidates_per_backend
+
+    @property
+    def docs(self):
+        return self.lexical.docs
+
+    def score(self, query: str, doc_indices: np.ndarray) -> np.ndarray:
+        lexical = self.lexical.score(query, doc_indices)
+        # LSA similarities can be slightly negative; treat those as no match
+        dense = np.clip(self.dense.score(query, doc_indices), 0.0, None)
+        return (1 - self.dense_weight) * lexical + self.dense_weight * dense
+
+    def search_indices_batch(self, queries: List[str], k: int = 5,
+                             min_score: float = 0.0) -> List[List[Tuple[float, int]]]:
+        n_candidates = k * self.candidates_per_backend
+        lexical_hits = self.lexical.search_indices_batch(queries, k=n_candidates)
+        dense_hits = self.dense.search_indices_batch(queries, k=n_candidates)
+
+        results = []
+        for query, lexical, dense in zip(queries, lexical_hits, dense_hits):
+            candidates = np.unique(np.fromiter((idx for _, idx in lexical + dense), dtype=np.int64))
+            if len(candidates) == 0:
+                results.append([])
+                continue
+            results.append(top_k(self.score(query, candidates), candidates, k, min_score))
+        return results
+
+
+def create_backend(kind: str = "tfidf", **kwargs) -> RetrievalBackend:
+    """
+    Build a knowledge base backend.
+
+    Args:
+        kind (str): "tfidf" (lexical), "dense" (LSA embeddings + IVF index) or "hybrid" (both, fused).
+        **kwargs: Passed to naive_kb.KBClient (e.g. file_path, chunk_sentences).
+    """
+    # imported here: both modules import this one
+    from agent_system.clients.naive_kb import KBClient
+    from agent_system.clients.dense_kb import DenseKB
+
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown KB backend {kind!r}; expected one of {', '.join(BACKENDS)}")
+
+    lexical = KBClient(**kwargs)
+    if kind == "tfidf":
+        return lexical
+    dense = DenseKB(lexical)
+    if kind == "dense":
+        return dense
+    return HybridKB(lexical, dense)
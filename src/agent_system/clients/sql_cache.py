@@ -0,0 +1,218 @@
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Iterable, Optional
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+CACHE_PATH = Path(__file__).parent.parent.parent / "data/cache/nl_sql_cache.sqlite"
+
+
+class SQLCache:
+    """
+    Persistent cache of natural language -> SQL translations.
+
+    Entries are keyed on the normalized question plus a schema fingerprint
+    (see DuckDBClient.schema_fingerprint), so they stop matching as soon as
+    the table or the CSV behind it changes. Expired (TTL) and least recently
+    used entries are evicted on write. Hits only record their access time in
+    memory; it is written out with the next put (or on close), so a hit
+    costs one SELECT and no commit.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl_seconds: float = 7 * 24 * 3600,
+                 max_entries: int = 10_000, near_duplicate_threshold: Optional[float] = None):
+        """
+        Open (or create) the cache.
+
+        Args:
+            path: SQLite file to store entries in. Use ':memory:' for a
+                  process-local cache.
+            ttl_seconds: How long an entry stays valid after it was written.
+            max_entries: Maximum number of entries kept; the least recently
+                         used ones are evicted beyond that.
+            near_duplicate_threshold: If set, a miss falls back to the most
+                         similar cached question (TF-IDF cosine similarity)
+                         when its score is at least this value.
+        """
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS nl_sql_cache (
+                key TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                nl_query TEXT NOT NULL,
+                sql TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # TF-IDF index over cached questions for one fingerprint, rebuilt lazily after writes
+        self._index = None
+        # key -> last access time of hits not yet written to the table
+        self._accessed = {}
+
+    @staticmethod
+    def normalize(nl_query: str) -> str:
+        """
+        Canonical form of a question: case, unicode dashes, punctuation and
+        whitespace differences don't produce different cache keys.
+        """
+        text = unicodedata.normalize("NFKC", nl_query).lower()
+        text = re.sub(r"[‐-―]", "-", text)
+        text = re.sub(r"[^\w\s%-]", " ", text)
+        return " ".join(text.split())
+
+    @staticmethod
+    def _key(normalized: str, fingerprint: str) -> str:
+        return hashlib.sha256(f"{fingerprint}|{normalized}".encode("utf-8")).hexdigest()
+
+    def get(self, nl_query: str, fingerprint: str, vocabulary: Optional[Iterable[str]] = None) -> Optional[str]:
+        """
+        Return the cached SQL for a question, or None on a miss.
+
+        Args:
+            vocabulary: Filter values (brand areas, tactics) of the data. A
+                        near duplicate is only served if it names exactly
+                        the same ones as the question.
+        """
+        normalized = self.normalize(nl_query)
+        now = time.time()
+
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT sql, created_at FROM nl_sql_cache WHERE key = ?",
+                (self._key(normalized, fingerprint),)
+            ).fetchone()
+
+            if row and now - row[1] <= self.ttl_seconds:
+                self._accessed[self._key(normalized, fingerprint)] = now
+                self.hits += 1
+                return row[0]
+
+            if self.near_duplicate_threshold is not None:
+                sql = self._find_near_duplicate(normalized, fingerprint, now, vocabulary)
+                if sql is not None:
+                    self.near_hits += 1
+                    return sql
+
+            self.misses += 1
+            return None
+
+    def put(self, nl_query: str, fingerprint: str, sql: str):
+        """Store the SQL generated for a question and evict stale entries."""
+        normalized = self.normalize(nl_query)
+        now = time.time()
+
+        with self._lock:
+            # the LRU eviction below needs the access times of recent hits
+            self._write_accessed()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO nl_sql_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (self._key(normalized, fingerprint), fingerprint, normalized, sql, now, now)
+            )
+            # entries for an older schema/data version can never match again
+            self.conn.execute("DELETE FROM nl_sql_cache WHERE fingerprint != ?", (fingerprint,))
+            self.conn.execute("DELETE FROM nl_sql_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            self.conn.execute(
+                """
+                DELETE FROM nl_sql_cache WHERE key IN (
+                    SELECT key FROM nl_sql_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,)
+            )
+            self.conn.commit()
+            self._index = None
+
+    def clear(self):
+        """Drop every cached translation."""
+        with self._lock:
+            self.conn.execute("DELETE FROM nl_sql_cache")
+            self.conn.commit()
+            self._index = None
+            self._accessed.clear()
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size."""
+        with self._lock:
+            size = self.conn.execute("SELECT COUNT(*) FROM nl_sql_cache").fetchone()[0]
+        return {"hits": self.hits, "near_hits": self.near_hits, "misses": self.misses, "entries": size}
+
+    def _find_near_duplicate(self, normalized: str, fingerprint: str, now: float,
+                             vocabulary: Optional[Iterable[str]] = None) -> Optional[str]:
+        """
+        Look up the most similar cached question with the same TF-IDF scheme
+        KBClient uses. Only questions that mention exactly the same numeric
+        tokens (years, quarters, percentages) and the same `vocabulary`
+        values are considered, so "2025Q1" is never served the SQL for
+        "2025Q2", nor "Cardiology" the SQL for "Oncology".
+        """
+        if self._index is None or self._index[0] != fingerprint:
+            rows = self.conn.execute(
+                "SELECT nl_query, sql, created_at FROM nl_sql_cache WHERE fingerprint = ?",
+                (fingerprint,)
+            ).fetchall()
+            if not rows:
+                return None
+            vectorizer = TfidfVectorizer()
+            vectors = vectorizer.fit_transform([row[0] for row in rows])
+            self._index = (fingerprint, vectorizer, vectors, rows)
+
+        _, vectorizer, vectors, rows = self._index
+        sims = cosine_similarity(vectorizer.transform([normalized]), vectors).flatten()
+
+        vocabulary = list(vocabulary or [])
+        wanted = self._guard_tokens(normalized, vocabulary)
+        for idx in sims.argsort()[::-1]:
+            if sims[idx] < self.near_duplicate_threshold:
+                break
+            cached_query, sql, created_at = rows[idx]
+            if now - created_at <= self.ttl_seconds and self._guard_tokens(cached_query, vocabulary) == wanted:
+                return sql
+        return None
+
+    @classmethod
+    def _guard_tokens(cls, normalized: str, vocabulary) -> tuple:
+        """What a near duplicate must share with the question: numeric tokens and vocabulary values."""
+        numeric = {token for token in re.findall(r"\w+", normalized) if any(ch.isdigit() for ch in token)}
+        text = normalized.replace("_", " ")
+        named = set()
+        for value in vocabulary:
+            words = cls.normalize(str(value)).replace("_", " ")
+            # case-insensitive, "_" as a space, optionally plural ("Webinars")
+            if words and re.search(rf"\b{re.escape(words)}s?\b", text):
+                named.add(value)
+        return numeric, named
+
+    def _write_accessed(self):
+        """Write the access times of pending hits; the caller holds the lock and commits."""
+        if self._accessed:
+            self.conn.executemany(
+                "UPDATE nl_sql_cache SET last_access = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._accessed.items()]
+            )
+            self._accessed.clear()
+
+    def close(self):
+        """Write pending access times and close the underlying SQLite connection."""
+        with self._lock:
+            self._write_accessed()
+            self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,103 @@
+import re
+import uuid
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import pandas as pd
+
+# what register() hands out
+HANDLE_PATTERN = re.compile(r"^ds_[0-9a-f]{8}$")
+
+# dataset that datasets registered in the current context derive from (see DatasetRegistry.scope)
+_scope = ContextVar("dataset_scope", default=None)
+
+
+class DatasetRegistry:
+    """
+    Process-wide store of retrieved DataFrames, addressed by short string
+    handles. Lets the analyzer hand the LLM a handle ("ds_1a2b3c4d") instead
+    of the rows themselves; tools resolve the handle back to the DataFrame
+    server-side.
+    """
+
+    def __init__(self, max_datasets: int = 256):
+        """
+        Args:
+            max_datasets (int): Maximum number of datasets kept; the least
+                                recently used are dropped beyond that.
+        """
+        self.max_datasets = max_datasets
+        self._datasets = OrderedDict()
+        # handle -> handles of the datasets derived from it, released along with it
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def register(self, df: pd.DataFrame, parent: str = None) -> str:
+        """
+        Store a DataFrame and return its handle.
+
+        Args:
+            parent (str): Handle of the dataset `df` was derived from (e.g. a
+                          tool's filtered rows); it is released with its parent.
+                          Defaults to the enclosing scope() handle, if any.
+        """
+        if parent is None:
+            parent = _scope.get()
+        handle = f"ds_{uuid.uuid4().hex[:8]}"
+        with self._lock:
+            self._datasets[handle] = df
+            if parent is not None:
+                self._children.setdefault(parent, set()).add(handle)
+            while len(self._datasets) > self.max_datasets:
+                self._drop(next(iter(self._datasets)))
+        return handle
+
+    @contextmanager
+    def scope(self, handle: str):
+        """
+        Within the block (and the threads and tasks it starts), datasets
+        registered without an explicit parent are tied to `handle`, e.g. the
+        results of tools an agent runs on a table rather than on its handle.
+        """
+        token = _scope.set(handle)
+        try:
+            yield
+        finally:
+            _scope.reset(token)
+
+    def _drop(self, handle: str):
+        """Remove a dataset and everything derived from it. Caller holds the lock."""
+        self._datasets.pop(handle, None)
+        for child in self._children.pop(handle, ()):
+            self._drop(child)
+
+    def get(self, handle: str) -> pd.DataFrame:
+        """Return the DataFrame for a handle (KeyError if unknown or evicted)."""
+        with self._lock:
+            df = self._datasets[handle]
+            self._datasets.move_to_end(handle)
+            return df
+
+    def release(self, handle: str):
+        """Forget a dataset and the datasets derived from it."""
+        with self._lock:
+            self._drop(handle)
+
+    def __contains__(self, handle) -> bool:
+        with self._lock:
+            return handle in self._datasets
+
+    @staticmethod
+    def is_handle(data) -> bool:
+        """True if `data` looks like a handle, registered or not."""
+        return isinstance(data, str) and bool(HANDLE_PATTERN.match(data))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._datasets)
+
+
+# shared by the analyzer and the tools
+datasets = DatasetRegistry()
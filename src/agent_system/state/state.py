@@ -16,10 +16,12 @@ class State(TypedDict):
     
     # sqlRetriever outputs
     extracted_df: pandas.DataFrame
+    segment_filters: dict # brand_area/quarter/tactic values a template result was filtered on (template results only)
     
     # kbRetriever outputs
     best_score: float
     doc: str
+    passages: list # top passages, at most one per document, each with its "score"
     
     # analyzer outputs
     analysis: str
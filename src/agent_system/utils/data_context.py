@@ -0,0 +1,163 @@
+import json
+from typing import Callable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from agent_system.utils.tools import summarize_df
+from agent_system.utils.metrics import with_metrics
+
+# rough characters-per-token ratio used to estimate prompt size without a tokenizer
+CHARS_PER_TOKEN = 4
+
+GROUP_COLUMNS = ["brand_area", "quarter", "tactic"]
+
+# rows serialized to estimate the JSON size of a whole result
+SAMPLE_ROWS = 20
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate for a piece of prompt text."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _to_json(df: pd.DataFrame) -> str:
+    return df.to_json(orient="records", double_precision=4)
+
+
+def _tokens_per_row(df: pd.DataFrame) -> float:
+    """Estimated tokens per row of `df` as JSON, from its first SAMPLE_ROWS rows."""
+    sample = df.head(SAMPLE_ROWS)
+    return estimate_tokens(_to_json(sample)) / max(len(sample), 1)
+
+
+def _full_json(df: pd.DataFrame, budget: int) -> Optional[str]:
+    """
+    The JSON of all of `df` if it fits in `budget` tokens, otherwise None.
+    Row JSON sizes are roughly uniform, so a frame whose estimate is well
+    over budget is rejected without serializing it.
+    """
+    if len(df) > SAMPLE_ROWS and _tokens_per_row(df) * len(df) > 2 * budget:
+        return None
+    text = _to_json(df)
+    return text if estimate_tokens(text) <= budget else None
+
+
+def _fit_rows(df: pd.DataFrame, budget: int) -> pd.DataFrame:
+    """The longest prefix of `df` whose JSON fits in `budget` tokens."""
+    if df.empty or _full_json(df, budget) is not None:
+        return df
+    # one proportional cut plus a final trim is enough
+    n = max(0, int(budget / _tokens_per_row(df)))
+    while n > 0 and estimate_tokens(_to_json(df.head(n))) > budget:
+        n = int(n * 0.8)
+    return df.head(n)
+
+
+def pack_passages(passages: List[dict], token_budget: int = 1500) -> str:
+    """
+    Text of the best knowledge base passages that fit in `token_budget`
+    (estimated) tokens. Passages are taken in score order; one that doesn't
+    fit is skipped in favour of shorter, lower-scoring ones.
+
+    Parameters:
+    - passages: Passages with "text", "score" and optionally "doc_id"/"title"
+    - token_budget: Maximum size of the returned text, in estimated tokens
+    """
+    packed: List[str] = []
+    remaining = token_budget
+    for passage in sorted(passages, key=lambda p: p.get("score", 0.0), reverse=True):
+        source = " - ".join(str(passage[key]) for key in ("doc_id", "title") if passage.get(key))
+        text = f"[{source}] (score {passage.get('score', 0.0):.3f}) {passage['text']}"
+        cost = estimate_tokens(text)
+        if cost > remaining:
+            continue
+        packed.append(text)
+        remaining -= cost
+    return "\n".join(packed)
+
+
+def build_data_context(df: pd.DataFrame, token_budget: int = 6000, top_k: int = 5,
+                       outlier_z: float = 3.0, rank_by: str = "roi",
+                       summary: Union[pd.DataFrame, Callable[[], Optional[pd.DataFrame]]] = None) -> str:
+    """
+    Text describing a retrieved result set for the analyzer prompt, kept
+    within `token_budget` (estimated) tokens.
+
+    If every row fits, the rows are included verbatim as JSON. Otherwise
+    sections are added in priority order while they fit: an overview,
+    a per-group metric summary (at most half the budget), the top and
+    bottom `top_k` rows by `rank_by`, rows whose `rank_by` is more than
+    `outlier_z` standard deviations from the mean (at most a sixth of the
+    budget), and finally as many raw rows as the remaining budget allows.
+
+    Parameters:
+    - df: The retrieved rows
+    - token_budget: Maximum size of the returned text, in estimated tokens
+    - top_k: Number of best and worst rows to include
+    - outlier_z: z-score beyond which a row counts as an outlier
+    - rank_by: Metric used for top/bottom rows and outliers
+    - summary: Per-group statistics already computed for exactly these rows
+      (e.g. sql_tools.cube_summary_sql), used instead of summarizing them here;
+      or a callable returning them (or None), only called if the rows don't fit
+    """
+    full = _full_json(df, token_budget)
+    if full is not None:
+        return full
+    if callable(summary):
+        summary = summary()
+
+    df = with_metrics(df, ("roi", "ctr", "conversion_rate"))
+    sections: List[str] = []
+    remaining = token_budget
+
+    def add(title: str, body: str) -> bool:
+        nonlocal remaining
+        text = f"{title}:\n{body}"
+        cost = estimate_tokens(text)
+        if cost > remaining:
+            return False
+        sections.append(text)
+        remaining -= cost
+        return True
+
+    numeric = df.select_dtypes(include="number")
+    overview = {
+        "rows": len(df),
+        "columns": list(df.columns),
+        "numeric_stats": json.loads(numeric.agg(["mean", "std", "min", "max"]).round(4).to_json()),
+    }
+    add(f"The result has {len(df)} rows, too many to include in full. Overview", json.dumps(overview))
+
+    if summary is not None:
+        group_by = [col for col in GROUP_COLUMNS if col in summary.columns]
+    else:
+        group_by = [col for col in GROUP_COLUMNS if col in df.columns]
+        if group_by and {"conversions", "revenue", "spend"} <= set(df.columns):
+            summary = summarize_df(df, group_by=group_by)
+    if summary is not None:
+        rows = _fit_rows(summary, min(remaining, token_budget // 2) - 50)
+        if not rows.empty:
+            title = f"Summary by {', '.join(group_by)}"
+            if len(rows) < len(summary):
+                title += f" (first {len(rows)} of {len(summary)} groups)"
+            add(title, _to_json(rows))
+
+    if rank_by in df.columns:
+        ranked = df.dropna(subset=[rank_by])
+        add(f"Top {top_k} rows by {rank_by}", _to_json(ranked.nlargest(top_k, rank_by)))
+        add(f"Bottom {top_k} rows by {rank_by}", _to_json(ranked.nsmallest(top_k, rank_by)))
+
+        values = ranked[rank_by]
+        std = values.std()
+        if std and not np.isnan(std):
+            outliers = ranked[np.abs(values - values.mean()) > outlier_z * std]
+            outliers = _fit_rows(outliers, min(remaining, token_budget // 6) - 50)
+            if not outliers.empty:
+                add(f"Outliers by {rank_by} (|z| > {outlier_z})", _to_json(outliers))
+
+    sample = _fit_rows(df, remaining - 50)
+    if not sample.empty:
+        add(f"First {len(sample)} of {len(df)} raw rows", _to_json(sample))
+
+    return "\n\n".join(sections)
@@ -0,0 +1,187 @@
+import threading
+import weakref
+from collections import deque
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+# Derived campaign metrics, each computed in one vectorized pass over the raw
+# columns and cached per DataFrame (and shared with the subsets filtered from
+# it), so chained tool calls on the same dataset (summaries, per-tactic
+# metrics, stability, ...) don't recompute them.
+#
+# Zero denominators give NaN (not inf), matching the NULLIF(...) versions in
+# sql_tools.DERIVED_METRICS.
+
+RAW_COLUMNS = ("spend", "impressions", "clicks", "conversions", "revenue")
+
+# name -> (numerator, denominator); roi subtracts spend from the numerator
+METRIC_INPUTS = {
+    "roi": ("revenue", "spend"),
+    "ctr": ("clicks", "impressions"),
+    "conversion_rate": ("conversions", "clicks"),
+    "cpa": ("spend", "conversions"),
+    "cpc": ("spend", "clicks"),
+    "roas": ("revenue", "spend"),
+}
+
+METRICS = tuple(METRIC_INPUTS)
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    out = np.full(len(numerator), np.nan)
+    np.divide(numerator, denominator, out=out, where=denominator != 0)
+    return out
+
+
+def compute_metric(df: pd.DataFrame, name: str) -> Optional[np.ndarray]:
+    """
+    Derived metric `name` as a float64 array aligned with the rows of `df`,
+    or None if it isn't a known metric or its inputs aren't columns of `df`.
+    """
+    if name not in METRIC_INPUTS:
+        return None
+    numerator, denominator = METRIC_INPUTS[name]
+    if numerator not in df.columns or denominator not in df.columns:
+        return None
+    values = df[numerator].to_numpy(dtype=np.float64, na_value=np.nan)
+    if name == "roi":
+        values = values - df["spend"].to_numpy(dtype=np.float64, na_value=np.nan)
+    return _ratio(values, df[denominator].to_numpy(dtype=np.float64, na_value=np.nan))
+
+
+def compute_metrics(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Every derived metric whose inputs are present in `df` (see compute_metric)."""
+    metrics = {name: compute_metric(df, name) for name in METRICS}
+    return {name: values for name, values in metrics.items() if values is not None}
+
+
+class _Entry:
+    __slots__ = ("ref", "metrics", "parent", "positions")
+
+    def __init__(self, ref, parent=None, positions=None):
+        self.ref = ref
+        # name -> array (None if it can't be derived), filled on first use of each metric
+        self.metrics = {}
+        # weakref to the DataFrame this one was filtered from, and the row positions taken from it
+        self.parent = parent
+        self.positions = positions
+
+
+class MetricCache:
+    """
+    Derived metric arrays per DataFrame, each computed on first use and held
+    only as long as the DataFrame itself is alive. DataFrames are treated as
+    immutable once their metrics have been computed, as they are throughout
+    the workflow.
+
+    A DataFrame filtered from another one (see derive(), used by
+    tools.filter_df) takes its metrics from the parent's cached arrays,
+    indexed by the rows it kept, so chained tool calls on subsets of one
+    dataset compute each metric once for the whole dataset.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        # keys of entries whose DataFrame was garbage collected; the weakref
+        # callbacks only append here (they may run while _lock is held)
+        self._dead = deque()
+        self.hits = 0
+        self.misses = 0
+
+    def _on_collect(self, key, dead_ref):
+        self._dead.append((key, dead_ref))
+
+    def _purge(self):
+        """Drop entries of collected DataFrames. Caller holds the lock."""
+        while self._dead:
+            key, dead_ref = self._dead.popleft()
+            entry = self._entries.get(key)
+            # the id may already have been reused by a newer DataFrame
+            if entry is not None and entry.ref is dead_ref:
+                del self._entries[key]
+
+    def _entry(self, df: pd.DataFrame) -> _Entry:
+        """The live entry for `df`, created if needed. Caller holds the lock."""
+        self._purge()
+        key = id(df)
+        entry = self._entries.get(key)
+        if entry is None or entry.ref() is not df:
+            entry = _Entry(weakref.ref(df, lambda dead, key=key: self._on_collect(key, dead)))
+            self._entries[key] = entry
+        return entry
+
+    def derive(self, child: pd.DataFrame, parent: pd.DataFrame, positions: np.ndarray):
+        """Record that `child` holds the rows of `parent` at `positions` (in order)."""
+        with self._lock:
+            parent_ref = self._entry(parent).ref
+            entry = self._entry(child)
+            entry.parent, entry.positions = parent_ref, positions
+
+    def metric(self, df: pd.DataFrame, name: str) -> Optional[np.ndarray]:
+        """Metric `name` for the rows of `df`, computed (or taken from its parent's) on first use."""
+        with self._lock:
+            entry = self._entry(df)
+            if name in entry.metrics:
+                self.hits += 1
+                return entry.metrics[name]
+            self.misses += 1
+            parent = entry.parent() if entry.parent is not None else None
+            positions = entry.positions
+
+        values = None
+        if parent is not None:
+            base = self.metric(parent, name)
+            if base is not None:
+                values = base[positions]
+        if values is None:
+            values = compute_metric(df, name)
+
+        with self._lock:
+            self._entry(df).metrics[name] = values
+        return values
+
+    def get(self, df: pd.DataFrame, names: Iterable[str] = METRICS) -> Dict[str, np.ndarray]:
+        """The metrics among `names` that can be derived for `df`."""
+        metrics = {name: self.metric(df, name) for name in names}
+        return {name: values for name, values in metrics.items() if values is not None}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._dead.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._purge()
+            return len(self._entries)
+
+
+# shared by the analysis tools and the analyzer's data context
+metric_cache = MetricCache()
+
+
+def with_metrics(df: pd.DataFrame, names: Iterable[str] = METRICS) -> pd.DataFrame:
+    """
+    `df` with the requested derived metrics added as columns. Metrics that
+    are already columns are kept as they are; ones whose inputs are missing
+    are skipped. Returns `df` itself when there is nothing to add.
+    """
+    missing = [name for name in names if name not in df.columns]
+    if not missing:
+        return df
+
+    derived = metric_cache.get(df, missing)
+    return df.assign(**derived) if derived else df
+
+
+def metric_values(df: pd.DataFrame, name: str):
+    """
+    Values of metric `name` for each row of `df`: the column if there is one,
+    otherwise the cached derived array. None if it can't be computed.
+    """
+    if name in df.columns:
+        return df[name].to_numpy(dtype=np.float64, na_value=np.nan)
+    return metric_cache.metric(df, name)
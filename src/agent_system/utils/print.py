@@ -1,77 +1,243 @@
+import os
+import sys
+import queue
+import atexit
+import logging
+import logging.handlers
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import json
 import pandas as pd
 
-def append_to_file(relative_path: str, text: str):
+# Console output of the agents goes through the "agent_system" logger:
+# - INFO: agent arrivals, steps and state updates
+# - DEBUG: full state dumps, DataFrame summaries and data/document previews
+# - WARNING and up: problems, still shown in quiet mode
+# Every print_* function checks the level before building any text, so with
+# LOG_LEVEL=quiet (WARNING) nothing is copied, described or formatted.
+# Records are written inline, in order with anything else printed to stdout
+# (the REPL's streamed analysis). LOG_ASYNC=1 hands them to a background
+# writer thread instead; records are still formatted by the logging thread
+# (QueueHandler.prepare), so that only moves the write itself.
+
+logger = logging.getLogger("agent_system")
+
+LOG_LEVELS = {"debug": logging.DEBUG, "info": logging.INFO, "quiet": logging.WARNING,
+              "warning": logging.WARNING, "error": logging.ERROR}
+
+class _StdoutHandler(logging.StreamHandler):
+    """Writes to whatever sys.stdout is at the time, so redirect_stdout() still captures the output."""
+
+    def __init__(self):
+        super().__init__()
+        self.setFormatter(logging.Formatter("%(message)s"))
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+_listener = None
+
+def configure_logging(level: Optional[str] = None, background: Optional[bool] = None):
     """
-    Append a string to a file in the 'src/data' directory, one level up from this file.
+    Set up the agent_system logger.
 
     Parameters:
-    - relative_path (str): Path relative to the 'src/data' directory, e.g., "report.txt"
-    - text (str): Text to append
+    - level: One of LOG_LEVELS (e.g. "quiet" for production). Defaults to LOG_LEVEL, or "debug";
+      an unknown name falls back to "debug" with a warning.
+    - background: Hand records to a writer thread instead of writing them inline.
+      Defaults to LOG_ASYNC (off unless "1"). Output printed directly, like
+      the REPL's streamed analysis, is then no longer ordered with the records.
     """
+    global _listener
+    requested = (level or os.getenv("LOG_LEVEL", "debug")).lower()
+    level = requested if requested in LOG_LEVELS else "debug"
+    if background is None:
+        background = os.getenv("LOG_ASYNC", "0") == "1"
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    logger.setLevel(LOG_LEVELS[level])
+    logger.propagate = False
+    if background:
+        records = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(records, _StdoutHandler())
+        _listener.start()
+        logger.addHandler(logging.handlers.QueueHandler(records))
+    else:
+        logger.addHandler(_StdoutHandler())
+    if level != requested:
+        logger.warning("Unknown log level %r (expected one of %s); using %r",
+                       requested, ", ".join(LOG_LEVELS), level)
+
+def flush_logging():
+    """Wait until every record logged so far has been written."""
+    if _listener is not None:
+        # stopping drains the queue; start a fresh writer thread afterwards
+        _listener.stop()
+        _listener.start()
+
+@contextmanager
+def quiet_logging():
+    """Within the block, show only warnings and errors (the level is restored afterwards)."""
+    previous = logger.level
+    logger.setLevel(max(previous, logging.WARNING))
+    try:
+        yield
+    finally:
+        logger.setLevel(previous)
+
+configure_logging()
+atexit.register(lambda: _listener and _listener.stop())
+
+def _enabled(level: int) -> bool:
+    return logger.isEnabledFor(level)
+
+def _emit(level: int, lines):
+    logger.log(level, "\n".join(lines))
+
+# written after every report entry
+REPORT_SEPARATOR = "\n\n-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-\n\n"
+
+def _data_file(relative_path: str) -> Path:
     src_dir = Path(__file__).resolve().parents[2]  # one level up
 
     file_path = src_dir / "data" / relative_path
 
     file_path.parent.mkdir(parents=True, exist_ok=True)
+    return file_path
+
+def append_to_file(relative_path: str, text: str):
+    """
+    Append a string to a file in the 'src/data' directory, one level up from this file.
+
+    Parameters:
+    - relative_path (str): Path relative to the 'src/data' directory, e.g., "report.txt"
+    - text (str): Text to append
+    """
+    file_path = _data_file(relative_path)
 
     with file_path.open("a", encoding="utf-8") as f:
-        f.write(text + "\n\n-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-\n\n")  # add newlines for each append
+        f.write(text + REPORT_SEPARATOR)  # add newlines for each append
 
-    print(f"Appended text to {file_path}")
+    logger.info("Appended text to %s", file_path)
+
+class ReportWriter:
+    """
+    Streaming counterpart of append_to_file: text is appended and flushed as
+    it arrives instead of once the whole entry is known. Use as a context manager.
+    """
+
+    def __init__(self, relative_path: str):
+        self.path = _data_file(relative_path)
+        self._file = self.path.open("a", encoding="utf-8")
+
+    def write(self, text: str):
+        self._file.write(text)
+        self._file.flush()
+
+    def end_entry(self):
+        """Finish the current entry with the same separator append_to_file uses."""
+        self.write(REPORT_SEPARATOR)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
 def print_agent_arrival(agent_name: str):
     """Print a clean arrival message for an agent."""
-    print(f"\n{'='*60}")
-    print(f"{agent_name.upper()} AGENT - ARRIVAL")
-    print(f"{'='*60}")
+    if _enabled(logging.INFO):
+        _emit(logging.INFO, [f"\n{'='*60}", f"{agent_name.upper()} AGENT - ARRIVAL", f"{'='*60}"])
 
 def print_agent_step(agent_name: str, step_description: str):
     """Print the current step an agent is performing."""
-    print(f"{agent_name.upper()} - {step_description}")
+    logger.info("%s - %s", agent_name.upper(), step_description)
+
+class lazy:
+    """Log argument computed only if the record is actually shown, e.g. lazy(lambda: df.to_string())."""
+
+    __slots__ = ("func",)
+
+    def __init__(self, func):
+        self.func = func
+
+    def __str__(self):
+        return str(self.func())
+
+def print_detail(message: str, *args):
+    """Print a diagnostic line (preview, generated SQL, ...); %-style args are only formatted when shown."""
+    logger.debug(message, *args)
 
 def print_state_update(agent_name: str, updates: Dict[str, Any]):
     """Print what the agent is updating in the state."""
-    print(f"{agent_name.upper()} - UPDATING STATE:")
+    if not _enabled(logging.INFO):
+        return
+    lines = [f"{agent_name.upper()} - UPDATING STATE:"]
     for key, value in updates.items():
-        if isinstance(value, str) and len(value) > 100:
+        if isinstance(value, pd.DataFrame):
+            display_value = f"DataFrame ({value.shape[0]} rows × {value.shape[1]} columns)"
+        elif isinstance(value, str) and len(value) > 100:
             display_value = value[:100] + "..."
+        elif isinstance(value, list) and len(value) > 1:
+            display_value = f"{len(value)} items"
         else:
             display_value = value
-        print(f"   • {key}: {display_value}")
+        lines.append(f"   • {key}: {display_value}")
+    _emit(logging.INFO, lines)
 
-def print_final_state(agent_name: str, state: Dict[str, Any]):
-    """Print the current state after agent completion."""
-    print(f"\n{agent_name.upper()} - FINAL STATE:")
-    print(f"{'─'*50}")
-    
+def print_final_state(agent_name: str, state: Dict[str, Any], updates: Optional[Dict[str, Any]] = None):
+    """
+    Print the current state after agent completion: `state` with `updates`
+    applied. Pass the node's updates separately rather than a merged copy;
+    the merge only happens when the output is actually shown (DEBUG).
+    """
+    if not _enabled(logging.DEBUG):
+        return
+    if updates:
+        state = {**state, **updates}
+
+    lines = [f"\n{agent_name.upper()} - FINAL STATE:", f"{'─'*50}"]
     for key, value in state.items():
         if value is not None:
             if key == "extracted_df" and hasattr(value, 'shape'):
-                print_dataframe_pandas_style(value)
+                lines.append(format_dataframe_pandas_style(value))
             elif key == "analysis" and isinstance(value, str) and len(value) > 200:
-                print(f"   {key}: {value[:200]}...")
+                lines.append(f"   {key}: {value[:200]}...")
             elif key == "doc" and isinstance(value, str) and len(value) > 100:
-                print(f"   {key}: {value[:100]}...")
+                lines.append(f"   {key}: {value[:100]}...")
+            elif key == "passages" and isinstance(value, list):
+                lines.append(f"   {key}: {len(value)} passages")
             else:
-                print(f"   {key}: {value}")
+                lines.append(f"   {key}: {value}")
     
-    print(f"{'─'*50}")
-    print(f"{agent_name.upper()} AGENT COMPLETED")
-    print(f"{'='*60}\n")
+    lines += [f"{'─'*50}", f"{agent_name.upper()} AGENT COMPLETED", f"{'='*60}\n"]
+    _emit(logging.DEBUG, lines)
 
-def print_state_clear(state: Dict[str, Any], title: str = "STATE"):
+def format_state_clear(state: Dict[str, Any], title: str = "STATE"):
     """
-    Print State in a clear and concise way, better than Python's default dict printing.
+    Format State in a clear and concise way, better than Python's default dict printing.
     
     Parameters:
     - state: The State dictionary to print
     - title: Optional title for the state display
     """
-    print(f"\n{title.upper()}")
-    print(f"{'═'*60}")
+    lines = []
+    lines.append(f"\n{title.upper()}")
+    lines.append(f"{'═'*60}")
     
     user_input_fields = ['query']
     orchestrator_fields = ['task_type']
@@ -79,51 +245,53 @@ def print_state_clear(state: Dict[str, Any], title: str = "STATE"):
     kb_fields = ['best_score', 'doc']
     analyzer_fields = ['analysis']
     
-    print("USER INPUT:")
+    lines.append("USER INPUT:")
     for field in user_input_fields:
         if field in state and state[field] is not None:
             value = state[field]
             if isinstance(value, str) and len(value) > 80:
-                print(f"   • {field}: {value[:80]}...")
+                lines.append(f"   • {field}: {value[:80]}...")
             else:
-                print(f"   • {field}: {value}")
+                lines.append(f"   • {field}: {value}")
     
-    print("\nORCHESTRATOR:")
+    lines.append("\nORCHESTRATOR:")
     for field in orchestrator_fields:
         if field in state and state[field] is not None:
-            print(f"   • {field}: {state[field]}")
+            lines.append(f"   • {field}: {state[field]}")
     
-    print("\nSQL RETRIEVER:")
+    lines.append("\nSQL RETRIEVER:")
     for field in sql_fields:
         if field in state and state[field] is not None:
             if field == "extracted_df" and hasattr(state[field], 'shape'):
-                print_dataframe_pandas_style(state[field])
+                lines.append(format_dataframe_pandas_style(state[field]))
             else:
-                print(f"   • {field}: {state[field]}")
+                lines.append(f"   • {field}: {state[field]}")
     
-    print("\nKB RETRIEVER:")
+    lines.append("\nKB RETRIEVER:")
     for field in kb_fields:
         if field in state and state[field] is not None:
             value = state[field]
             if field == "doc" and isinstance(value, str) and len(value) > 100:
-                print(f"   • {field}: {value[:100]}...")
+                lines.append(f"   • {field}: {value[:100]}...")
             else:
-                print(f"   • {field}: {value}")
+                lines.append(f"   • {field}: {value}")
     
-    print("\nANALYZER:")
+    lines.append("\nANALYZER:")
     for field in analyzer_fields:
         if field in state and state[field] is not None:
             value = state[field]
             if isinstance(value, str) and len(value) > 200:
-                print(f"   • {field}: {value[:200]}...")
+                lines.append(f"   • {field}: {value[:200]}...")
             else:
-                print(f"   • {field}: {value}")
+                lines.append(f"   • {field}: {value}")
+    
+    lines.append(f"{'═'*60}")
     
-    print(f"{'═'*60}")
+    return "\n".join(lines)
 
-def print_dataframe_summary(df: pd.DataFrame, max_rows: int = 10, max_cols: int = 8):
+def format_dataframe_summary(df: pd.DataFrame, max_rows: int = 10, max_cols: int = 8):
     """
-    Print a comprehensive Pandas-esque summary of a DataFrame.
+    Format a comprehensive Pandas-esque summary of a DataFrame.
     
     Parameters:
     - df: pandas DataFrame to print
@@ -131,56 +299,58 @@ def print_dataframe_summary(df: pd.DataFrame, max_rows: int = 10, max_cols: int
     - max_cols: Maximum number of columns to display (default: 8)
     """
     if df is None or df.empty:
-        print("   DataFrame: Empty or None")
-        return
+        return "   DataFrame: Empty or None"
     
-    print(f"   DataFrame Summary:")
-    print(f"   ┌─ Shape: {df.shape[0]} rows × {df.shape[1]} columns")
-    print(f"   ├─ Memory usage: {df.memory_usage(deep=True).sum() / 1024:.2f} KB")
-    print(f"   ├─ Index type: {type(df.index).__name__}")
-    print(f"   └─ Column dtypes:")
+    lines = []
+    lines.append(f"   DataFrame Summary:")
+    lines.append(f"   ┌─ Shape: {df.shape[0]} rows × {df.shape[1]} columns")
+    lines.append(f"   ├─ Memory usage: {df.memory_usage(deep=True).sum() / 1024:.2f} KB")
+    lines.append(f"   ├─ Index type: {type(df.index).__name__}")
+    lines.append(f"   └─ Column dtypes:")
     
     for i, (col, dtype) in enumerate(df.dtypes.items()):
         if i < max_cols:
-            print(f"      • {col}: {dtype}")
+            lines.append(f"      • {col}: {dtype}")
         elif i == max_cols:
-            print(f"      • ... and {len(df.columns) - max_cols} more columns")
+            lines.append(f"      • ... and {len(df.columns) - max_cols} more columns")
             break
     
-    print(f"\n   Data Preview (first {min(max_rows, len(df))} rows):")
-    print("   " + "─" * 80)
+    lines.append(f"\n   Data Preview (first {min(max_rows, len(df))} rows):")
+    lines.append("   " + "─" * 80)
     
     preview_df = df.head(max_rows)
     
     if len(df.columns) > max_cols:
         preview_df = preview_df.iloc[:, :max_cols]
-        print("   " + str(preview_df.to_string(index=True, max_cols=max_cols)).replace('\n', '\n   '))
-        print(f"   ... and {len(df.columns) - max_cols} more columns")
+        lines.append("   " + str(preview_df.to_string(index=True, max_cols=max_cols)).replace('\n', '\n   '))
+        lines.append(f"   ... and {len(df.columns) - max_cols} more columns")
     else:
-        print("   " + str(preview_df.to_string(index=True)).replace('\n', '\n   '))
+        lines.append("   " + str(preview_df.to_string(index=True)).replace('\n', '\n   '))
     
     numeric_cols = df.select_dtypes(include=['number']).columns
     if len(numeric_cols) > 0:
-        print(f"\n   Numeric Summary:")
-        print("   " + "─" * 50)
+        lines.append(f"\n   Numeric Summary:")
+        lines.append("   " + "─" * 50)
         stats = df[numeric_cols].describe()
-        print("   " + str(stats.to_string()).replace('\n', '\n   '))
+        lines.append("   " + str(stats.to_string()).replace('\n', '\n   '))
     
     categorical_cols = df.select_dtypes(include=['object', 'category']).columns
     if len(categorical_cols) > 0:
-        print(f"\n   Categorical Summary:")
-        print("   " + "─" * 50)
+        lines.append(f"\n   Categorical Summary:")
+        lines.append("   " + "─" * 50)
         for col in categorical_cols[:3]:            
-            print(f"   {col} value counts:")
+            lines.append(f"   {col} value counts:")
             value_counts = df[col].value_counts().head(5)
             for val, count in value_counts.items():
-                print(f"      • {val}: {count}")
+                lines.append(f"      • {val}: {count}")
             if len(df[col].unique()) > 5:
-                print(f"      • ... and {len(df[col].unique()) - 5} more unique values")
+                lines.append(f"      • ... and {len(df[col].unique()) - 5} more unique values")
+    
+    return "\n".join(lines)
 
-def print_dataframe_pandas_style(df: pd.DataFrame, max_rows: int = 15, max_cols: int = 10):
+def format_dataframe_pandas_style(df: pd.DataFrame, max_rows: int = 15, max_cols: int = 10):
     """
-    Print a DataFrame in a more authentic Pandas style with better formatting.
+    Format a DataFrame in a more authentic Pandas style with better formatting.
     
     Parameters:
     - df: pandas DataFrame to print
@@ -188,18 +358,18 @@ def print_dataframe_pandas_style(df: pd.DataFrame, max_rows: int = 15, max_cols:
     - max_cols: Maximum number of columns to display (default: 10)
     """
     if df is None or df.empty:
-        print("   DataFrame: Empty or None")
-        return
+        return "   DataFrame: Empty or None"
     
-    print(f"   DataFrame ({df.shape[0]} rows × {df.shape[1]} columns)")
-    print("   " + "=" * 60)
+    lines = []
+    lines.append(f"   DataFrame ({df.shape[0]} rows × {df.shape[1]} columns)")
+    lines.append("   " + "=" * 60)
     
-    print("   Index:")
-    print("   " + "─" * 40)
-    print(f"   RangeIndex: {df.index.start if hasattr(df.index, 'start') else 0} to {df.index.stop if hasattr(df.index, 'stop') else len(df)-1}, step {df.index.step if hasattr(df.index, 'step') else 1}")
+    lines.append("   Index:")
+    lines.append("   " + "─" * 40)
+    lines.append(f"   RangeIndex: {df.index.start if hasattr(df.index, 'start') else 0} to {df.index.stop if hasattr(df.index, 'stop') else len(df)-1}, step {df.index.step if hasattr(df.index, 'step') else 1}")
     
-    print(f"\n   Data columns (total {len(df.columns)} columns):")
-    print("   " + "─" * 40)
+    lines.append(f"\n   Data columns (total {len(df.columns)} columns):")
+    lines.append("   " + "─" * 40)
     
     col_info = []
     for i, (col, dtype) in enumerate(df.dtypes.items()):
@@ -210,52 +380,67 @@ def print_dataframe_pandas_style(df: pd.DataFrame, max_rows: int = 15, max_cols:
             col_info[-1] += f" ({null_count} null)"
     
     for line in col_info:
-        print(line)
+        lines.append(line)
     
     memory_usage = df.memory_usage(deep=True).sum()
-    print(f"\n   Memory usage: {memory_usage / 1024:.2f} KB")
+    lines.append(f"\n   Memory usage: {memory_usage / 1024:.2f} KB")
     
-    print(f"\n   Data Preview:")
-    print("   " + "─" * 60)
+    lines.append(f"\n   Data Preview:")
+    lines.append("   " + "─" * 60)
     
     preview_df = df.head(max_rows)
     
     if len(df.columns) > max_cols:
         preview_df = preview_df.iloc[:, :max_cols]
-        print("   " + str(preview_df.to_string(index=True, max_cols=max_cols, line_width=80)).replace('\n', '\n   '))
-        print(f"   ... and {len(df.columns) - max_cols} more columns")
+        lines.append("   " + str(preview_df.to_string(index=True, max_cols=max_cols, line_width=80)).replace('\n', '\n   '))
+        lines.append(f"   ... and {len(df.columns) - max_cols} more columns")
     else:
-        print("   " + str(preview_df.to_string(index=True, line_width=80)).replace('\n', '\n   '))
+        lines.append("   " + str(preview_df.to_string(index=True, line_width=80)).replace('\n', '\n   '))
     
     numeric_cols = df.select_dtypes(include=['number']).columns
     if len(numeric_cols) > 0:
-        print(f"\n   Summary Statistics:")
-        print("   " + "─" * 50)
+        lines.append(f"\n   Summary Statistics:")
+        lines.append("   " + "─" * 50)
         stats = df[numeric_cols].describe()
         stats_str = str(stats.to_string())
         for line in stats_str.split('\n'):
-            print("   " + line)
+            lines.append("   " + line)
     
     categorical_cols = df.select_dtypes(include=['object', 'category']).columns
     if len(categorical_cols) > 0:
-        print(f"\n   Categorical Data:")
-        print("   " + "─" * 50)
+        lines.append(f"\n   Categorical Data:")
+        lines.append("   " + "─" * 50)
         for col in categorical_cols[:3]:         
             unique_count = df[col].nunique()
-            print(f"   {col}: {unique_count} unique values")
+            lines.append(f"   {col}: {unique_count} unique values")
             if unique_count <= 10:               
                 value_counts = df[col].value_counts()
                 for val, count in value_counts.items():
-                    print(f"      • {val}: {count}")
+                    lines.append(f"      • {val}: {count}")
             else:                
                 value_counts = df[col].value_counts().head(5)
-                print(f"      Top values:")
+                lines.append(f"      Top values:")
                 for val, count in value_counts.items():
-                    print(f"      • {val}: {count}")
-                print(f"      ... and {unique_count - 5} more unique values")
+                    lines.append(f"      • {val}: {count}")
+                lines.append(f"      ... and {unique_count - 5} more unique values")
+    
+    return "\n".join(lines)
+
+def print_state_clear(state: Dict[str, Any], title: str = "STATE"):
+    """Print the output of format_state_clear (shown at DEBUG level)."""
+    if _enabled(logging.DEBUG):
+        logger.debug(format_state_clear(state, title))
+
+def print_dataframe_summary(df: pd.DataFrame, max_rows: int = 10, max_cols: int = 8):
+    """Print the output of format_dataframe_summary (shown at DEBUG level)."""
+    if _enabled(logging.DEBUG):
+        logger.debug(format_dataframe_summary(df, max_rows, max_cols))
+
+def print_dataframe_pandas_style(df: pd.DataFrame, max_rows: int = 15, max_cols: int = 10):
+    """Print the output of format_dataframe_pandas_style (shown at DEBUG level)."""
+    if _enabled(logging.DEBUG):
+        logger.debug(format_dataframe_pandas_style(df, max_rows, max_cols))
 
 def print_agent_error(agent_name: str, error: str):
     """Print an error message for an agent."""
-    print(f"\n{agent_name.upper()} AGENT ERROR:")
-    print(f"   {error}")
-    print(f"{'='*60}\n")
+    logger.error("\n%s AGENT ERROR:\n   %s\n%s\n", agent_name.upper(), error, '=' * 60)
@@ -0,0 +1,94 @@
+import re
+from typing import Dict, List, Optional
+
+# Precomputed SQL for the common query shapes: filters on brand area,
+# quarter (including ranges such as "2025Q1–Q2") and tactic, which is all
+# the retrieval step needs for questions like the ones in
+# data/sample_queries.txt. With SQL_TEMPLATES=1, sqlRetriever runs a
+# matching template before (or, on the async path, while) the LLM writes
+# its own SQL, and uses the template's rows when the match is confident.
+
+TABLE = "campaign_performance"
+FILTER_COLUMNS = ("brand_area", "quarter", "tactic")
+
+_QUARTER = re.compile(
+    r"\b(\d{4})\s*Q([1-4])(?:\s*(?:–|—|-|to|through)\s*(?:(\d{4})\s*)?Q([1-4]))?\b",
+    re.IGNORECASE
+)
+_QUARTER_YEAR_LAST = re.compile(r"\bQ([1-4])\s+(\d{4})\b", re.IGNORECASE)
+
+# things the filters can't express; with any of these the LLM's SQL is used instead
+_UNSUPPORTED = [
+    re.compile(r"\bcampaign(?:[\s_]*id)?\s*#?\s*\d+", re.IGNORECASE),
+    re.compile(r"[<>=]"),
+    re.compile(r"\b(?:more|less|greater|fewer|higher|lower)\s+than\s+\$?\d", re.IGNORECASE),
+    re.compile(r"\b(?:above|below|over|under|at least|at most|exceed\w*)\s+\$?\d", re.IGNORECASE),
+    # negations and comparisons: the named values may be the ones to leave out or compare against
+    re.compile(r"\b(?:exclud\w*|except|without|not|other|others|vs|versus|beat\w*|outperform\w*|"
+               r"compar\w*|relative to|rest of)\b", re.IGNORECASE),
+]
+
+
+def _variants(value: str) -> List[str]:
+    """Ways a filter value may be written: case-insensitive, '_' as a space, optionally plural."""
+    words = value.replace("_", " ").lower()
+    return [words, words + "s"]
+
+
+def _find_values(text: str, values: List[str]) -> List[str]:
+    found = []
+    for value in values:
+        pattern = r"\b(?:" + "|".join(re.escape(v) for v in _variants(value)) + r")\b"
+        if re.search(pattern, text):
+            found.append(value)
+    return found
+
+
+def _find_quarters(nl_query: str, quarters: List[str]) -> List[str]:
+    """Quarters mentioned in the query, expanding ranges against the known quarters."""
+    found = set()
+    for year, start, end_year, end in _QUARTER.findall(nl_query):
+        first = f"{year}Q{start}"
+        last = f"{end_year or year}Q{end}" if end else first
+        found.update(q for q in quarters if first <= q <= last)
+    for quarter, year in _QUARTER_YEAR_LAST.findall(nl_query):
+        found.update(q for q in quarters if q == f"{year}Q{quarter}")
+    return sorted(found)
+
+
+def _literal(value: str) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def match_template(nl_query: str, vocabulary: Dict[str, List[str]]) -> Optional[Dict]:
+    """
+    Match a question against the filter template.
+
+    Parameters:
+    - nl_query: The user's question
+    - vocabulary: Known values per filter column, e.g. {"brand_area": ["Cardiology", ...], ...}
+
+    Returns:
+    - None if the question names no brand area, quarter or tactic. Otherwise
+      a dict with "sql" (a SELECT * with the recognized filters), "filters"
+      and "confident": True when the question names a brand area and asks for
+      nothing the filters can't express (campaign ids, numeric thresholds,
+      negations, comparisons).
+    """
+    text = nl_query.lower().replace("_", " ")
+    filters = {
+        "brand_area": _find_values(text, vocabulary.get("brand_area", [])),
+        "quarter": _find_quarters(nl_query, vocabulary.get("quarter", [])),
+        "tactic": _find_values(text, vocabulary.get("tactic", [])),
+    }
+    if not any(filters.values()):
+        return None
+
+    clauses = [
+        f"{column} IN ({', '.join(_literal(v) for v in values)})"
+        for column, values in filters.items() if values
+    ]
+    sql = f"SELECT * FROM {TABLE} WHERE {' AND '.join(clauses)}"
+
+    confident = bool(filters["brand_area"]) and not any(p.search(nl_query) for p in _UNSUPPORTED)
+    return {"sql": sql, "filters": filters, "confident": confident}
@@ -0,0 +1,330 @@
+import re
+from typing import List, Optional
+
+import pandas as pd
+
+# SQL-backed versions of the analysis functions in tools.py. Each call is
+# compiled into one DuckDB query (filters, GROUP BY, stddev/median) over a
+# registered table, so aggregation happens in the engine and only the
+# aggregated result comes back to Python.
+
+# derived per-row metrics, computed in SQL when the source doesn't already have them
+# (the same set as metrics.METRIC_INPUTS)
+DERIVED_METRICS = {
+    "roi": "(revenue - spend) / NULLIF(spend, 0)",
+    "ctr": "clicks / NULLIF(impressions, 0)",
+    "conversion_rate": "conversions / NULLIF(clicks, 0)",
+    "cpa": "spend / NULLIF(conversions, 0)",
+    "cpc": "spend / NULLIF(clicks, 0)",
+    "roas": "revenue / NULLIF(spend, 0)",
+}
+
+GROUPABLE_COLUMNS = ("brand_area", "quarter", "tactic", "campaign_id")
+
+# Pre-aggregated cube over the three filter dimensions, built and kept up to
+# date by DuckDBClient: one row per cell of every grouping set (GROUP BY CUBE),
+# holding additive measures only (row counts, sums and sums of squares), so
+# cells can be merged with new rows and re-aggregated to any coarser level.
+# Means and sample standard deviations come out exactly; medians can't, and
+# stay on the raw rows.
+CUBE_DIMENSIONS = ("brand_area", "quarter", "tactic")
+CUBE_METRICS = ("roi", "ctr", "conversion_rate")
+CUBE_TOTALS = ("conversions", "revenue", "spend", "impressions", "clicks")
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# client used when a tool is handed a table name; set by the workflow
+_client = None
+
+
+def set_client(client):
+    """Register the DuckDBClient the SQL-backed tools run against."""
+    global _client
+    _client = client
+
+
+def get_client():
+    """Return the registered DuckDBClient."""
+    if _client is None:
+        raise RuntimeError("No DuckDBClient registered for SQL-backed tools; call set_client() first")
+    return _client
+
+
+def is_table_reference(data) -> bool:
+    """True if `data` names a table (as opposed to in-memory rows)."""
+    return isinstance(data, str) and bool(_IDENTIFIER.match(data))
+
+
+def _base_cte(client, source: str):
+    """
+    WITH clause exposing `source` (a table name or a SELECT statement) as
+    `base`, with any missing derived metrics added as columns.
+
+    Returns:
+        (cte_sql, column_names)
+    """
+    relation = source if _IDENTIFIER.match(source) else f"({source})"
+    columns = list(client.query(f"SELECT * FROM {relation} LIMIT 0").columns)
+
+    derived = [f"{expr} AS {name}" for name, expr in DERIVED_METRICS.items() if name not in columns]
+    select = ", ".join(["*"] + derived)
+
+    return f"WITH base AS (SELECT {select} FROM {relation})", columns + [name for name in DERIVED_METRICS if name not in columns]
+
+
+def _where(brand_area=None, quarter=None, tactic=None):
+    """WHERE clause (with ? placeholders) and its parameters for the standard filters."""
+    clauses, params = [], []
+    for column, value in (("brand_area", brand_area), ("quarter", quarter), ("tactic", tactic)):
+        if not value:
+            continue
+        values = value if isinstance(value, list) else [value]
+        clauses.append(f"{column} IN ({', '.join('?' for _ in values)})")
+        params.extend(values)
+    return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+
+def _check_columns(names, allowed):
+    for name in names:
+        if name not in allowed or not _IDENTIFIER.match(name):
+            raise ValueError(f"Unknown column: {name!r}")
+
+
+def roi_sql(client, campaign_id: int, source: str = "campaign_performance") -> pd.DataFrame:
+    """ROI for a single campaign (campaign_id, brand_area, roi)."""
+    cte, _ = _base_cte(client, source)
+    return client.query(
+        f"{cte} SELECT campaign_id, brand_area, ROUND(roi, 2) AS roi FROM base WHERE campaign_id = ?",
+        [campaign_id]
+    )
+
+
+def _with_metric(client, source: str, metric: str) -> pd.DataFrame:
+    """All rows of `source`, plus `metric` as a column if it isn't one already."""
+    relation = source if _IDENTIFIER.match(source) else f"({source})"
+    columns = client.query(f"SELECT * FROM {relation} LIMIT 0").columns
+    if metric in columns:
+        return client.query(f"SELECT * FROM {relation}")
+    return client.query(f"SELECT *, {DERIVED_METRICS[metric]} AS {metric} FROM {relation}")
+
+
+def ctr_sql(client, source: str = "campaign_performance") -> pd.DataFrame:
+    """All rows of `source` with a ctr column."""
+    return _with_metric(client, source, "ctr")
+
+
+def conversion_rate_sql(client, source: str = "campaign_performance") -> pd.DataFrame:
+    """All rows of `source` with a conversion_rate column."""
+    return _with_metric(client, source, "conversion_rate")
+
+
+def filter_sql(client, brand_area=None, quarter=None, tactic=None,
+               source: str = "campaign_performance") -> pd.DataFrame:
+    """Rows of `source` matching the given brand area(s), quarter(s) and tactic(s)."""
+    relation = source if _IDENTIFIER.match(source) else f"({source})"
+    where, params = _where(brand_area, quarter, tactic)
+    return client.query(f"SELECT * FROM {relation} {where}", params)
+
+
+def summarize_sql(client, group_by: Optional[List[str]] = None, brand_area=None, quarter=None, tactic=None,
+                  source: str = "campaign_performance") -> pd.DataFrame:
+    """
+    Mean/std/median of ROI, CTR and conversion rate plus conversion, revenue
+    and spend totals per group, same columns as tools.summarize_df.
+    """
+    if group_by is None:
+        group_by = ["brand_area", "tactic", "quarter"]
+
+    cte, columns = _base_cte(client, source)
+    _check_columns(group_by, set(columns) & set(GROUPABLE_COLUMNS))
+    where, params = _where(brand_area, quarter, tactic)
+    keys = ", ".join(group_by)
+
+    aggregates = []
+    for metric in ("roi", "ctr", "conversion_rate"):
+        aggregates += [
+            f"AVG({metric}) AS {metric}_mean",
+            f"STDDEV_SAMP({metric}) AS {metric}_std",
+            f"MEDIAN({metric}) AS {metric}_median",
+        ]
+    aggregates += ["SUM(conversions) AS conversions_sum", "SUM(revenue) AS revenue_sum", "SUM(spend) AS spend_sum"]
+
+    return client.query(
+        f"{cte} SELECT {keys}, {', '.join(aggregates)} FROM base {where} GROUP BY {keys} ORDER BY {keys}",
+        params
+    )
+
+
+def compare_tactics_sql(client, brand_areas: List[str], quarter: str,
+                        source: str = "campaign_performance") -> pd.DataFrame:
+    """Per brand area and tactic summary for one quarter, sorted by tactic then brand area."""
+    summary = summarize_sql(client, group_by=["brand_area", "tactic"], brand_area=brand_areas,
+                            quarter=quarter, source=source)
+    return summary.sort_values(by=["tactic", "brand_area"]).reset_index(drop=True)
+
+
+def metric_by_tactic_sql(client, brand_area: str, quarter: str, metric: str = "roi",
+                         source: str = "campaign_performance") -> pd.DataFrame:
+    """Mean/std/median of `metric` per tactic for one brand area and quarter, best mean first."""
+    cte, columns = _base_cte(client, source)
+    if metric not in columns or not _IDENTIFIER.match(metric):
+        return pd.DataFrame(columns=["tactic", "mean", "std", "median"])
+    where, params = _where(brand_area, quarter)
+
+    return client.query(
+        f"""
+        {cte}
+        SELECT tactic, AVG({metric}) AS mean, STDDEV_SAMP({metric}) AS std, MEDIAN({metric}) AS median
+        FROM base {where}
+        GROUP BY tactic
+        ORDER BY mean DESC
+        """,
+        params
+    )
+
+
+def roi_stability_sql(client, brand_area: str, start_quarter: str, end_quarter: str, top_n: Optional[int] = None,
+                      source: str = "campaign_performance") -> pd.DataFrame:
+    """
+    ROI mean, std and coefficient of variation per tactic across two quarters,
+    most stable first. Read from the cube when `source` has one.
+    """
+    limit = ""
+    limit_params = []
+    if top_n is not None:
+        limit = "LIMIT ?"
+        limit_params = [int(top_n)]
+
+    cube = client.cube(source)
+    if cube is not None:
+        # brand_area x quarter x tactic cells, re-aggregated per tactic
+        where, params = _where(brand_area, [start_quarter, end_quarter])
+        mean, std = _cube_mean_std("roi")
+        return client.query(
+            f"""
+            SELECT tactic, {mean} AS mean, {std} AS std, {std} / NULLIF(ABS({mean}), 0) AS cv
+            FROM {cube} {where} AND grouping_id = 0
+            GROUP BY tactic
+            ORDER BY cv ASC NULLS LAST
+            {limit}
+            """,
+            params + limit_params
+        )
+
+    cte, _ = _base_cte(client, source)
+    where, params = _where(brand_area, [start_quarter, end_quarter])
+    params = params + limit_params
+
+    return client.query(
+        f"""
+        {cte}
+        SELECT tactic, AVG(roi) AS mean, STDDEV_SAMP(roi) AS std,
+               STDDEV_SAMP(roi) / NULLIF(ABS(AVG(roi)), 0) AS cv
+        FROM base {where}
+        GROUP BY tactic
+        ORDER BY cv ASC NULLS LAST
+        {limit}
+        """,
+        params
+    )
+
+
+def cube_supported(columns) -> bool:
+    """True if a table with these columns can have a cube (see CUBE_DIMENSIONS)."""
+    return set(CUBE_DIMENSIONS) | set(CUBE_TOTALS) <= set(columns)
+
+
+def _cube_measures():
+    """Names of the cube's additive measure columns."""
+    measures = ["n"] + [f"{column}_sum" for column in CUBE_TOTALS]
+    for metric in CUBE_METRICS:
+        measures += [f"{metric}_n", f"{metric}_sum", f"{metric}_sumsq"]
+    return measures
+
+
+def _cube_mean_std(metric: str):
+    """SQL for the mean and sample standard deviation of `metric` over the cube cells being grouped."""
+    count, total, squares = f"SUM({metric}_n)", f"SUM({metric}_sum)", f"SUM({metric}_sumsq)"
+    mean = f"{total} / NULLIF({count}, 0)"
+    # sample variance from the sums; clamped at 0 against rounding for constant groups
+    std = f"SQRT(GREATEST(({squares} - {total} * {total} / NULLIF({count}, 0)) / NULLIF({count} - 1, 0), 0))"
+    return mean, std
+
+
+def cube_build_sql(relation: str, columns) -> str:
+    """
+    SELECT computing every cube cell of `relation` (a table name), with
+    GROUPING(...) as grouping_id: bit 2 brand_area, 1 quarter, 0 tactic,
+    set where the dimension is rolled up.
+    """
+    keys = ", ".join(CUBE_DIMENSIONS)
+    derived = [f"{DERIVED_METRICS[metric]} AS {metric}" for metric in CUBE_METRICS if metric not in columns]
+    measures = ["COUNT(*) AS n"] + [f"SUM({column})::DOUBLE AS {column}_sum" for column in CUBE_TOTALS]
+    for metric in CUBE_METRICS:
+        measures += [
+            f"COUNT({metric}) AS {metric}_n",
+            f"SUM({metric}) AS {metric}_sum",
+            f"SUM({metric} * {metric}) AS {metric}_sumsq",
+        ]
+    return (
+        f"SELECT {keys}, GROUPING({keys}) AS grouping_id, {', '.join(measures)} "
+        f"FROM (SELECT {', '.join(['*'] + derived)} FROM {relation}) GROUP BY CUBE ({keys})"
+    )
+
+
+def cube_merge_sql(cube_table: str, delta_sql: str) -> str:
+    """SELECT adding the cells of `delta_sql` (a cube_build_sql over new rows) to `cube_table`."""
+    keys = ", ".join(CUBE_DIMENSIONS)
+    sums = ", ".join(
+        f"SUM({measure})::BIGINT AS {measure}" if measure == "n" or measure.endswith("_n") else f"SUM({measure}) AS {measure}"
+        for measure in _cube_measures()
+    )
+    return (
+        f"SELECT {keys}, grouping_id, {sums} "
+        f"FROM (SELECT * FROM {cube_table} UNION ALL BY NAME {delta_sql}) GROUP BY {keys}, grouping_id"
+    )
+
+
+def cube_summary_sql(client, group_by: Optional[List[str]] = None, brand_area=None, quarter=None, tactic=None,
+                     source: str = "campaign_performance") -> Optional[pd.DataFrame]:
+    """
+    Row count, mean/std of ROI, CTR and conversion rate, and conversion,
+    revenue and spend totals per group, read from the client's cube instead
+    of the rows: summarize_sql's columns without the medians, plus `rows`.
+
+    Reads the coarsest grouping set that still has every grouped and
+    filtered dimension, so e.g. one brand area over all quarters sums a
+    handful of cells.
+
+    Returns:
+        None if `source` has no cube (see DuckDBClient.cube).
+    """
+    cube = client.cube(source)
+    if cube is None:
+        return None
+    if group_by is None:
+        group_by = ["brand_area", "tactic", "quarter"]
+    _check_columns(group_by, CUBE_DIMENSIONS)
+
+    filters = {"brand_area": brand_area, "quarter": quarter, "tactic": tactic}
+    needed = set(group_by) | {column for column, value in filters.items() if value}
+    grouping_id = sum(1 << (len(CUBE_DIMENSIONS) - 1 - i) for i, column in enumerate(CUBE_DIMENSIONS)
+                      if column not in needed)
+    where, params = _where(**filters)
+    where = f"{where} AND grouping_id = ?" if where else "WHERE grouping_id = ?"
+    params = params + [grouping_id]
+
+    aggregates = ["SUM(n)::BIGINT AS rows"]
+    for metric in CUBE_METRICS:
+        mean, std = _cube_mean_std(metric)
+        aggregates += [f"{mean} AS {metric}_mean", f"{std} AS {metric}_std"]
+    aggregates += ["SUM(conversions_sum) AS conversions_sum", "SUM(revenue_sum) AS revenue_sum",
+                   "SUM(spend_sum) AS spend_sum"]
+
+    if not group_by:
+        return client.query(f"SELECT {', '.join(aggregates)} FROM {cube} {where}", params)
+    keys = ", ".join(group_by)
+    return client.query(
+        f"SELECT {keys}, {', '.join(aggregates)} FROM {cube} {where} GROUP BY {keys} ORDER BY {keys}",
+        params
+    )
@@ -3,269 +3,407 @@ import pandas as pd
 import numpy as np
 from typing import List, Dict, Optional, Union
 
+from agent_system.state.datasets import datasets
+from agent_system.utils.metrics import with_metrics, metric_values, metric_cache
+from agent_system.utils.sql_tools import (
+    get_client,
+    is_table_reference,
+    roi_sql,
+    ctr_sql,
+    conversion_rate_sql,
+    filter_sql,
+    summarize_sql,
+    compare_tactics_sql,
+    metric_by_tactic_sql,
+    roi_stability_sql
+)
+
+# Each tool is a thin JSON wrapper around a *_df function that works on a
+# DataFrame directly. Python callers (and tools that build on other tools)
+# use the *_df functions, so data only crosses the dict <-> DataFrame
+# boundary once, at the LLM. Derived metrics (ROI, CTR, conversion rate, ...)
+# come from metrics.py, which computes them once per DataFrame.
+#
+# `data` can also be a string: a dataset handle from state/datasets.py
+# (the analyzer's retrieved rows, kept server-side) or a table name, in
+# which case the tool runs the matching *_sql function from sql_tools.py
+# inside DuckDB.
+
+# row-level results from a dataset handle larger than this are registered as
+# a new dataset and returned as a handle plus preview, rather than in full
+MAX_RETURNED_ROWS = 50
+
+def to_frame(data) -> pd.DataFrame:
+    """Return `data` as a DataFrame; DataFrames are passed through without copying."""
+    if isinstance(data, pd.DataFrame):
+        return data
+    return pd.DataFrame(data)
+
+
+def to_records(df: pd.DataFrame) -> List[Dict]:
+    """Convert a result DataFrame to the JSON-friendly list of dicts the tools return."""
+    return df.to_dict(orient="records")
+
+
+def resolve_data(data):
+    """
+    Resolve a tool's `data` argument.
+
+    Returns:
+        (DataFrame, None) for rows or a dataset handle, or (None, table_name)
+        for a table the tool should query in DuckDB.
+    """
+    if isinstance(data, str):
+        if data in datasets:
+            return datasets.get(data), None
+        if datasets.is_handle(data):
+            raise ValueError(f"Unknown or expired dataset {data!r}; use the handle given in the prompt")
+        if is_table_reference(data):
+            return None, data
+        raise ValueError(f"Unknown dataset handle or table: {data!r}")
+    return to_frame(data), None
+
+
+def rows_or_handle(df: pd.DataFrame, data) -> List[Dict]:
+    """
+    Records for a row-level result. If the input was a dataset handle or
+    table and the result is large, store it as a new dataset and return its
+    handle and a preview instead, so the rows never pass through the LLM.
+    A dataset derived from a handle is released together with that handle
+    (from a table, with the analyzer run's handle; see DatasetRegistry.scope).
+    """
+    if isinstance(data, str) and len(df) > MAX_RETURNED_ROWS:
+        return [{
+            "dataset": datasets.register(df, parent=data if data in datasets else None),
+            "rows": len(df),
+            "columns": list(df.columns),
+            "preview": to_records(df.head(5))
+        }]
+    return to_records(df)
+
 # ----------------------------
 # ----------------------------
 
+def roi_df(df: pd.DataFrame, campaign_id: int) -> pd.DataFrame:
+    """ROI for a single campaign (campaign_id, brand_area, roi)."""
+    campaign_df = df[df["campaign_id"] == campaign_id]
+
+    if campaign_df.empty:
+        return pd.DataFrame(columns=["campaign_id", "brand_area", "roi"])
+
+    roi = np.round(metric_values(campaign_df, "roi"), 2)
+    return campaign_df[["campaign_id", "brand_area"]].assign(roi=roi)
+
+
+def ctr_df(df: pd.DataFrame) -> pd.DataFrame:
+    """`df` with an added ctr column (clicks / impressions)."""
+    return with_metrics(df, ["ctr"])
+
+
+def conversion_rate_df(df: pd.DataFrame) -> pd.DataFrame:
+    """`df` with an added conversion_rate column (conversions / clicks)."""
+    return with_metrics(df, ["conversion_rate"])
+
+
 @tool
-def calculate_roi(data: List[Dict], campaign_id: int) -> List[Dict]:
+def calculate_roi(data: Union[str, List[Dict]], campaign_id: int) -> List[Dict]:
     """
     Calculate ROI for a specific campaign from JSON-serializable input.
-    
+
     Args:
-        data: List of dicts representing campaign data (JSON-friendly).
+        data: List of dicts representing campaign data (JSON-friendly), a dataset
+              handle (e.g. "ds_1a2b3c4d"), or the name of a table
+              (e.g. "campaign_performance") to compute on in the database.
         campaign_id: ID of the campaign to calculate ROI for.
-    
+
     Returns:
         List of dicts containing campaign_id, brand_area, and roi.
     """
-    df = pd.DataFrame(data)
-    
-    campaign_df = df[df["campaign_id"] == campaign_id].copy()
-    
-    if campaign_df.empty:
-        return []
-
-    campaign_df["roi"] = ((campaign_df["revenue"] - campaign_df["spend"]) / campaign_df["spend"]).astype(float)
-    campaign_df["roi"] = campaign_df["roi"].round(2)
-
-    return campaign_df[["campaign_id", "brand_area", "roi"]].to_dict(orient="records")
+    df, table = resolve_data(data)
+    if table:
+        return to_records(roi_sql(get_client(), campaign_id, source=table))
+    return to_records(roi_df(df, campaign_id))
 
 
 @tool
-def calculate_ctr(data: List[Dict]) -> List[Dict]:
+def calculate_ctr(data: Union[str, List[Dict]]) -> List[Dict]:
     """
     Calculate Click-Through Rate (CTR).
     CTR = clicks / impressions
-    
+
     Args:
-        data: List of dicts representing campaign data (JSON-friendly).
-    
+        data: List of dicts representing campaign data (JSON-friendly), a dataset
+              handle (e.g. "ds_1a2b3c4d"), or the name of a table
+              (e.g. "campaign_performance") to compute on in the database.
+
     Returns:
         List of dicts with added CTR column.
     """
-    df = pd.DataFrame(data)
-    df = df.copy()
-    df["ctr"] = df["clicks"] / df["impressions"]
-    return df.to_dict(orient="records")
+    df, table = resolve_data(data)
+    if table:
+        return to_records(ctr_sql(get_client(), source=table))
+    return rows_or_handle(ctr_df(df), data)
 
 
 @tool
-def calculate_conversion_rate(data: List[Dict]) -> List[Dict]:
+def calculate_conversion_rate(data: Union[str, List[Dict]]) -> List[Dict]:
     """
     Calculate Conversion Rate (CR).
     CR = conversions / clicks
-    
+
     Args:
-        data: List of dicts representing campaign data (JSON-friendly).
-    
+        data: List of dicts representing campaign data (JSON-friendly), a dataset
+              handle (e.g. "ds_1a2b3c4d"), or the name of a table
+              (e.g. "campaign_performance") to compute on in the database.
+
     Returns:
         List of dicts with added conversion_rate column.
     """
-    df = pd.DataFrame(data)
-    df = df.copy()
-    df["conversion_rate"] = df["conversions"] / df["clicks"]
-    return df.to_dict(orient="records")
+    df, table = resolve_data(data)
+    if table:
+        return to_records(conversion_rate_sql(get_client(), source=table))
+    return rows_or_handle(conversion_rate_df(df), data)
 
 # ----------------------------
 # ----------------------------
 
+def filter_df(df: pd.DataFrame, brand_area=None, quarter=None, tactic=None) -> pd.DataFrame:
+    """Rows of `df` matching the given brand area(s), quarter(s) and tactic(s); None means no filter."""
+    mask = np.ones(len(df), dtype=bool)
+
+    if brand_area:
+        brand_areas = brand_area if isinstance(brand_area, list) else [brand_area]
+        mask &= df["brand_area"].isin(brand_areas).to_numpy()
+    if quarter:
+        quarters = quarter if isinstance(quarter, list) else [quarter]
+        mask &= df["quarter"].isin(quarters).to_numpy()
+    if tactic:
+        tactics = tactic if isinstance(tactic, list) else [tactic]
+        mask &= df["tactic"].isin(tactics).to_numpy()
+
+    filtered = df[mask]
+    # the subset's metrics are sliced from df's instead of being recomputed
+    metric_cache.derive(filtered, df, np.flatnonzero(mask))
+    return filtered
+
+
+def summarize_df(df: pd.DataFrame, group_by: List[str] = None) -> pd.DataFrame:
+    """Mean/std/median of ROI, CTR and conversion rate plus conversion, revenue and spend totals per group."""
+    if group_by is None:
+        group_by = ["brand_area", "tactic", "quarter"]
+
+    # only the columns the summary needs; metrics that can't be derived are NaN, missing totals are 0
+    columns = {col: df[col].to_numpy() for col in group_by}
+    for metric in ("roi", "ctr", "conversion_rate"):
+        values = metric_values(df, metric)
+        columns[metric] = values if values is not None else np.full(len(df), np.nan)
+    for col in ("conversions", "revenue", "spend"):
+        columns[col] = df[col].to_numpy() if col in df.columns else np.zeros(len(df))
+
+    summary = (
+        pd.DataFrame(columns).groupby(group_by)
+        .agg({
+            "roi": ["mean", "std", "median"],
+            "ctr": ["mean", "std", "median"],
+            "conversion_rate": ["mean", "std", "median"],
+            "conversions": "sum",
+            "revenue": "sum",
+            "spend": "sum"
+        })
+        .reset_index()
+    )
+    summary.columns = ["_".join(col).rstrip("_") for col in summary.columns.values]
+    return summary
+
+
 @tool
-def filter_data(data: List[Dict], brand_area: Optional[Union[str, List[str]]] = None, 
-                quarter: Optional[Union[str, List[str]]] = None, 
+def filter_data(data: Union[str, List[Dict]], brand_area: Optional[Union[str, List[str]]] = None,
+                quarter: Optional[Union[str, List[str]]] = None,
                 tactic: Optional[Union[str, List[str]]] = None) -> List[Dict]:
     """
     Filter campaigns based on brand area, quarter, and/or tactic.
     Any of the parameters can be None (meaning "no filter").
-    
+
     Args:
-        data: List of dicts representing campaign data (JSON-friendly).
+        data: List of dicts representing campaign data (JSON-friendly), a dataset
+              handle (e.g. "ds_1a2b3c4d"), or the name of a table
+              (e.g. "campaign_performance") to compute on in the database.
         brand_area: Brand area(s) to filter by.
         quarter: Quarter(s) to filter by.
         tactic: Tactic(s) to filter by.
-    
+
     Returns:
         List of dicts containing filtered data.
     """
-    df = pd.DataFrame(data)
-    filtered = df.copy()
-    
-    if brand_area:
-        brand_areas = brand_area if isinstance(brand_area, list) else [brand_area]
-        filtered = filtered[filtered["brand_area"].isin(brand_areas)]
-    if quarter:
-        quarters = quarter if isinstance(quarter, list) else [quarter]
-        filtered = filtered[filtered["quarter"].isin(quarters)]
-    if tactic:
-        tactics = tactic if isinstance(tactic, list) else [tactic]
-        filtered = filtered[filtered["tactic"].isin(tactics)]
-    
-    return filtered.to_dict(orient="records")
+    df, table = resolve_data(data)
+    if table:
+        return to_records(filter_sql(get_client(), brand_area=brand_area, quarter=quarter, tactic=tactic, source=table))
+    return rows_or_handle(filter_df(df, brand_area=brand_area, quarter=quarter, tactic=tactic), data)
 
 
 @tool
-def summarize_performance(data: List[Dict], group_by: List[str] = None) -> List[Dict]:
+def summarize_performance(data: Union[str, List[Dict]], group_by: List[str] = None) -> List[Dict]:
     """
     Summarize key metrics by grouping fields.
     Returns mean, median, and standard deviation for ROI, CTR, and conversion rate.
-    
+
     Args:
-        data: List of dicts representing campaign data (JSON-friendly).
+        data: List of dicts representing campaign data (JSON-friendly), a dataset
+              handle (e.g. "ds_1a2b3c4d"), or the name of a table
+              (e.g. "campaign_performance") to compute on in the database.
         group_by: List of fields to group by. Defaults to ["brand_area", "tactic", "quarter"].
-    
+
     Returns:
         List of dicts containing summary statistics.
     """
-    if group_by is None:
-        group_by = ["brand_area", "tactic", "quarter"]
-    
-    df = pd.DataFrame(data)
-    
-    required_cols = ["roi", "ctr", "conversion_rate", "conversions", "revenue", "spend"]
-    missing_cols = [col for col in required_cols if col not in df.columns]
-    
-    if missing_cols:
-        for col in missing_cols:
-            if col in ["roi", "ctr", "conversion_rate"]:
-                df[col] = 0.0
-            else:
-                df[col] = 0
-    
-    summary = (
-        df.groupby(group_by)
-        .agg({
-            "roi": ["mean", "std", "median"],
-            "ctr": ["mean", "std", "median"],
-            "conversion_rate": ["mean", "std", "median"],
-            "conversions": "sum",
-            "revenue": "sum",
-            "spend": "sum"
-        })
-        .reset_index()
-    )
-    summary.columns = ["_".join(col).rstrip("_") for col in summary.columns.values]
-    return summary.to_dict(orient="records")
+    df, table = resolve_data(data)
+    if table:
+        return to_records(summarize_sql(get_client(), group_by=group_by, source=table))
+    return to_records(summarize_df(df, group_by=group_by))
 
 
 # ----------------------------
 # ----------------------------
 
+def compare_tactics_df(df: pd.DataFrame, brand_areas: List[str], quarter: str) -> pd.DataFrame:
+    """Per brand area and tactic summary for one quarter, sorted by tactic then brand area."""
+    summary = summarize_df(filter_df(df, brand_area=brand_areas, quarter=quarter), group_by=["brand_area", "tactic"])
+    return summary.sort_values(by=["tactic", "brand_area"]).reset_index(drop=True)
+
+
+def metric_by_tactic_df(df: pd.DataFrame, brand_area: str, quarter: str, metric: str = "roi") -> pd.DataFrame:
+    """Mean/std/median of `metric` per tactic for one brand area and quarter, best mean first."""
+    filtered = filter_df(df, brand_area=brand_area, quarter=quarter)
+    values = metric_values(filtered, metric) if not filtered.empty else None
+
+    if values is None:
+        return pd.DataFrame(columns=["tactic", "mean", "std", "median"])
+
+    return (
+        pd.DataFrame({"tactic": filtered["tactic"].to_numpy(), metric: values})
+        .groupby("tactic")[metric]
+        .agg(["mean", "std", "median"])
+        .reset_index()
+        .sort_values("mean", ascending=False)
+    )
+
+
+def roi_stability_df(df: pd.DataFrame, brand_area: str, start_quarter: str, end_quarter: str) -> pd.DataFrame:
+    """ROI mean, std and coefficient of variation per tactic across two quarters, most stable first."""
+    filtered = filter_df(df, brand_area=brand_area, quarter=[start_quarter, end_quarter])
+    roi = metric_values(filtered, "roi") if not filtered.empty else None
+
+    if roi is None:
+        return pd.DataFrame(columns=["tactic", "mean", "std", "cv"])
+
+    stability = (
+        pd.DataFrame({"tactic": filtered["tactic"].to_numpy(), "roi": roi})
+        .groupby("tactic")["roi"]
+        .agg(["mean", "std"])
+        .reset_index()
+    )
+    stability["cv"] = stability["std"] / np.abs(stability["mean"])
+    return stability.sort_values("cv", ascending=True)
+
+
 @tool
-def compare_tactic_performance(data: List[Dict], brand_areas: List[str], quarter: str) -> List[Dict]:
+def compare_tactic_performance(data: Union[str, List[Dict]], brand_areas: List[str], quarter: str) -> List[Dict]:
     """
     Compare tactic performance (ROI, CTR, Conversion Rate) between multiple brand areas
     for a specific quarter.
-    
+
     Args:
-        data: List of dicts representing campaign data (JSON-friendly).
+        data: List of dicts representing campaign data (JSON-friendly), a dataset
+              handle (e.g. "ds_1a2b3c4d"), or the name of a table
+              (e.g. "campaign_performance") to compute on in the database.
         brand_areas: List of brand areas to compare.
         quarter: Quarter to analyze.
-    
+
     Returns:
         List of dicts containing comparison results.
     """
-    filtered_data = filter_data(data, brand_area=brand_areas, quarter=quarter)
-    summary = summarize_performance(filtered_data, group_by=["brand_area", "tactic"])
-    
-    df = pd.DataFrame(summary)
-    if not df.empty:
-        df = df.sort_values(by=["tactic", "brand_area"]).reset_index(drop=True)
-        return df.to_dict(orient="records")
-    return []
+    df, table = resolve_data(data)
+    if table:
+        return to_records(compare_tactics_sql(get_client(), brand_areas, quarter, source=table))
+    return to_records(compare_tactics_df(df, brand_areas, quarter))
 
 
 @tool
-def calculate_metric_by_tactic(data: List[Dict], brand_area: str, quarter: str, metric: str = "roi") -> List[Dict]:
+def calculate_metric_by_tactic(data: Union[str, List[Dict]], brand_area: str, quarter: str, metric: str = "roi") -> List[Dict]:
     """
     Calculate the specified metric (ROI, CTR, etc.) by tactic for a given brand area and quarter.
-    
+
     Args:
-        data: List of dicts representing campaign data (JSON-friendly).
+        data: List of dicts representing campaign data (JSON-friendly), a dataset
+              handle (e.g. "ds_1a2b3c4d"), or the name of a table
+              (e.g. "campaign_performance") to compute on in the database.
         brand_area: Brand area to analyze.
         quarter: Quarter to analyze.
         metric: Metric to calculate (default: "roi").
-    
+
     Returns:
         List of dicts containing metric calculations by tactic.
     """
-    filtered_data = filter_data(data, brand_area=brand_area, quarter=quarter)
-    df = pd.DataFrame(filtered_data)
-    
-    if df.empty or metric not in df.columns:
-        return []
-    
-    result = (
-        df.groupby("tactic")[metric]
-        .agg(["mean", "std", "median"])
-        .reset_index()
-        .sort_values("mean", ascending=False)
-    )
-    return result.to_dict(orient="records")
+    df, table = resolve_data(data)
+    if table:
+        return to_records(metric_by_tactic_sql(get_client(), brand_area, quarter, metric, source=table))
+    return to_records(metric_by_tactic_df(df, brand_area, quarter, metric))
 
 
 @tool
-def calculate_roi_stability(data: List[Dict], brand_area: str, start_quarter: str, end_quarter: str) -> List[Dict]:
+def calculate_roi_stability(data: Union[str, List[Dict]], brand_area: str, start_quarter: str, end_quarter: str) -> List[Dict]:
     """
     Measure ROI stability (standard deviation and coefficient of variation)
     across quarters for each tactic.
-    
+
     Args:
-        data: List of dicts representing campaign data (JSON-friendly).
+        data: List of dicts representing campaign data (JSON-friendly), a dataset
+              handle (e.g. "ds_1a2b3c4d"), or the name of a table
+              (e.g. "campaign_performance") to compute on in the database.
         brand_area: Brand area to analyze.
         start_quarter: Starting quarter.
         end_quarter: Ending quarter.
-    
+
     Returns:
         List of dicts containing stability metrics.
     """
-    quarters = [start_quarter, end_quarter]
-    filtered_data = filter_data(data, brand_area=brand_area, quarter=quarters)
-    df = pd.DataFrame(filtered_data)
-    
-    if df.empty or "roi" not in df.columns:
-        return []
-    
-    stability = (
-        df.groupby("tactic")["roi"]
-        .agg(["mean", "std"])
-        .reset_index()
-    )
-    stability["cv"] = stability["std"] / np.abs(stability["mean"])
-    stability = stability.sort_values("cv", ascending=True)
-    return stability.to_dict(orient="records")
+    df, table = resolve_data(data)
+    if table:
+        return to_records(roi_stability_sql(get_client(), brand_area, start_quarter, end_quarter, source=table))
+    return to_records(roi_stability_df(df, brand_area, start_quarter, end_quarter))
 
 
 @tool
-def get_top_stable_tactics(data: List[Dict], brand_area: str, start_quarter: str, end_quarter: str, top_n: int = 2) -> List[Dict]:
+def get_top_stable_tactics(data: Union[str, List[Dict]], brand_area: str, start_quarter: str, end_quarter: str, top_n: int = 2) -> List[Dict]:
     """
     Return the top N tactics with the most stable ROI (lowest coefficient of variation).
-    
+
     Args:
-        data: List of dicts representing campaign data (JSON-friendly).
+        data: List of dicts representing campaign data (JSON-friendly), a dataset
+              handle (e.g. "ds_1a2b3c4d"), or the name of a table
+              (e.g. "campaign_performance") to compute on in the database.
         brand_area: Brand area to analyze.
         start_quarter: Starting quarter.
         end_quarter: Ending quarter.
         top_n: Number of top tactics to return (default: 2).
-    
+
     Returns:
         List of dicts containing top stable tactics.
     """
-    stability_data = calculate_roi_stability(data, brand_area, start_quarter, end_quarter)
-    df = pd.DataFrame(stability_data)
-    
-    if df.empty:
-        return []
-    
-    return df.head(top_n).to_dict(orient="records")
+    df, table = resolve_data(data)
+    if table:
+        return to_records(roi_stability_sql(get_client(), brand_area, start_quarter, end_quarter, top_n=top_n, source=table))
+    return to_records(roi_stability_df(df, brand_area, start_quarter, end_quarter).head(top_n))
 
 # list of tools to assist in analysis (Analysis Agent)
 analysis_tools = [
-    calculate_roi, 
-    calculate_ctr, 
-    calculate_conversion_rate, 
-    filter_data, 
-    summarize_performance, 
-    compare_tactic_performance, 
-    calculate_metric_by_tactic, 
-    calculate_roi_stability, 
+    calculate_roi,
+    calculate_ctr,
+    calculate_conversion_rate,
+    filter_data,
+    summarize_performance,
+    compare_tactic_performance,
+    calculate_metric_by_tactic,
+    calculate_roi_stability,
     get_top_stable_tactics
-]
\ No newline at end of file
+]
@@ -0,0 +1,269 @@
+import asyncio
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+# Latency and resource tracing for the workflow. A span times one unit of
+# work (a graph node, an LLM call, a DuckDB query, a KB search): wall time,
+# CPU time of the calling thread, and whatever the caller attaches (rows,
+# token counts, cache hits). Finished spans are appended to a JSONL file and
+# their durations go into per-name histograms for p50/p95/p99 summaries.
+#
+# Off unless TRACE=1 (or tracer.enable() is called); disabled, span() hands
+# back a shared do-nothing span, so the instrumented code pays one attribute
+# check per call.
+
+TRACE_PATH = Path(__file__).parent.parent.parent / "data/traces.jsonl"
+
+_span_ids = itertools.count(1)
+# innermost open span of the current thread / task; asyncio tasks and
+# asyncio.to_thread inherit it, so nested spans know their parent
+_current_span = ContextVar("current_span", default=None)
+
+
+class Histogram:
+    """Recent observations of one measurement (the last `max_samples`), with percentiles."""
+
+    def __init__(self, max_samples: int = 10_000):
+        self._values = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        with self._lock:
+            self._values.append(value)
+            self.count += 1
+            self.total += value
+
+    def summary(self) -> Dict[str, float]:
+        """Count and mean over everything observed; max and percentiles over the recent samples."""
+        with self._lock:
+            values = np.fromiter(self._values, dtype=np.float64, count=len(self._values))
+            count, total = self.count, self.total
+        if count == 0:
+            return {"count": 0}
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        return {
+            "count": count,
+            "mean": total / count,
+            "p50": float(p50),
+            "p95": float(p95),
+            "p99": float(p99),
+            "max": float(values.max()),
+        }
+
+
+class HistogramRegistry:
+    """Histograms by name, created on first observation."""
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram())
+        histogram.observe(value)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            histograms = dict(self._histograms)
+        return {name: histograms[name].summary() for name in sorted(histograms)}
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+class Span:
+    """One timed unit of work. Attach measurements with set(); use as a context manager."""
+
+    __slots__ = ("tracer", "name", "attrs", "span_id", "parent_id", "trace_id",
+                 "_start", "_wall", "_cpu", "_token")
+
+    def __init__(self, tracer, name: str, attrs: dict):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.span_id = next(_span_ids)
+
+    def set(self, **attrs):
+        """Record measurements on the span, e.g. rows=120 or cache_hit=True."""
+        self.attrs.update(attrs)
+
+    def add(self, **counts):
+        """Add to numeric measurements, e.g. completion_tokens=12 per streamed chunk."""
+        for key, value in counts.items():
+            self.attrs[key] = self.attrs.get(key, 0) + value
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self._token = _current_span.set(self)
+        self._start = time.time()
+        self._cpu = time.thread_time()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall_ms = (time.perf_counter() - self._wall) * 1000
+        # thread CPU time: for async spans this includes whatever else ran on the event loop meanwhile
+        cpu_ms = (time.thread_time() - self._cpu) * 1000
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # exited in a different context than it was entered in (e.g. an async generator)
+            pass
+        if exc_type is not None:
+            self.attrs["error"] = f"{exc_type.__name__}: {exc}"
+        self.tracer._finish(self, wall_ms, cpu_ms)
+        return False
+
+
+class _NoopSpan:
+    """Stands in for Span while tracing is disabled."""
+
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def add(self, **counts):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """
+    Creates spans and collects them: each finished span is written as one
+    JSON line to `path` (if set) and its wall/CPU time observed in the
+    histograms as "<name>.wall_ms" / "<name>.cpu_ms".
+    """
+
+    def __init__(self, enabled: bool = False, path: Optional[Path] = TRACE_PATH):
+        self.histograms = HistogramRegistry()
+        self._file = None
+        self._lock = threading.Lock()
+        self.enabled = False
+        self.path = None
+        if enabled:
+            self.enable(path)
+
+    def enable(self, path: Optional[Path] = TRACE_PATH):
+        """Start tracing; spans are appended to `path` (None keeps them in memory only)."""
+        with self._lock:
+            self._close_file()
+            self.path = Path(path) if path else None
+            if self.path:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                # line buffered: every span is on disk once it finishes
+                self._file = self.path.open("a", encoding="utf-8", buffering=1)
+            self.enabled = True
+
+    def disable(self):
+        """Stop tracing and close the JSONL file. The histograms are kept."""
+        with self._lock:
+            self.enabled = False
+            self._close_file()
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def span(self, name: str, **attrs):
+        """
+        A span named `name`, e.g.
+
+            with tracer.span("duckdb.query", sql=sql) as span:
+                df = ...
+                span.set(rows=len(df))
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attrs)
+
+    def _finish(self, span: Span, wall_ms: float, cpu_ms: float):
+        self.histograms.observe(f"{span.name}.wall_ms", wall_ms)
+        self.histograms.observe(f"{span.name}.cpu_ms", cpu_ms)
+        if self._file is None:
+            return
+        event = {
+            "name": span.name,
+            "trace_id": span.trace_id,
+            "span_id": span.span_id,
+            "parent_id": span.parent_id,
+            "start": span._start,
+            "wall_ms": round(wall_ms, 3),
+            "cpu_ms": round(cpu_ms, 3),
+            **span.attrs,
+        }
+        line = json.dumps(event, default=str)
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line + "\n")
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Histogram summaries (count, mean, p50, p95, p99, max) by measurement name."""
+        return self.histograms.summary()
+
+    def format_summary(self) -> str:
+        """The wall-time histograms as a table, slowest p95 first."""
+        rows = [
+            (name[:-len(".wall_ms")], stats) for name, stats in self.summary().items()
+            if name.endswith(".wall_ms") and stats["count"]
+        ]
+        rows.sort(key=lambda row: -row[1]["p95"])
+        lines = [f"{'span':<28}{'count':>7}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}"]
+        for name, stats in rows:
+            lines.append(f"{name:<28}{stats['count']:>7}{stats['p50']:>11.1f}{stats['p95']:>11.1f}{stats['p99']:>11.1f}")
+        return "\n".join(lines)
+
+
+def record_usage(span, message):
+    """Add a LangChain message's (or message chunk's) token counts to an LLM span."""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        span.add(prompt_tokens=usage.get("input_tokens", 0), completion_tokens=usage.get("output_tokens", 0))
+
+
+def trace_node(name: str, func):
+    """Wrap a graph node body (sync or async) in a "node.<name>" span."""
+    span_name = f"node.{name}"
+
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def traced(state):
+            with tracer.span(span_name):
+                return await func(state)
+    else:
+        @functools.wraps(func)
+        def traced(state):
+            with tracer.span(span_name):
+                return func(state)
+    return traced
+
+
+# shared by every instrumented module
+tracer = Tracer(enabled=os.getenv("TRACE", "0") == "1", path=os.getenv("TRACE_FILE") or TRACE_PATH)
@@ -0,0 +1,94 @@
+import threading
+
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import StateGraph, END
+
+from agent_system.state.state import State
+from agent_system.agents.orchestrator import Orchestrator
+from agent_system.agents.sql_retriever import sqlRetriever
+from agent_system.agents.kb_retriever import kbRetriever
+from agent_system.agents.analyzer import Analyzer
+from agent_system.utils import sql_tools
+from agent_system.utils.tracing import trace_node
+
+# compiled graph shared by the REPL, the batch runner and anything embedding the system
+_app = None
+_app_lock = threading.Lock()
+
+
+def create_workflow():
+    """Create and compile the LangGraph workflow."""
+
+    orchestrator = Orchestrator()
+    sql_retriever = sqlRetriever()
+    kb_retriever = kbRetriever()
+    analyzer = Analyzer()
+
+    # tools handed a table name aggregate inside the retriever's database
+    sql_tools.set_client(sql_retriever.duckdb_client)
+
+    workflow = StateGraph(State)
+
+    # each node has a sync and an async body, so the compiled graph supports
+    # invoke/stream as well as ainvoke/astream; both are timed as "node.<name>" spans
+    nodes = {
+        "orchestrator": orchestrator,
+        "sqlRetriever": sql_retriever,
+        "kbRetriever": kb_retriever,
+        "analyzer": analyzer,
+    }
+    for name, agent in nodes.items():
+        workflow.add_node(name, RunnableLambda(trace_node(name, agent.process), afunc=trace_node(name, agent.aprocess)))
+
+    workflow.set_entry_point("orchestrator")
+
+    workflow.add_edge("orchestrator", "sqlRetriever")
+    workflow.add_edge("orchestrator", "kbRetriever")
+
+    workflow.add_edge("sqlRetriever", "analyzer")
+    workflow.add_edge("kbRetriever", "analyzer")
+
+    workflow.add_edge("analyzer", END)
+
+    return workflow.compile()
+
+
+def get_workflow():
+    """
+    Return the shared compiled workflow, compiling it on first use.
+
+    The compiled graph holds no per-run state, so one instance can serve
+    any number of queries (including concurrent ones).
+    """
+    global _app
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                _app = create_workflow()
+    return _app
+
+
+def warm_up():
+    """
+    Compile the workflow and pre-load the data it depends on, so the first
+    query doesn't pay for any of it.
+
+    Returns:
+        The shared compiled workflow.
+    """
+    app = get_workflow()
+
+    # make sure campaign_performance is ingested (or the CSV behind the view is read) up front
+    sqlRetriever.duckdb_client.query("SELECT * FROM campaign_performance LIMIT 1")
+
+    # the KB index is loaded or fitted when the backend is built; run one search so any lazy setup happens now
+    kbRetriever.kb_client.search("")
+
+    return app
+
+
+def reset_workflow():
+    """Drop the shared compiled workflow so the next call to get_workflow() rebuilds it."""
+    global _app
+    with _app_lock:
+        _app = None
@@ -0,0 +1,123 @@
+import re
+import time
+import asyncio
+from typing import Any, Iterator, AsyncIterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Deterministic local stand-in for ChatGoogleGenerativeAI, so the whole
+# workflow can be run and timed without an API key or network access.
+# It recognizes the two prompts the agents send: the NL-to-SQL prompt gets
+# canned SQL, anything else a canned analysis. Latency is simulated with a
+# sleep (asyncio.sleep on the async paths), so concurrent runs overlap the
+# way real LLM calls do.
+
+DEFAULT_SQL = "SELECT * FROM campaign_performance WHERE brand_area IN ('Cardiology', 'Oncology') AND quarter = '2025Q2'"
+
+DEFAULT_ANALYSIS = (
+    "Webinars lead on ROI in both brand areas, with email close behind and the most stable quarter over quarter. "
+    "Display converts least efficiently. Recommendation: shift 20% of display spend toward webinars and email, "
+    "and monitor webinar conversion rates over the next quarter."
+)
+
+_SQL_PROMPT = re.compile(r"expert SQL generator", re.IGNORECASE)
+_DATASET_HANDLE = re.compile(r'"(ds_[0-9a-f]{8})"')
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class FakeLLM(BaseChatModel):
+    """
+    Canned, deterministic chat model.
+
+    With tools bound (the analyzer's "agent" mode) its first reply calls
+    summarize_performance on the dataset handle named in the prompt, and it
+    answers once the tool results are in, so the tools run as part of the
+    benchmark too.
+    """
+
+    sql_responses: List[str] = [DEFAULT_SQL]
+    analysis: str = DEFAULT_ANALYSIS
+    # seconds per call, before the first token
+    latency: float = 0.0
+    # seconds between streamed chunks
+    chunk_latency: float = 0.0
+    # words per streamed chunk
+    chunk_words: int = 4
+    tools_bound: bool = False
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-benchmark"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update={"tools_bound": True})
+
+    def _reply(self, messages: List[BaseMessage]) -> AIMessage:
+        prompt = "\n".join(str(message.content) for message in messages)
+        sql_prompt = _SQL_PROMPT.search(prompt) is not None
+        if sql_prompt:
+            content = self.sql_responses[self.calls % len(self.sql_responses)]
+        else:
+            content = self.analysis
+        self.calls += 1
+
+        tool_calls = []
+        if self.tools_bound and not sql_prompt and not any(isinstance(m, ToolMessage) for m in messages):
+            handle = _DATASET_HANDLE.search(prompt)
+            if handle:
+                content = ""
+                tool_calls = [{
+                    "name": "summarize_performance",
+                    "args": {"data": handle.group(1), "group_by": ["brand_area", "tactic"]},
+                    "id": f"call_{self.calls}",
+                }]
+
+        usage = {
+            "input_tokens": _estimate_tokens(prompt),
+            "output_tokens": _estimate_tokens(content),
+            "total_tokens": _estimate_tokens(prompt) + _estimate_tokens(content),
+        }
+        return AIMessage(content=content, tool_calls=tool_calls, usage_metadata=usage)
+
+    def _chunks(self, message: AIMessage) -> List[AIMessageChunk]:
+        words = message.content.split(" ")
+        pieces = [
+            " ".join(words[i:i + self.chunk_words]) + (" " if i + self.chunk_words < len(words) else "")
+            for i in range(0, len(words), self.chunk_words)
+        ]
+        chunks = [AIMessageChunk(content=piece) for piece in pieces]
+        # token counts arrive with the last chunk, as with the Gemini API
+        chunks[-1] = AIMessageChunk(content=chunks[-1].content, usage_metadata=message.usage_metadata)
+        return chunks
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        for i, chunk in enumerate(self._chunks(self._reply(messages))):
+            if i and self.chunk_latency:
+                time.sleep(self.chunk_latency)
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        for i, chunk in enumerate(self._chunks(self._reply(messages))):
+            if i and self.chunk_latency:
+                await asyncio.sleep(self.chunk_latency)
+            yield ChatGenerationChunk(message=chunk)
@@ -0,0 +1,153 @@
+import json
+import shutil
+import tempfile
+from pathlib import Path
+from typing import List
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+# Synthetic, seeded versions of the two data files, at any size:
+# campaign_performance.csv (same columns and value ranges as the real file,
+# with ROI that depends on brand area and tactic so rankings and stability
+# are meaningful) and kb_documents.jsonl (guidance documents built from the
+# same vocabulary). The same seed always produces the same files.
+
+BRAND_AREAS = ["Cardiology", "Oncology", "Endocrinology"]
+TACTICS = ["Email", "Display", "Webinar", "HCP_Newsletter", "Social"]
+
+# revenue per conversion by tactic, before noise
+_TACTIC_VALUE = {"Email": 75.0, "Display": 45.0, "Webinar": 110.0, "HCP_Newsletter": 85.0, "Social": 55.0}
+
+CHUNK_ROWS = 1_000_000
+
+
+def brand_areas(n: int) -> List[str]:
+    """The real brand areas first, then synthetic ones ("Area_004", ...) up to n."""
+    return BRAND_AREAS[:n] + [f"Area_{i:03d}" for i in range(len(BRAND_AREAS) + 1, n + 1)]
+
+
+def tactics(n: int) -> List[str]:
+    """The real tactics first, then synthetic ones ("Tactic_006", ...) up to n."""
+    return TACTICS[:n] + [f"Tactic_{i:03d}" for i in range(len(TACTICS) + 1, n + 1)]
+
+
+def quarters(n: int, start_year: int = 2025) -> List[str]:
+    """n consecutive quarters starting at start_year Q1."""
+    return [f"{start_year + i // 4}Q{i % 4 + 1}" for i in range(n)]
+
+
+def campaign_frame(n_rows: int, seed: int = 0, n_brand_areas: int = 3, n_quarters: int = 3,
+                   n_tactics: int = 5, first_id: int = 1000) -> pd.DataFrame:
+    """
+    n_rows synthetic campaign_performance rows.
+
+    Parameters:
+    - n_brand_areas / n_quarters / n_tactics: Number of distinct values of
+      each grouping column (group cardinality).
+    - first_id: campaign_id of the first row.
+    """
+    rng = np.random.default_rng(seed)
+    areas = np.array(brand_areas(n_brand_areas), dtype=object)
+    quarter_values = np.array(quarters(n_quarters), dtype=object)
+    tactic_values = np.array(tactics(n_tactics), dtype=object)
+
+    area_idx = rng.integers(0, len(areas), n_rows)
+    tactic_idx = rng.integers(0, len(tactic_values), n_rows)
+
+    spend = rng.integers(5_000, 25_000, n_rows)
+    impressions = rng.integers(20_000, 250_000, n_rows)
+    clicks = np.maximum(1, (impressions * rng.uniform(0.002, 0.012, n_rows)).astype(np.int64))
+    conversions = np.maximum(1, (clicks * rng.uniform(0.05, 0.35, n_rows)).astype(np.int64))
+
+    tactic_value = np.array([_TACTIC_VALUE.get(t, 70.0) for t in tactic_values])[tactic_idx]
+    # brand areas differ in how valuable a conversion is, too
+    area_value = np.linspace(0.8, 1.3, len(areas))[area_idx]
+    revenue = np.round(conversions * tactic_value * area_value * rng.lognormal(0.0, 0.35, n_rows), 2)
+
+    return pd.DataFrame({
+        "campaign_id": np.arange(first_id, first_id + n_rows, dtype=np.int64),
+        "brand_area": areas[area_idx],
+        "quarter": quarter_values[rng.integers(0, len(quarter_values), n_rows)],
+        "tactic": tactic_values[tactic_idx],
+        "spend": spend,
+        "impressions": impressions,
+        "clicks": clicks,
+        "conversions": conversions,
+        "revenue": revenue,
+    })
+
+
+def write_campaigns(path, n_rows: int, seed: int = 0, **frame_kwargs) -> Path:
+    """
+    Write n_rows synthetic rows to a CSV at `path`, CHUNK_ROWS at a time, so
+    10^7 rows never have to be in memory at once.
+
+    Parameters:
+    - frame_kwargs: Passed to campaign_frame (group cardinalities).
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = duckdb.connect()
+    with tempfile.TemporaryDirectory() as tmp, path.open("wb") as out:
+        part = Path(tmp) / "part.csv"
+        for chunk, start in enumerate(range(0, max(n_rows, 1), CHUNK_ROWS)):
+            frame = campaign_frame(min(CHUNK_ROWS, n_rows - start), seed=seed + chunk,
+                                   first_id=1000 + start, **frame_kwargs)
+            conn.register("chunk", frame)
+            # DuckDB's CSV writer is much faster than DataFrame.to_csv at this size
+            conn.execute(f"COPY chunk TO '{part}' (HEADER {'true' if chunk == 0 else 'false'})")
+            conn.unregister("chunk")
+            with part.open("rb") as f:
+                shutil.copyfileobj(f, out)
+    conn.close()
+    return path
+
+
+_TOPICS = ["Tactic Guidance", "Optimization Heuristics", "Channel Notes", "Audience Insights", "Budget Playbook"]
+
+_SENTENCES = [
+    "{area} campaigns respond well to {tactic} when the message is tied to new clinical evidence.",
+    "{tactic} tends to have {level} conversion efficiency for {area} compared with other channels.",
+    "Shift spend toward tactics with higher ROI and stable conversion rates across quarters.",
+    "For {area}, {tactic} performs {level} during guideline updates and congress season.",
+    "Monitor click-through rate on {tactic} weekly; a sustained drop usually precedes lower ROI.",
+    "Pair {tactic} with follow-up email to lift conversion rates among {area} specialists.",
+    "Quarter over quarter volatility in {tactic} results suggests testing smaller budget increments.",
+    "{area} audiences engage with long-form content, so {tactic} should link to deeper material.",
+]
+
+_LEVELS = ["strong", "moderate", "weak", "above average", "below average"]
+
+
+def kb_documents(n_docs: int, seed: int = 0, n_brand_areas: int = 3, n_tactics: int = 5) -> List[dict]:
+    """n_docs synthetic knowledge base documents (doc_id, title, text) of 3–8 sentences each."""
+    rng = np.random.default_rng(seed)
+    areas = brand_areas(n_brand_areas)
+    tactic_names = [t.replace("_", " ") for t in tactics(n_tactics)]
+
+    docs = []
+    for i in range(n_docs):
+        area = areas[rng.integers(len(areas))]
+        sentences = [
+            _SENTENCES[j].format(area=area, tactic=tactic_names[rng.integers(len(tactic_names))],
+                                 level=_LEVELS[rng.integers(len(_LEVELS))])
+            for j in rng.integers(0, len(_SENTENCES), rng.integers(3, 9))
+        ]
+        docs.append({
+            "doc_id": f"kb_{i + 1:06d}",
+            "title": f"{_TOPICS[rng.integers(len(_TOPICS))]} for {area}",
+            "text": " ".join(sentences),
+        })
+    return docs
+
+
+def write_kb(path, n_docs: int, seed: int = 0, **doc_kwargs) -> Path:
+    """Write n_docs synthetic documents to a JSONL file at `path`."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as f:
+        for doc in kb_documents(n_docs, seed=seed, **doc_kwargs):
+            f.write(json.dumps(doc) + "\n")
+    return path
@@ -0,0 +1,321 @@
+"""
+Microbenchmarks for the analysis tools in agent_system/utils/tools.py.
+
+Every tool is invoked through its @tool wrapper (as the agent calls it) on
+synthetic data of increasing size and group cardinality, with each kind of
+`data` argument it accepts:
+
+- records: a list of dicts, converted to a DataFrame by the tool
+- handle:  a dataset handle resolved server-side
+- table:   a table name, computed inside DuckDB by the sql_tools version
+
+For each case it reports the median/min time per call and, from one extra
+call under tracemalloc, the peak Python heap allocation, also as a
+multiple of the input DataFrame's size ("copies"), which shows tools that
+copy their input. The peak stands in for allocation counts: it measures
+how much a call copies, which a count of allocations wouldn't. Results can
+be saved as a JSON baseline; run against a baseline, it exits with status
+1 if any case got slower (or allocates more) beyond the thresholds. The
+gate refuses a baseline recorded on a different machine, CPU count or
+Python version (--allow-meta-mismatch overrides), raises the repeat count
+and timing floor, and re-measures a case that looks regressed before
+counting it, so that noise alone doesn't fail it.
+
+Run from src/:
+
+    python -m benchmarks.tools --save-baseline benchmarks/tool_baseline.json
+    python -m benchmarks.tools --baseline benchmarks/tool_baseline.json --threshold 0.25
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+from pathlib import Path
+
+os.environ.setdefault("GEMINI_API_KEY", "offline-benchmark")
+
+from benchmarks.synthetic import campaign_frame, write_campaigns
+from agent_system.clients.duckdb_client import DuckDBClient
+from agent_system.state.datasets import datasets
+from agent_system.utils import sql_tools
+from agent_system.utils import tools
+from agent_system.utils.metrics import metric_cache
+
+KINDS = ("records", "handle", "table")
+
+# environment recorded with a baseline; results are only comparable when these match
+META_KEYS = ("python", "machine", "processor", "cpus")
+# minimum repeats and timed seconds per case when saving or gating against a baseline
+GATE_MIN_REPEATS = 15
+GATE_MIN_TIME = 0.5
+
+
+def tool_cases(first_id: int):
+    """Tool name -> arguments (besides `data`) for synthetic data from benchmarks.synthetic."""
+    return {
+        "calculate_roi": {"campaign_id": first_id},
+        "calculate_ctr": {},
+        "calculate_conversion_rate": {},
+        "filter_data": {"brand_area": "Cardiology", "quarter": "2025Q2"},
+        "summarize_performance": {"group_by": ["brand_area", "tactic"]},
+        "compare_tactic_performance": {"brand_areas": ["Cardiology", "Oncology"], "quarter": "2025Q2"},
+        "calculate_metric_by_tactic": {"brand_area": "Cardiology", "quarter": "2025Q2", "metric": "roi"},
+        "calculate_roi_stability": {"brand_area": "Endocrinology", "start_quarter": "2025Q1", "end_quarter": "2025Q2"},
+        "get_top_stable_tactics": {"brand_area": "Endocrinology", "start_quarter": "2025Q1", "end_quarter": "2025Q2", "top_n": 2},
+    }
+
+
+def parse_cardinality(text: str):
+    """"3x3x5" -> (brand areas, quarters, tactics)."""
+    areas, quarters, tactic_count = (int(part) for part in text.lower().split("x"))
+    # the cases filter on the first three brand areas and the first two quarters
+    if areas < 3 or quarters < 2:
+        raise ValueError(f"Cardinality {text!r} needs at least 3 brand areas and 2 quarters")
+    return areas, quarters, tactic_count
+
+
+def _release_results(result):
+    """Drop datasets a tool registered for a large row-level result."""
+    for entry in result:
+        if isinstance(entry, dict) and "dataset" in entry:
+            datasets.release(entry["dataset"])
+
+
+def _call(tool, arguments):
+    result = tool.invoke(arguments)
+    _release_results(result)
+    return result
+
+
+def measure(tool, arguments, min_time: float, min_repeats: int, max_repeats: int) -> dict:
+    """Time repeated calls (derived metrics recomputed every time) and profile one more under tracemalloc."""
+    _call(tool, arguments)  # warm-up
+
+    times = []
+    total = 0.0
+    while len(times) < max_repeats and (len(times) < min_repeats or total < min_time):
+        # measure the full cost, not a metric cache hit from the previous call
+        metric_cache.clear()
+        start = time.perf_counter()
+        _call(tool, arguments)
+        elapsed = time.perf_counter() - start
+        times.append(elapsed)
+        total += elapsed
+
+    metric_cache.clear()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    _call(tool, arguments)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "median_s": statistics.median(times),
+        "min_s": min(times),
+        "repeats": len(times),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def run(args, baseline=None) -> dict:
+    """
+    Benchmark every selected case. With a `baseline`, a case that looks
+    regressed is measured again (up to --confirm times) and keeps its best
+    run, so a one-off slow stretch on a noisy machine doesn't fail the gate.
+    """
+    before_results = baseline["results"] if baseline else {}
+    selected = args.tools.split(",") if args.tools else None
+    kinds = args.kinds.split(",")
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for cardinality in args.cardinalities.split(","):
+            areas, quarter_count, tactic_count = parse_cardinality(cardinality)
+            for rows in (int(size) for size in args.sizes.split(",")):
+                frame_kwargs = dict(n_brand_areas=areas, n_quarters=quarter_count, n_tactics=tactic_count)
+                df = campaign_frame(rows, seed=args.seed, **frame_kwargs)
+                input_kb = df.memory_usage(deep=True).sum() / 1024
+                cases = tool_cases(int(df["campaign_id"].iloc[0]))
+
+                inputs = {}
+                if "records" in kinds and rows <= args.max_record_rows:
+                    inputs["records"] = df.to_dict(orient="records")
+                if "handle" in kinds:
+                    inputs["handle"] = datasets.register(df)
+                if "table" in kinds:
+                    # the client names the table after the file: campaign_performance
+                    csv_path = write_campaigns(Path(tmp) / f"{cardinality}_{rows}" / "campaign_performance.csv",
+                                               rows, seed=args.seed, **frame_kwargs)
+                    client = DuckDBClient(csv_path=csv_path, result_cache_bytes=0, auto_refresh=False)
+                    sql_tools.set_client(client)
+                    inputs["table"] = client.table_name
+
+                for name, arguments in cases.items():
+                    if selected and name not in selected:
+                        continue
+                    tool = getattr(tools, name)
+                    for kind, data in inputs.items():
+                        key = f"{name}[{kind},rows={rows},card={cardinality}]"
+                        stats = measure(tool, {"data": data, **arguments}, args.min_time, args.min_repeats, args.max_repeats)
+                        before = before_results.get(key)
+                        for _ in range(args.confirm if before else 0):
+                            if not case_regressions(stats, before, args.threshold, args.memory_threshold, args.min_delta_ms):
+                                break
+                            retry = measure(tool, {"data": data, **arguments}, args.min_time, args.min_repeats, args.max_repeats)
+                            stats = {
+                                "median_s": min(stats["median_s"], retry["median_s"]),
+                                "min_s": min(stats["min_s"], retry["min_s"]),
+                                "repeats": stats["repeats"] + retry["repeats"],
+                                "peak_kb": min(stats["peak_kb"], retry["peak_kb"]),
+                            }
+                        stats["copies"] = round(stats["peak_kb"] / input_kb, 2) if input_kb else None
+                        results[key] = stats
+                        print(f"{name:<28}{kind:<9}{rows:>10}{cardinality:>10}"
+                              f"{stats['median_s'] * 1000:>12.3f}{stats['min_s'] * 1000:>12.3f}"
+                              f"{stats['peak_kb']:>12.1f}{stats['copies'] or 0:>8.2f}", flush=True)
+
+                if "handle" in inputs:
+                    datasets.release(inputs["handle"])
+                if "table" in inputs:
+                    client.close()
+
+    return {
+        "meta": {
+            **environment(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "sizes": args.sizes,
+            "cardinalities": args.cardinalities,
+        },
+        "results": results,
+    }
+
+
+def environment() -> dict:
+    """The META_KEYS of this machine and interpreter."""
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def meta_mismatches(current: dict, baseline: dict):
+    """META_KEYS whose values differ between two runs, as (key, baseline value, current value)."""
+    return [
+        (key, baseline["meta"].get(key), current["meta"].get(key))
+        for key in META_KEYS if baseline.get("meta", {}).get(key) != current["meta"].get(key)
+    ]
+
+
+def case_regressions(now: dict, before: dict, threshold: float, memory_threshold: float, min_delta_ms: float):
+    """
+    How one case regressed against its baseline entry, if at all.
+
+    A case regresses if its best time grew by more than `threshold` (a
+    fraction, e.g. 0.25) and by at least `min_delta_ms`, or its peak
+    allocation by more than `memory_threshold`. The best time, not the
+    median, is compared: background load only ever adds to a timing.
+
+    Returns:
+        List of descriptions (empty if the case didn't regress).
+    """
+    regressions = []
+    slower = now["min_s"] / before["min_s"] - 1 if before["min_s"] else 0.0
+    if slower > threshold and (now["min_s"] - before["min_s"]) * 1000 >= min_delta_ms:
+        regressions.append(f"best {before['min_s'] * 1000:.3f} ms -> {now['min_s'] * 1000:.3f} ms (+{slower:.0%})")
+    if before.get("peak_kb") and now["peak_kb"] / before["peak_kb"] - 1 > memory_threshold:
+        regressions.append(f"peak {before['peak_kb']:.0f} KB -> {now['peak_kb']:.0f} KB")
+    return regressions
+
+
+def compare(current: dict, baseline: dict, threshold: float, memory_threshold: float, min_delta_ms: float):
+    """
+    Cases that regressed against the baseline (see case_regressions).
+
+    Returns:
+        List of (case, description) tuples.
+    """
+    regressions = []
+    for key, now in current["results"].items():
+        before = baseline["results"].get(key)
+        if before is None:
+            continue
+        for description in case_regressions(now, before, threshold, memory_threshold, min_delta_ms):
+            regressions.append((key, description))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmarks and regression gate for the analysis tools.")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma-separated row counts")
+    parser.add_argument("--cardinalities", default="3x3x5,30x8x20",
+                        help="comma-separated brand areas x quarters x tactics")
+    parser.add_argument("--kinds", default=",".join(KINDS), help=f"comma-separated subset of {', '.join(KINDS)}")
+    parser.add_argument("--tools", help="comma-separated tool names (default: all nine)")
+    parser.add_argument("--max-record-rows", type=int, default=10_000,
+                        help="largest size benchmarked with list-of-dicts input")
+    parser.add_argument("--min-time", type=float, default=0.2,
+                        help=f"seconds of timed calls per case, at least ({GATE_MIN_TIME} with a baseline)")
+    parser.add_argument("--min-repeats", type=int, default=3,
+                        help=f"timed calls per case, at least ({GATE_MIN_REPEATS} with a baseline)")
+    parser.add_argument("--max-repeats", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this JSON baseline; exit 1 on regression")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown as a fraction of the baseline")
+    parser.add_argument("--memory-threshold", type=float, default=0.5,
+                        help="allowed growth of peak allocation as a fraction of the baseline")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5,
+                        help="slowdowns smaller than this are never counted as regressions")
+    parser.add_argument("--confirm", type=int, default=3,
+                        help="with a baseline, re-measure a case that looks regressed up to this many times")
+    parser.add_argument("--allow-meta-mismatch", action="store_true",
+                        help="compare against a baseline recorded on a different machine or Python")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    baseline = None
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        # checked before the (long) run
+        mismatches = meta_mismatches({"meta": environment()}, baseline)
+        if mismatches:
+            print(f"Baseline {args.baseline} was recorded in a different environment:")
+            for key, before, now in mismatches:
+                print(f"   {key}: {before!r} (baseline) vs {now!r} (now)")
+            if not args.allow_meta_mismatch:
+                print("Refusing to compare; record a new baseline here or pass --allow-meta-mismatch.")
+                return 2
+    if args.baseline or args.save_baseline:
+        # a handful of repeats is too noisy to gate on
+        args.min_repeats = max(args.min_repeats, GATE_MIN_REPEATS)
+        args.max_repeats = max(args.max_repeats, args.min_repeats)
+        args.min_time = max(args.min_time, GATE_MIN_TIME)
+    print(f"{'tool':<28}{'data':<9}{'rows':>10}{'card':>10}{'median ms':>12}{'min ms':>12}{'peak KB':>12}{'copies':>8}")
+    current = run(args, baseline)
+
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps(current, indent=2))
+        print(f"\nWrote baseline {args.save_baseline}")
+
+    if args.baseline:
+        regressions = compare(current, baseline, args.threshold, args.memory_threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.baseline}:")
+            for key, description in regressions:
+                print(f"   {key}: {description}")
+            return 1
+        print(f"\nNo regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
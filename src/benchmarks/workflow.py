@@ -0,0 +1,204 @@
+"""
+End-to-end workflow benchmark, fully offline.
+
+Generates synthetic campaign data and knowledge base documents, points the
+agents at them and at a local fake LLM (benchmarks/fake_llm.py), runs a batch
+of queries through the real compiled graph, and reports setup times,
+throughput, per-stage latency (from the tracing spans) and peak memory.
+
+Run from src/:
+
+    python -m benchmarks.workflow --rows 1000000 --kb-docs 100000 --queries 40 --llm-latency 0.2
+    python -m benchmarks.workflow --rows 10000 --json results.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+# the agent modules build their (unused) Gemini clients at import time
+os.environ.setdefault("GEMINI_API_KEY", "offline-benchmark")
+
+from benchmarks.fake_llm import FakeLLM
+from benchmarks.synthetic import write_campaigns, write_kb
+
+SAMPLE_QUERIES = [
+    "Compare tactic performance for Cardiology vs Oncology in 2025Q2 and recommend where to shift 20% of Cardiology spend.",
+    "For Endocrinology in 2025Q1–Q2, which two tactics have the highest ROI stability? Suggest next best action.",
+    "If we need quick wins next quarter, should we emphasize Webinars or Email for Oncology? Provide rationale using retrieved KB.",
+    "Which tactics had the best conversion rate for Cardiology in 2025Q1?",
+    "Summarize CTR by tactic for Endocrinology in 2025Q3.",
+]
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def setup(args, workdir: Path) -> dict:
+    """Generate the data and install clients over it and the fake LLM in the agents."""
+    from agent_system.clients.duckdb_client import DuckDBClient
+    from agent_system.clients.retrieval import create_backend
+    from agent_system.clients.sql_cache import SQLCache
+    from agent_system.agents.sql_retriever import sqlRetriever
+    from agent_system.agents.kb_retriever import kbRetriever
+    from agent_system.agents.analyzer import Analyzer
+    from agent_system.workflow import reset_workflow
+
+    timings = {}
+    csv_path, timings["generate_csv_s"] = _timed(
+        write_campaigns, workdir / "campaign_performance.csv", args.rows, seed=args.seed,
+        n_brand_areas=args.brand_areas, n_quarters=args.quarters, n_tactics=args.tactics
+    )
+    kb_path, timings["generate_kb_s"] = _timed(write_kb, workdir / "kb_documents.jsonl", args.kb_docs, seed=args.seed)
+
+    client, timings["duckdb_load_s"] = _timed(
+        DuckDBClient, db_path=":memory:", csv_path=csv_path, load_mode=args.load_mode,
+        result_cache_bytes=args.result_cache_mb * 1024 * 1024
+    )
+    kb, timings["kb_index_s"] = _timed(
+        create_backend, args.kb_backend, file_path=kb_path, index_dir=workdir / "kb_index",
+        chunk_sentences=args.chunk_sentences or None
+    )
+
+    llm = FakeLLM(latency=args.llm_latency, chunk_latency=args.chunk_latency)
+    sqlRetriever.duckdb_client = client
+    sqlRetriever.llm = llm
+    # fresh translation cache, so every run starts cold
+    sqlRetriever.sql_cache = SQLCache(":memory:")
+    sqlRetriever.use_templates = not args.no_templates
+    kbRetriever.kb_client = kb
+    Analyzer.set_llm(llm)
+    Analyzer.analysis_mode = args.analysis_mode
+    # the next get_workflow() builds the graph around the clients installed above
+    reset_workflow()
+    return timings
+
+
+def run(args, queries):
+    """Run the batch through the shared workflow the way main.py does."""
+    import main
+
+    if args.mode == "async":
+        return asyncio.run(main.arun_queries(queries, max_concurrency=args.concurrency, prefetch=not args.no_prefetch))
+    return main.run_queries(queries, max_concurrency=args.concurrency, prefetch=not args.no_prefetch)
+
+
+def benchmark(args) -> dict:
+    from agent_system.utils.print import configure_logging
+    from agent_system.utils.tracing import tracer
+    from agent_system.workflow import warm_up
+
+    # console output would dominate the timings
+    configure_logging("quiet")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(args.workdir) if args.workdir else Path(tmp)
+        timings = setup(args, workdir)
+        _, timings["warm_up_s"] = _timed(warm_up)
+
+        queries = [SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)] for i in range(args.queries)]
+
+        # spans kept in memory only; their histograms give the per-stage latencies
+        tracer.enable(path=None)
+        tracer.histograms.clear()
+        if args.tracemalloc:
+            tracemalloc.start()
+        results, elapsed = _timed(run, args, queries)
+        traced_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+        if args.tracemalloc:
+            tracemalloc.stop()
+        tracer.disable()
+
+    from agent_system.agents.sql_retriever import sqlRetriever
+
+    failures = [r for r in results if isinstance(r, Exception) or (isinstance(r, dict) and r.get("error"))]
+    stages = {
+        name[:-len(".wall_ms")]: {key: round(value, 3) for key, value in stats.items()}
+        for name, stats in tracer.summary().items() if name.endswith(".wall_ms")
+    }
+    return {
+        "config": vars(args),
+        "setup": {key: round(value, 4) for key, value in timings.items()},
+        "queries": len(queries),
+        "failures": len(failures),
+        "elapsed_s": round(elapsed, 4),
+        "throughput_qps": round(len(queries) / elapsed, 3) if elapsed else None,
+        "stages_ms": stages,
+        "duckdb_cache": sqlRetriever.duckdb_client.cache_info(),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "tracemalloc_peak_mb": round(traced_peak / 2**20, 1) if traced_peak is not None else None,
+    }
+
+
+def format_report(result: dict) -> str:
+    lines = [
+        f"rows={result['config']['rows']:,}  kb_docs={result['config']['kb_docs']:,}  "
+        f"queries={result['queries']}  concurrency={result['config']['concurrency']}  mode={result['config']['mode']}",
+        "",
+        "setup: " + "  ".join(f"{key}={value:.3f}" for key, value in result["setup"].items()),
+        f"elapsed: {result['elapsed_s']:.3f}s  throughput: {result['throughput_qps']} queries/s  failures: {result['failures']}",
+        f"peak RSS: {result['peak_rss_mb']} MB"
+        + (f"  tracemalloc peak: {result['tracemalloc_peak_mb']} MB" if result["tracemalloc_peak_mb"] is not None else ""),
+        "",
+        f"{'stage':<28}{'count':>7}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}",
+    ]
+    stages = sorted(result["stages_ms"].items(), key=lambda item: -item[1].get("p95", 0))
+    for name, stats in stages:
+        if stats.get("count"):
+            lines.append(f"{name:<28}{stats['count']:>7}{stats['p50']:>11.1f}{stats['p95']:>11.1f}{stats['p99']:>11.1f}")
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end workflow benchmark.")
+    parser.add_argument("--rows", type=int, default=100_000, help="campaign_performance rows (10^4 to 10^7)")
+    parser.add_argument("--kb-docs", type=int, default=10_000, help="knowledge base documents (up to 10^5)")
+    parser.add_argument("--brand-areas", type=int, default=3)
+    parser.add_argument("--quarters", type=int, default=3)
+    parser.add_argument("--tactics", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync")
+    parser.add_argument("--analysis-mode", choices=["prompt", "agent"], default="prompt")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="simulated seconds per LLM call")
+    parser.add_argument("--chunk-latency", type=float, default=0.0, help="simulated seconds between streamed chunks")
+    parser.add_argument("--load-mode", choices=["view", "table", "parquet"], default="table")
+    parser.add_argument("--result-cache-mb", type=int, default=64, help="DuckDB result cache size (0 disables it)")
+    parser.add_argument("--kb-backend", choices=["tfidf", "dense", "hybrid"], default="tfidf")
+    parser.add_argument("--chunk-sentences", type=int, default=3)
+    parser.add_argument("--no-templates", action="store_true", help="always wait for the LLM's SQL")
+    parser.add_argument("--no-prefetch", action="store_true", help="search the KB per query instead of up front")
+    parser.add_argument("--tracemalloc", action="store_true", help="also report the Python heap peak (slower)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="keep the generated files here instead of a temporary directory")
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = benchmark(args)
+    print(format_report(result))
+    if args.json:
+        Path(args.json).write_text(json.dumps(result, indent=2, default=str))
+        print(f"\nWrote {args.json}")
+    return result
+
+
+if __name__ == "__main__":
+    main()
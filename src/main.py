@@ -1,52 +1,194 @@
-from langgraph.graph import StateGraph, END
-
+import os
+import asyncio
+from contextlib import nullcontext
 from pathlib import Path
 
-from agent_system.state.state import State
-from agent_system.agents.orchestrator import Orchestrator
-from agent_system.agents.sql_retriever import sqlRetriever
+from agent_system.workflow import get_workflow, warm_up
 from agent_system.agents.kb_retriever import kbRetriever
-from agent_system.agents.analyzer import Analyzer
-from agent_system.utils.print import append_to_file
+from agent_system.utils.print import append_to_file, ReportWriter, REPORT_SEPARATOR, flush_logging, quiet_logging
+from agent_system.utils.tracing import tracer
+
+# how many queries run_sample_queries keeps in flight at once (1 = strictly sequential)
+DEFAULT_BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
 
+def run_query(query: str):
+    """Run a query through the shared compiled workflow."""
+    app = get_workflow()
+    
+    # with TRACE=1, the node/LLM/DuckDB/KB spans of the run are grouped under this one
+    with tracer.span("query"):
+        result = app.invoke({
+            "query": query,
+            "messages": []
+        })
+    
+    return result
 
-def create_workflow():
-    """Create and compile the LangGraph workflow."""
+def build_inputs(queries, prefetch: bool = True):
+    """
+    Initial states for a batch of queries. With `prefetch`, every query's
+    knowledge base lookup is resolved up front in one batched search and
+    merged into its state, so the KB retriever has nothing left to compute
+    while the LLM stages run.
+    """
+    inputs = [{"query": query, "messages": []} for query in queries]
+    
+    if prefetch and inputs:
+        for state, kb_results in zip(inputs, kbRetriever().prefetch(queries)):
+            state.update(kb_results)
     
-    orchestrator = Orchestrator()
-    sql_retriever = sqlRetriever()
-    kb_retriever = kbRetriever()
-    analyzer = Analyzer()
+    return inputs
+
+def run_queries(queries, max_concurrency: int = DEFAULT_BATCH_CONCURRENCY, prefetch: bool = True):
+    """
+    Run several queries through the shared workflow concurrently.
+
+    Parameters:
+    - queries: List of natural language queries
+    - max_concurrency: Maximum number of queries in flight at once
+    - prefetch: Resolve all knowledge base lookups in one batch before the queries start
+
+    Returns:
+    - One entry per query, in the same order as `queries`: the final state
+      on success, or the exception that query raised (a failing query does
+      not affect the others).
+    """
+    app = get_workflow()
     
-    workflow = StateGraph(State)
+    inputs = build_inputs(queries, prefetch=prefetch)
     
-    workflow.add_node("orchestrator", orchestrator.process)
-    workflow.add_node("sqlRetriever", sql_retriever.process)
-    workflow.add_node("kbRetriever", kb_retriever.process)
-    workflow.add_node("analyzer", analyzer.process)
+    return app.batch(
+        inputs,
+        config={"max_concurrency": max(1, max_concurrency)},
+        return_exceptions=True
+    )
+
+async def arun_query(query: str):
+    """Run a query through the shared compiled workflow on the current event loop."""
+    app = get_workflow()
     
-    workflow.set_entry_point("orchestrator")
+    with tracer.span("query"):
+        return await app.ainvoke({
+            "query": query,
+            "messages": []
+        })
+
+def _events(mode, chunk):
+    """Translate one item of the graph's ["updates", "custom"] stream into events."""
+    if mode == "custom":
+        if "token" in chunk:
+            yield "token", chunk["token"]
+    else:
+        for node_name, update in chunk.items():
+            yield "node", (node_name, update)
+
+def stream_query(query: str):
+    """
+    Run a query, yielding events as they happen:
+    - ("node", (node_name, update)) when a node finishes
+    - ("token", text) for each piece of the analysis as the LLM generates it
+    """
+    app = get_workflow()
     
-    workflow.add_edge("orchestrator", "sqlRetriever")
-    workflow.add_edge("orchestrator", "kbRetriever")
+    with tracer.span("query"):
+        for mode, chunk in app.stream({"query": query, "messages": []}, stream_mode=["updates", "custom"]):
+            yield from _events(mode, chunk)
+
+async def astream_query(query: str):
+    """Async version of stream_query, yielding the same events."""
+    app = get_workflow()
     
-    workflow.add_edge("sqlRetriever", "analyzer")
-    workflow.add_edge("kbRetriever", "analyzer")
+    async for mode, chunk in app.astream({"query": query, "messages": []}, stream_mode=["updates", "custom"]):
+        for event in _events(mode, chunk):
+            yield event
+
+async def astream_queries(queries, max_concurrency: int = DEFAULT_BATCH_CONCURRENCY, prefetch: bool = True):
+    """
+    Run several queries concurrently (like arun_queries), yielding the events
+    of all of them as they happen, tagged with the query's index:
+    - (i, "node", (node_name, update)) and (i, "token", text), as in stream_query
+    - (i, "done", None) when query i finishes, or (i, "error", exception)
+    """
+    app = get_workflow()
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    inputs = await asyncio.to_thread(build_inputs, queries, prefetch)
+    events = asyncio.Queue()
     
-    workflow.add_edge("analyzer", END)
+    async def run_one(i, state):
+        async with semaphore:
+            try:
+                with tracer.span("query"):
+                    async for mode, chunk in app.astream(state, stream_mode=["updates", "custom"]):
+                        for event, data in _events(mode, chunk):
+                            await events.put((i, event, data))
+                await events.put((i, "done", None))
+            except Exception as e:
+                await events.put((i, "error", e))
     
-    return workflow.compile()
+    tasks = [asyncio.create_task(run_one(i, state)) for i, state in enumerate(inputs)]
+    remaining = len(tasks)
+    try:
+        while remaining:
+            i, event, data = await events.get()
+            if event in ("done", "error"):
+                remaining -= 1
+            yield i, event, data
+    finally:
+        for task in tasks:
+            task.cancel()
 
-def run_query(query: str):
-    """Run a query through the workflow."""
-    app = create_workflow()
+class OrderedOutput:
+    """
+    Console (and report) output written through write() for queries
+    streaming concurrently, kept in query order: the earliest unfinished
+    query streams live, later ones are buffered until every query before
+    them has finished. The agents' own log output isn't routed through here;
+    run_sample_queries silences it below WARNING while queries overlap.
+    """
     
-    result = app.invoke({
-        "query": query,
-        "messages": []
-    })
+    def __init__(self, n_queries: int, report: ReportWriter = None):
+        self.report = report
+        self.buffers = [[] for _ in range(n_queries)]
+        self.finished = [False] * n_queries
+        self.head = 0
     
-    return result
+    def _emit(self, console, report_text):
+        if console:
+            print(console, end="", flush=True)
+        if report_text and self.report:
+            self.report.write(report_text)
+    
+    def write(self, i: int, console: str = "", report: str = ""):
+        if i == self.head:
+            self._emit(console, report)
+        else:
+            self.buffers[i].append((console, report))
+    
+    def finish(self, i: int):
+        self.finished[i] = True
+        while self.head < len(self.finished) and self.finished[self.head]:
+            self.head += 1
+            if self.head < len(self.buffers):
+                for console, report in self.buffers[self.head]:
+                    self._emit(console, report)
+                self.buffers[self.head] = []
+
+async def arun_queries(queries, max_concurrency: int = DEFAULT_BATCH_CONCURRENCY, prefetch: bool = True):
+    """
+    Async counterpart of run_queries: runs every query on one event loop,
+    at most `max_concurrency` at a time, and returns results (or exceptions)
+    in input order.
+    """
+    app = get_workflow()
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    inputs = await asyncio.to_thread(build_inputs, queries, prefetch)
+    
+    async def run_one(state):
+        async with semaphore:
+            with tracer.span("query"):
+                return await app.ainvoke(state)
+    
+    return await asyncio.gather(*(run_one(state) for state in inputs), return_exceptions=True)
 
 def load_sample_queries():
     """Load queries from the sample_queries.txt file."""
@@ -70,49 +212,74 @@ def load_sample_queries():
     
     return queries
 
-def run_sample_queries():
-    """Run all sample queries in succession."""
+async def _stream_sample_queries(queries, max_concurrency, output: OrderedOutput):
+    """Run the queries, writing each one's progress and streamed analysis to `output`."""
+    n = len(queries)
+    analysis_started = [False] * n
+    
+    for i, query in enumerate(queries):
+        output.write(i, console=f"\nQuery {i + 1}/{n}: {query[:50]}{'...' if len(query) > 50 else ''}\n{'-' * 60}\n")
+    
+    async for i, event, data in astream_queries(queries, max_concurrency=max_concurrency):
+        if event == "node":
+            # the analyzer finishes once its tokens have all been streamed
+            if not analysis_started[i]:
+                output.write(i, console=f"   ✓ {data[0]}\n")
+        elif event == "token":
+            if not analysis_started[i]:
+                analysis_started[i] = True
+                output.write(i, console=f"\nAnalysis {i + 1}:\n{'-' * 40}\n", report=f"Query {i + 1}: {queries[i]}\nAnalysis: ")
+            output.write(i, console=data, report=data)
+        else:
+            if event == "error":
+                output.write(i, console=f"\nError processing query {i + 1}: {str(data)}\n",
+                             report=f"Query {i + 1}: {queries[i]}\nError: {str(data)}\n")
+            elif analysis_started[i]:
+                output.write(i, console=f"\n{'-' * 40}\n", report="\n")
+            else:
+                output.write(i, console=f"\nNo analysis result for query {i + 1}.\n",
+                             report=f"Query {i + 1}: {queries[i]}\nAnalysis: No result\n")
+            if output.report:
+                output.write(i, report=REPORT_SEPARATOR)
+            output.finish(i)
+
+def run_sample_queries(max_concurrency: int = DEFAULT_BATCH_CONCURRENCY, save: bool = None):
+    """
+    Run all sample queries, up to `max_concurrency` at a time, streaming each
+    analysis to the console (and, if saving, to the report file) as it is
+    generated, in query order.
+    """
     queries = load_sample_queries()
     
     if not queries:
         print("No sample queries found.")
         return
     
-    print(f"\nRunning {len(queries)} sample queries...")
-    print("=" * 60)
-    
-    all_results = []
+    if save is None:
+        flush_logging()
+        # asked up front so the report can be written while the analyses stream in
+        save = input(f"\n💾 Save all {len(queries)} results to report file? (y/n): ").strip().lower() in ['y', 'yes']
     
-    for i, query in enumerate(queries, 1):
-        print(f"\nQuery {i}/{len(queries)}: {query[:50]}{'...' if len(query) > 50 else ''}")
-        print("-" * 60)
-        
-        try:
-            result = run_query(query)
-            analysis = result.get("analysis", "")
-            
-            if analysis:
-                print(f"\nAnalysis {i}:")
-                print("-" * 40)
-                print(analysis)
-                print("-" * 40)
-                all_results.append(f"Query {i}: {query}\nAnalysis: {analysis}\n")
-            else:
-                print(f"\nNo analysis result for query {i}.")
-                all_results.append(f"Query {i}: {query}\nAnalysis: No result\n")
-                
-        except Exception as e:
-            print(f"\nError processing query {i}: {str(e)}")
-            all_results.append(f"Query {i}: {query}\nError: {str(e)}\n")
+    print(f"\nRunning {len(queries)} sample queries ({max_concurrency} at a time)...")
+    print("=" * 60)
     
-    save_all = input(f"\n💾 Save all {len(queries)} results to report file? (y/n): ").strip().lower()
-    if save_all in ['y', 'yes']:
-        path_to_report = "./report.md"
-        for result in all_results:
-            append_to_file(path_to_report, result)
-        print(f"Saved all results to {path_to_report}")
+    path_to_report = "./report.md"
+    report = ReportWriter(path_to_report) if save else None
+    # agent logs of overlapping queries would interleave with each other and the ordered output
+    logging_scope = quiet_logging() if max_concurrency > 1 and len(queries) > 1 else nullcontext()
+    try:
+        with logging_scope:
+            asyncio.run(_stream_sample_queries(queries, max_concurrency, OrderedOutput(len(queries), report)))
+    finally:
+        if report:
+            report.close()
+            print(f"\nSaved all results to {path_to_report}")
     
+    flush_logging()
     print(f"\nCompleted {len(queries)} sample queries!")
+    
+    if tracer.enabled:
+        print(f"\nLatency by span:\n{tracer.format_summary()}")
 
 def main():
     """Simple REPL for running queries through the workflow."""
@@ -123,11 +290,17 @@ def main():
     print("Type 'sample' or 'run-sample' to run all sample queries.")
     print("=" * 50)
     
+    warm_up()
+    
     while True:
         try:
+            # with LOG_ASYNC=1 agent output is written by a background thread; let it catch up before prompting
+            flush_logging()
             query = input("\n📊 Enter query here! (or 'q' to quit): ").strip()
             
             if query.lower() in ['quit', 'exit', 'q', '']:
+                if tracer.enabled:
+                    print(f"\nLatency by span:\n{tracer.format_summary()}")
                 print("Goodbye!")
                 break
             
@@ -137,17 +310,26 @@ def main():
             
             print("\nProcessing query...")
             
-            result = run_query(query)
+            # print the analysis as it is generated rather than once the whole run is done
+            parts = []
+            for event, data in stream_query(query):
+                if event == "node" and not parts:
+                    print(f"   ✓ {data[0]}")
+                elif event == "token":
+                    if not parts:
+                        print("\nAnalysis:")
+                        print("-" * 40)
+                    print(data, end="", flush=True)
+                    parts.append(data)
             
-            analysis = result.get("analysis", "")
+            analysis = "".join(parts)
             if analysis:
-                print("\nAnalysis:")
-                print("-" * 40)
-                print(analysis)
+                print()
                 print("-" * 40)
             else:
                 print("\nNo analysis result found.")
             
+            flush_logging()
             save_to_file = input("\n💾 Save to report file? (y/n): ").strip().lower()
             if save_to_file in ['y', 'yes']:
                 path_to_report = "./report.md"
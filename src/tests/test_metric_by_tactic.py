@@ -0,0 +1,34 @@
+import pytest
+
+from agent_system.clients.duckdb_client import DuckDBClient
+from agent_system.utils import sql_tools, tools
+from benchmarks.synthetic import campaign_frame, write_campaigns
+
+
+@pytest.fixture
+def table(tmp_path):
+    client = DuckDBClient(csv_path=write_campaigns(tmp_path / "campaign_performance.csv", 200, seed=0),
+                          result_cache_bytes=0, auto_refresh=False)
+    sql_tools.set_client(client)
+    yield client.table_name
+    client.close()
+
+
+@pytest.mark.parametrize("metric", ["foo", "CTR"])
+def test_unknown_metric_returns_no_rows_on_both_backends(table, metric):
+    arguments = {"brand_area": "Cardiology", "quarter": "2025Q1", "metric": metric}
+    rows = campaign_frame(200, seed=0).to_dict(orient="records")
+
+    assert tools.calculate_metric_by_tactic.invoke({"data": rows, **arguments}) == []
+    assert tools.calculate_metric_by_tactic.invoke({"data": table, **arguments}) == []
+
+
+def test_known_metric_matches_between_backends(table):
+    arguments = {"brand_area": "Cardiology", "quarter": "2025Q1", "metric": "ctr"}
+    rows = campaign_frame(200, seed=0).to_dict(orient="records")
+
+    pandas_rows = tools.calculate_metric_by_tactic.invoke({"data": rows, **arguments})
+    sql_rows = tools.calculate_metric_by_tactic.invoke({"data": table, **arguments})
+    assert [row["tactic"] for row in pandas_rows] == [row["tactic"] for row in sql_rows]
+    for expected, actual in zip(pandas_rows, sql_rows):
+        assert actual["mean"] == pytest.approx(expected["mean"])